@@ -0,0 +1,84 @@
+"""Time the reading of a large K2 output (.out) file.
+
+A synthetic output file is generated with --elements element blocks (hillslopes, channels, and a few ponds)
+followed by the Tabular Summary of Element Hydrologic Components. It is read with read_output_file and
+read_output_metrics, and with the line-by-line reference reader of tests/test_import_results.py, which checks the
+results and gives a baseline.
+
+    python benchmarks/benchmark_import_results.py --elements 100000
+    python benchmarks/benchmark_import_results.py --elements 100000 --output watershed_storm.out
+
+With --output, the generated file is kept at that path.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "src")))
+try:
+    import arcpy
+except ImportError:
+    arcpy = mock.MagicMock(name="arcpy")
+    sys.modules["arcpy"] = arcpy
+    for submodule in ["_mp", "management"]:
+        sys.modules[f"arcpy.{submodule}"] = getattr(arcpy, submodule)
+import code_import_results
+# the synthetic output file and the reference reader are shared with the tests
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "tests")))
+from test_import_results import write_synthetic_output_file, read_output_file_line_by_line
+
+
+def time_best(function, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start_time)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, default=100000, help="number of element blocks")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs, the best is reported")
+    parser.add_argument("--output", help="keep the generated output file at this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.output or os.path.join(directory, "synthetic.out")
+        start_time = time.perf_counter()
+        element_ids, element_types = write_synthetic_output_file(path, args.elements)
+        generate_seconds = time.perf_counter() - start_time
+        file_size = os.path.getsize(path)
+
+        timings = {}
+        timings["read_output_file"], (element_columns, tabular_columns) = time_best(
+            lambda: code_import_results.read_output_file(path), args.repeat)
+        timings["read_output_metrics"], df_metric = time_best(
+            lambda: code_import_results.read_output_metrics(path), args.repeat)
+        timings["line-by-line reference"], (df_blocks, df_tabular) = time_best(
+            lambda: read_output_file_line_by_line(path), 1)
+
+    # the results match the generated elements and the reference reader
+    expected_types = pd.Series(element_types).replace("Plane", "Hillslope").to_numpy()
+    if not (np.array_equal(element_columns["Element_ID"], element_ids) and
+            np.array_equal(element_columns["Element_Type"], expected_types) and len(df_metric) == args.elements):
+        raise Exception("The elements read do not match the generated elements.")
+    pd.testing.assert_frame_equal(pd.DataFrame(element_columns), df_blocks, check_dtype=False)
+    pd.testing.assert_frame_equal(pd.DataFrame(tabular_columns), df_tabular, check_dtype=False)
+
+    sys.stdout.write(f"{args.elements} elements, {file_size / 1e6:.1f} MB, generated in {generate_seconds:.2f} s, "
+                     f"best of {args.repeat}\n")
+    for name, seconds in timings.items():
+        sys.stdout.write(f"  {name:<24} {seconds:8.3f} s  {args.elements / seconds:10.0f} elements/s  "
+                         f"{file_size / 1e6 / seconds:7.1f} MB/s\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Compare one K2 process per run with batched runs for many short storms.
+
+One parameter file is combined with --storms precipitation files. The runs are written with
+write_simulation_batches, once with one simulation per run and once with one simulation per worker process,
+and both are executed with run_simulations. K2 is replaced by a stand-in script that pays a start-up cost and a
+cost per run and writes an output file for each line of kin.fil, so the timings show the cost of starting
+processes and staging files rather than of the model. Documenting the runs in the metaSimulation table is
+skipped. The stand-in script needs a POSIX shell to run.
+
+    python benchmarks/benchmark_k2_batches.py --storms 1000 --startup-ms 50 --run-ms 5 --staging Link
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "src")))
+try:
+    import arcpy
+except ImportError:
+    arcpy = mock.MagicMock(name="arcpy")
+    sys.modules["arcpy"] = arcpy
+    sys.modules["arcpy._mp"] = arcpy._mp
+import config
+import code_process_pool
+import code_write_k2_simulation
+import code_execute_k2_simulation
+
+# Stand-in for K2: sleeps for the start-up cost of the executable, then for the cost of each run in kin.fil,
+# writing the output file of the run
+K2_STAND_IN = """#!{python}
+import time
+time.sleep({startup_seconds})
+for line in open("kin.fil"):
+    fields = line.split(",")
+    if len(fields) > 2:
+        time.sleep({run_seconds})
+        open(fields[2].strip(), "w").write("output of " + fields[0])
+print("finished")
+"""
+
+PRECIPITATION_FILE = ("! short storm {number}\n"
+                      "BEGIN RG1\n"
+                      "  X = 0, Y = 0\n"
+                      "  SAT = 0.2\n"
+                      "  N = 3\n"
+                      "  TIME        DEPTH\n"
+                      "! (min)        (mm)\n"
+                      "  0.00         0.00\n"
+                      "  5.00         {half_depth:.2f}\n"
+                      "  10.00        {depth:.2f}\n"
+                      "END\n")
+
+
+def make_inputs(directory, storms, startup_seconds, run_seconds):
+    """Write a parameter file, the precipitation files, and the K2 stand-in. Returns the workspace, the parameter
+    file, the precipitation files, and the models directory."""
+
+    modeling_files_directory = os.path.join(directory, "modeling_files", "discretization")
+    os.makedirs(os.path.join(modeling_files_directory, "parameter_files"))
+    os.makedirs(os.path.join(modeling_files_directory, "precipitation_files"))
+    models_directory = os.path.join(directory, "models")
+    os.makedirs(models_directory)
+
+    parameter_file = os.path.join(modeling_files_directory, "parameter_files", "watershed.par")
+    with open(parameter_file, "w") as f:
+        f.write("BEGIN GLOBAL\n   NELE = 0\nEND GLOBAL\n")
+    precipitation_files = []
+    for number in range(storms):
+        precipitation_file = os.path.join(modeling_files_directory, "precipitation_files", f"storm_{number}.pre")
+        with open(precipitation_file, "w") as f:
+            depth = 5 + number % 50
+            f.write(PRECIPITATION_FILE.format(number=number, depth=depth, half_depth=depth / 2))
+        precipitation_files.append(precipitation_file)
+
+    k2_path = os.path.join(models_directory, "k2.exe")
+    with open(k2_path, "w") as f:
+        f.write(K2_STAND_IN.format(python=sys.executable, startup_seconds=startup_seconds, run_seconds=run_seconds))
+    os.chmod(k2_path, 0o755)
+
+    return os.path.join(directory, "workspace.gdb"), parameter_file, precipitation_files, models_directory
+
+
+def run_benchmark(directory, name, batch_count, inputs):
+    """Write the runs as batch_count simulations and execute them. Returns the write and run times (seconds)."""
+
+    workspace, parameter_file, precipitation_files, models_directory = inputs
+    start_time = time.perf_counter()
+    simulation_directories = code_write_k2_simulation.write_simulation_batches(
+        "project.gdb", workspace, "delineation", "discretization", [parameter_file], precipitation_files, name,
+        "benchmark", None, 1, models_directory, batch_count)
+    write_seconds = time.perf_counter() - start_time
+
+    # the simulations run their staged copy of the stand-in, as they would run their k2.exe
+    start_time = time.perf_counter()
+    results = code_execute_k2_simulation.run_simulations("project.gdb", simulation_directories)
+    run_seconds = time.perf_counter() - start_time
+
+    failed = [result for result in results if result["Status"] != "Completed"]
+    if failed:
+        raise Exception(f"{len(failed)} simulations did not complete, for example {failed[0]}")
+    outputs = sum(len([name for name in os.listdir(simulation_directory) if name.endswith(".out")])
+                  for simulation_directory in simulation_directories)
+    if outputs != len(precipitation_files):
+        raise Exception(f"{outputs} output files were written for {len(precipitation_files)} runs")
+    return write_seconds, run_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--storms", type=int, default=1000, help="number of short storms (runs)")
+    parser.add_argument("--startup-ms", type=float, default=50, help="start-up cost of the K2 stand-in")
+    parser.add_argument("--run-ms", type=float, default=5, help="cost of each run in the K2 stand-in")
+    parser.add_argument("--staging", choices=["Copy", "Link"], default=config.SIMULATION_STAGING,
+                        help="how input files are put into the simulation directories (config.SIMULATION_STAGING)")
+    parser.add_argument("--workers", type=int, default=config.MAX_WORKER_PROCESSES,
+                        help="runs executed at a time (config.MAX_WORKER_PROCESSES, 0 for all cores)")
+    args = parser.parse_args()
+    if os.name == "nt":
+        sys.exit("The K2 stand-in is a script with a shebang line, which needs a POSIX system.")
+
+    with mock.patch.object(config, "SIMULATION_STAGING", args.staging), \
+            mock.patch.object(config, "MAX_WORKER_PROCESSES", args.workers), \
+            mock.patch.object(config, "K2_EXECUTABLE", ""), \
+            mock.patch.object(config, "K2_RESULT_CACHE", False), \
+            mock.patch.object(code_write_k2_simulation, "document_simulation_runs", lambda *args: None), \
+            mock.patch.object(code_execute_k2_simulation, "update_simulation_status", lambda *args: None), \
+            mock.patch.object(code_write_k2_simulation, "tweet", lambda message: None), \
+            mock.patch.object(code_execute_k2_simulation, "tweet", lambda message: None), \
+            tempfile.TemporaryDirectory() as directory:
+        inputs = make_inputs(directory, args.storms, args.startup_ms / 1000, args.run_ms / 1000)
+        worker_count = code_process_pool.get_worker_count(args.storms)
+        timings = {"process per run": run_benchmark(directory, "per_run", args.storms, inputs),
+                   "batched": run_benchmark(directory, "batched", worker_count, inputs)}
+
+    sys.stdout.write(f"{args.storms} storms, stand-in start-up {args.startup_ms:g} ms and {args.run_ms:g} ms per run, "
+                     f"{worker_count} at a time, {args.staging} staging\n")
+    for name, (write_seconds, run_seconds) in timings.items():
+        sys.stdout.write(f"  {name:<16} write {write_seconds:7.2f} s   run {run_seconds:7.2f} s   "
+                         f"{args.storms / (write_seconds + run_seconds):8.1f} runs/s\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Time write_parfile and write_parfiles on a synthetic discretization.
+
+The parameter tables are generated in memory and returned in place of arcpy.da.TableToNumPyArray, so only the
+writing of the parameter file is timed, not the geodatabase reads. The channels form a binary tree numbered like
+an AGWA discretization: channel ID k * 10 + 4 has lateral hillslopes k * 10 + 2 and k * 10 + 3, first-order
+channels have an upland hillslope k * 10 + 1, and the other channels are fed by two contributing channels.
+
+    python benchmarks/benchmark_write_parfile.py --elements 100000 --parameterizations 4
+
+With --profile, the functions that take the most time in write_file are listed as well.
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import argparse
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "src")))
+try:
+    import arcpy
+except ImportError:
+    arcpy = mock.MagicMock(name="arcpy")
+    sys.modules["arcpy"] = arcpy
+    sys.modules["arcpy._mp"] = arcpy._mp
+import code_write_k2_parameter_file
+
+HILLSLOPE_FIELDS = ["Length", "Width", "MeanSlope", "Manning", "CentroidX", "CentroidY", "CV", "Ksat", "G",
+                    "Distribution", "Porosity", "Rock", "Sand", "Silt", "Clay", "Splash", "Cohesion", "SMax",
+                    "Interception", "Canopy", "Pave", "Area"]
+CHANNEL_FIELDS = ["ChannelLength", "MeanSlope", "CentroidX", "CentroidY", "UpstreamBottomWidth",
+                  "DownstreamBottomWidth", "UpstreamBankfullDepth", "DownstreamBankfullDepth", "Manning",
+                  "SideSlope1", "SideSlope2", "CV", "Ksat", "G", "Distribution", "Porosity", "Rock", "Sand", "Silt",
+                  "Clay", "Splash", "Cohesion", "Pave"]
+
+
+def make_parameter_tables(number_of_channels, parameterizations, seed=0):
+    """Return the hillslope, channel, and contributing channel tables of a binary tree of number_of_channels
+    channels, with one copy of the hillslope and channel rows for each parameterization."""
+
+    rng = np.random.default_rng(seed)
+    channel_numbers = np.arange(1, number_of_channels + 1)
+    first_order = channel_numbers > number_of_channels // 2
+    channel_ids = channel_numbers * 10 + 4
+    hillslope_ids = np.sort(np.concatenate([channel_numbers * 10 + 2, channel_numbers * 10 + 3,
+                                            channel_numbers[first_order] * 10 + 1]))
+    key = {"DelineationName": "delineation", "DiscretizationName": "discretization"}
+
+    hillslopes, channels = [], []
+    for parameterization in parameterizations:
+        df_hillslopes = pd.DataFrame(rng.uniform(0.01, 100, (len(hillslope_ids), len(HILLSLOPE_FIELDS))),
+                                     columns=HILLSLOPE_FIELDS)
+        df_hillslopes.insert(0, "HillslopeID", hillslope_ids)
+        hillslopes.append(df_hillslopes.assign(ParameterizationName=parameterization, **key))
+        df_channels = pd.DataFrame(rng.uniform(0.01, 100, (number_of_channels, len(CHANNEL_FIELDS))),
+                                   columns=CHANNEL_FIELDS)
+        # downstream channels come last in the sequence
+        df_channels.insert(0, "ChannelID", channel_ids)
+        df_channels.insert(1, "Sequence", number_of_channels + 1 - channel_numbers)
+        df_channels["Woolhiser"] = "Yes"
+        channels.append(df_channels.assign(ParameterizationName=parameterization, **key))
+
+    parents = channel_numbers[1:] // 2
+    df_contributing_channels = pd.DataFrame({"ChannelID": (parents * 10 + 4).astype(str),
+                                             "ContributingChannel": channel_ids[1:]}).assign(**key)
+
+    return pd.concat(hillslopes, ignore_index=True), pd.concat(channels, ignore_index=True), df_contributing_channels
+
+
+def to_records(df):
+    return df.to_records(index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, default=100000, help="hillslopes and channels per parameter file")
+    parser.add_argument("--parameterizations", type=int, default=4, help="parameter files written by write_parfiles")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs, the best is reported")
+    parser.add_argument("--profile", action="store_true", help="profile write_file on one parameter file")
+    args = parser.parse_args()
+
+    # each channel has about 2.5 hillslopes
+    number_of_channels = max(1, round(args.elements / 3.5))
+    parameterizations = [f"parameterization_{number}" for number in range(args.parameterizations)]
+    df_hillslopes, df_channels, df_contributing_channels = make_parameter_tables(number_of_channels,
+                                                                                 parameterizations)
+    elements = (len(df_hillslopes) + len(df_channels)) // len(parameterizations)
+    tables = {"parameters_hillslopes": to_records(df_hillslopes), "parameters_channels": to_records(df_channels),
+              "contributing_channels": to_records(df_contributing_channels),
+              "metaParameterization": to_records(pd.DataFrame({
+                  "DelineationName": "delineation", "DiscretizationName": "discretization",
+                  "ParameterizationName": parameterizations, "AGWAVersionAtCreation": "4.0",
+                  "AGWAGDBVersionAtCreation": "4.0"}))}
+
+    def table_to_numpy_array(table, fields, **kwargs):
+        return tables[os.path.basename(table)]
+
+    module_arcpy = code_write_k2_parameter_file.arcpy
+    with mock.patch.object(module_arcpy.da, "TableToNumPyArray", table_to_numpy_array), \
+            mock.patch.object(module_arcpy, "Exists", lambda path: True), \
+            mock.patch.object(module_arcpy, "AddMessage", lambda message: None), \
+            mock.patch.object(module_arcpy, "GetMessages", lambda: ""), \
+            mock.patch("builtins.print"), tempfile.TemporaryDirectory() as output_directory:
+        timings = {}
+        for name, run in [
+                ("write_parfile", lambda: code_write_k2_parameter_file.write_parfile(
+                    "project.gdb", "workspace.gdb", "delineation", "discretization", parameterizations[0],
+                    os.path.join(output_directory, "single.par"))),
+                ("write_parfiles", lambda: code_write_k2_parameter_file.write_parfiles(
+                    "project.gdb", "workspace.gdb",
+                    [("delineation", "discretization", parameterization,
+                      os.path.join(output_directory, f"{parameterization}.par"))
+                     for parameterization in parameterizations])),
+                ("write_parfiles parallel", lambda: code_write_k2_parameter_file.write_parfiles(
+                    "project.gdb", "workspace.gdb",
+                    [("delineation", "discretization", parameterization,
+                      os.path.join(output_directory, f"{parameterization}.par"))
+                     for parameterization in parameterizations], parallel=True))]:
+            best = float("inf")
+            for _ in range(args.repeat):
+                start_time = time.perf_counter()
+                run()
+                best = min(best, time.perf_counter() - start_time)
+            timings[name] = best
+        file_size = os.path.getsize(os.path.join(output_directory, "single.par"))
+        if args.profile:
+            profile = cProfile.Profile()
+            profile.runcall(code_write_k2_parameter_file.write_parfile, "project.gdb", "workspace.gdb", 
+                            "delineation", "discretization", parameterizations[0], 
+                            os.path.join(output_directory, "single.par"))
+
+    sys.stdout.write(f"{elements} elements per file ({file_size / 1e6:.1f} MB), "
+                     f"{len(parameterizations)} parameterizations, best of {args.repeat}, "
+                     f"{os.cpu_count()} CPUs\n")
+    for name, seconds in timings.items():
+        files = 1 if name == "write_parfile" else len(parameterizations)
+        sys.stdout.write(f"  {name:<24} {seconds:8.3f} s  {files * elements / seconds:10.0f} elements/s\n")
+    if args.profile:
+        pstats.Stats(profile, stream=sys.stdout).sort_stats("tottime").print_stats(8)
+
+
+if __name__ == "__main__":
+    main()
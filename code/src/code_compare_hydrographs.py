@@ -4,7 +4,8 @@ import pandas as pd
 import arcpy.management
 import matplotlib.pyplot as plt
 
-from code_plot_hydrograph import get_file_path, read_simulation_data, transform_label, finalize_plot, save_and_show_plot
+import code_hydrograph_store
+from code_plot_hydrograph import read_element_data, read_statistics, transform_label, finalize_plot, save_and_show_plot
 from code_plot_hydrograph import figsize, line_width
 
 
@@ -20,6 +21,8 @@ def compare_hydrographs(simulation_list, hillslope_ids, channel_ids, output_vari
     """Plots hydrographs for the given simulations and element(s)."""
 
     column_to_plot, variable_name = transform_label(output_variable)
+    stores = {simulation: code_hydrograph_store.load_hydrograph_store(os.path.join(simulation_directory, simulation))
+              for simulation in simulation_list}
 
     for ids, element_type in [(hillslope_ids, "Hillslope"), (channel_ids, "Channel")]:
         
@@ -31,8 +34,7 @@ def compare_hydrographs(simulation_list, hillslope_ids, channel_ids, output_vari
                 fig.subplots_adjust(left=0.1, right=0.9, top=0.85, bottom=0.15) 
 
                 for simulation in simulation_list:
-                    file_path = get_file_path(simulation_directory, simulation, element_type, element_id)
-                    df_sim_results = read_simulation_data(file_path, unit)
+                    df_sim_results = read_element_data(stores[simulation], element_type, element_id, unit)
 
                     ax.plot(df_sim_results['tim_min'], df_sim_results[column_to_plot], 
                             label=f"Simulation: {simulation}", linewidth=line_width)
@@ -57,7 +59,14 @@ def compare_hydrographs(simulation_list, hillslope_ids, channel_ids, output_vari
                 if ids is not None:
                     for element_id in ids:
                         for simulation in simulation_list:
-                            file_path = get_file_path(simulation_directory, simulation, element_type, element_id)
-                            df_sim_results = read_simulation_data(file_path, unit)[['tim_min', column_to_plot]]
+                            df_sim_results = read_element_data(stores[simulation], element_type, element_id, unit)[['tim_min', column_to_plot]]
                             df_sim_results.to_excel(writer, sheet_name=f"{simulation}_{element_type}ID_{element_id}", index=False)
+            statistics = []
+            for ids, element_type in [(hillslope_ids, "Hillslope"), (channel_ids, "Channel")]:
+                if ids is not None:
+                    for simulation in simulation_list:
+                        df_statistics = read_statistics(stores[simulation], element_type, ids, column_to_plot)
+                        df_statistics.insert(0, "Simulation", simulation)
+                        statistics.append(df_statistics)
+            pd.concat(statistics, ignore_index=True).to_excel(writer, sheet_name="Statistics", index=False)
         tweet(f"Data has been saved to {excel_file_path}.")
\ No newline at end of file
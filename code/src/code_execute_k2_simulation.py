@@ -0,0 +1,211 @@
+import os
+import sys
+import glob
+import time
+import arcpy
+import shutil
+import hashlib
+import tempfile
+import subprocess
+import concurrent.futures
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+import config
+import code_process_pool
+import code_write_k2_simulation
+
+# name of the file, in the simulation directory, that holds the console output of a K2 run
+RUN_LOG_NAME = "k2_run.log"
+# folders of the simulation directory where K2 writes the hydrographs of the elements
+ELEMENT_OUTPUT_FOLDERS = ["hillslopes", "channels", "ponds"]
+
+
+def tweet(msg):
+    """Produce a message for both arcpy and python"""
+    m = "\n{}\n".format(msg)
+    arcpy.AddMessage(m)
+    print(arcpy.GetMessages())
+
+
+def run_simulations(prjgdb, simulation_directories, k2_executable=None, timeout=None):
+    """Run K2 in batch mode (-b) in each simulation directory without opening a console window. At most
+    config.MAX_WORKER_PROCESSES runs (all cores when 0) are executed at a time, each stopped after timeout seconds 
+    (config.K2_TIMEOUT_SECONDS when not given, 0 for no limit). The console output of each run is saved in 
+    k2_run.log in its simulation directory, and the status of each run is written to the Status field of the 
+    metaSimulation table as the run finishes. Returns a list of dictionaries with the SimulationPath, Status, 
+    ReturnCode, and RunTime (seconds) of each run."""
+
+    if timeout is None:
+        timeout = config.K2_TIMEOUT_SECONDS
+    worker_count = code_process_pool.get_worker_count(len(simulation_directories))
+    tweet(f"Running {len(simulation_directories)} K2 simulations, {worker_count} at a time")
+
+    # Each worker waits on its own K2 process, so the workers are threads and the runs are separate processes
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=worker_count) as executor:
+        futures = [executor.submit(run_simulation, simulation_directory, k2_executable, timeout)
+                   for simulation_directory in simulation_directories]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            update_simulation_status(prjgdb, result["SimulationPath"], result["Status"])
+            tweet(f"    {len(results)} of {len(futures)}: {result['SimulationPath']} {result['Status']}")
+
+    return results
+
+
+def run_simulation(simulation_directory, k2_executable=None, timeout=0):
+    """Run K2 in batch mode in the simulation directory and wait for it to finish. The console output is saved in
+    k2_run.log. When config.K2_RESULT_CACHE is True, the outputs of an earlier run with the same inputs are linked 
+    from the result cache instead of running K2, and the outputs of new runs are added to the cache. Returns a 
+    dictionary with the SimulationPath, Status, ReturnCode, and RunTime (seconds) of the run. 
+    Called by run_simulations()."""
+
+    k2_executable = get_k2_executable(simulation_directory, k2_executable)
+    log_file_path = os.path.join(simulation_directory, RUN_LOG_NAME)
+    start_time = time.time()
+    return_code = None
+    cache_directory = None
+    try:
+        if not os.path.isfile(os.path.join(simulation_directory, "kin.fil")):
+            raise FileNotFoundError(f"kin.fil was not found in {simulation_directory}.")
+        if config.K2_RESULT_CACHE:
+            cache_directory = get_result_cache_directory(simulation_directory, k2_executable)
+            if os.path.isdir(cache_directory):
+                restore_cached_results(cache_directory, simulation_directory)
+                return {"SimulationPath": simulation_directory, "Status": "Completed (cached)", "ReturnCode": 0,
+                        "RunTime": round(time.time() - start_time, 3)}
+        # outputs linked from the cache are read-only and shared with other simulations, so they are removed before
+        # K2 writes new ones, also when the cache has been turned off since they were linked
+        remove_linked_outputs(simulation_directory)
+        completed = subprocess.run([k2_executable, "-b"], cwd=simulation_directory, stdin=subprocess.DEVNULL, 
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout or None)
+        return_code = completed.returncode
+        output = completed.stdout
+        status = "Completed" if return_code == 0 else f"Failed (return code {return_code})"
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout or b""
+        status = f"Timed out after {timeout} seconds"
+    except OSError as e:
+        output = str(e).encode()
+        status = f"Failed ({e.__class__.__name__})"
+
+    with open(log_file_path, "wb") as log_file:
+        log_file.write(output)
+    if cache_directory and return_code == 0:
+        cache_results(simulation_directory, cache_directory)
+
+    return {"SimulationPath": simulation_directory, "Status": status, "ReturnCode": return_code, 
+            "RunTime": round(time.time() - start_time, 3)}
+
+
+def get_k2_executable(simulation_directory, k2_executable=None):
+    """Return the path of the K2 executable: the given path, config.K2_EXECUTABLE, or the k2.exe of the 
+    simulation directory. Called by run_simulation()."""
+
+    k2_executable = k2_executable or config.K2_EXECUTABLE
+    if k2_executable:
+        return os.path.abspath(k2_executable)
+    return os.path.join(simulation_directory, "k2.exe")
+
+
+def get_output_files(simulation_directory):
+    """Return the paths, relative to the simulation directory, of the output files of the runs in kin.fil: the 
+    output (.out) files and the element hydrographs. Called by cache_results() and remove_linked_outputs()."""
+
+    with open(os.path.join(simulation_directory, "kin.fil"), "r") as runfile:
+        output_files = [line.split(",")[2].strip() for line in runfile if len(line.split(",")) > 2]
+    for folder in ELEMENT_OUTPUT_FOLDERS:
+        output_files += [os.path.join(folder, os.path.basename(path)) 
+                         for path in glob.glob(os.path.join(simulation_directory, folder, "*"))]
+    return output_files
+
+
+def get_result_cache_directory(simulation_directory, k2_executable):
+    """Return the result cache folder for the runs of a simulation. The folder is named after a hash of the K2 
+    executable, the kin.fil lines with their settings, and the content of the parameter and precipitation files 
+    of each line, so it only matches runs that would produce the same outputs. Called by run_simulation()."""
+
+    key = hashlib.sha256(code_write_k2_simulation.get_file_hash(k2_executable).encode())
+    with open(os.path.join(simulation_directory, "kin.fil"), "r") as runfile:
+        for line in runfile:
+            fields = [field.strip() for field in line.split(",")]
+            if len(fields) < 3:
+                continue
+            key.update(",".join(fields).encode())
+            for input_file in fields[:2]:
+                key.update(code_write_k2_simulation.get_file_hash(os.path.join(simulation_directory, input_file)).encode())
+
+    return os.path.join(get_result_cache_root(simulation_directory), key.hexdigest())
+
+
+def get_result_cache_root(simulation_directory):
+    """Return the result_cache folder of the modeling files directory that holds the simulation directory 
+    (modeling_files/<discretization>/simulations/<simulation>)."""
+
+    modeling_files_directory = os.path.dirname(os.path.dirname(os.path.dirname(simulation_directory)))
+    return os.path.join(modeling_files_directory, "result_cache")
+
+
+def restore_cached_results(cache_directory, simulation_directory):
+    """Link the cached outputs into the simulation directory. Called by run_simulation()."""
+
+    made_writable = False
+    for root, _, file_names in os.walk(cache_directory):
+        destination_directory = os.path.join(simulation_directory, os.path.relpath(root, cache_directory))
+        os.makedirs(destination_directory, exist_ok=True)
+        for file_name in file_names:
+            made_writable |= code_write_k2_simulation.link_file(os.path.join(root, file_name), 
+                                                                os.path.join(destination_directory, file_name))
+    if made_writable:
+        code_write_k2_simulation.protect_files(os.path.dirname(cache_directory))
+
+
+def remove_linked_outputs(simulation_directory):
+    """Remove the outputs of the simulation directory that are links, such as links to cached outputs, so K2 
+    writes new files instead of writing through the links. Called by run_simulation()."""
+
+    made_writable = False
+    for output_file in get_output_files(simulation_directory):
+        output_path = os.path.join(simulation_directory, output_file)
+        if os.path.islink(output_path) or (os.path.isfile(output_path) and os.stat(output_path).st_nlink > 1):
+            made_writable |= code_write_k2_simulation.remove_file(output_path)
+    if made_writable:
+        code_write_k2_simulation.protect_files(get_result_cache_root(simulation_directory))
+
+
+def cache_results(simulation_directory, cache_directory):
+    """Copy the outputs of a simulation into the result cache. The outputs are copied, not linked, so a later 
+    run in the simulation directory cannot change them, and the copies are made read-only since they are linked 
+    into every simulation with the same inputs. Called by run_simulation()."""
+
+    os.makedirs(os.path.dirname(cache_directory), exist_ok=True)
+    temporary_directory = tempfile.mkdtemp(prefix=os.path.basename(cache_directory) + ".", 
+                                           dir=os.path.dirname(cache_directory))
+    for output_file in get_output_files(simulation_directory):
+        output_path = os.path.join(simulation_directory, output_file)
+        if os.path.isfile(output_path):
+            os.makedirs(os.path.dirname(os.path.join(temporary_directory, output_file)), exist_ok=True)
+            shutil.copy2(output_path, os.path.join(temporary_directory, output_file))
+    code_write_k2_simulation.protect_files(temporary_directory)
+    try:
+        os.replace(temporary_directory, cache_directory)
+    except OSError:
+        # another run with the same inputs has already cached its outputs
+        shutil.rmtree(temporary_directory, onerror=code_write_k2_simulation.remove_read_only)
+
+
+def update_simulation_status(prjgdb, simulation_directory, status):
+    """Write the status of a simulation to the metaSimulation table.
+    Called by run_simulations()."""
+
+    meta_simulation_table = os.path.join(prjgdb, "metaSimulation")
+    if not arcpy.Exists(meta_simulation_table):
+        return
+
+    simulation_path_field = arcpy.AddFieldDelimiters(meta_simulation_table, "SimulationPath")
+    simulation_path = simulation_directory.replace("'", "''")
+    where_clause = f"{simulation_path_field} = '{simulation_path}'"
+    with arcpy.da.UpdateCursor(meta_simulation_table, ["Status"], where_clause) as cursor:
+        for row in cursor:
+            row[0] = status
+            cursor.updateRow(row)
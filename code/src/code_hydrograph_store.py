@@ -0,0 +1,211 @@
+import os
+import sys
+import arcpy
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+import code_process_pool
+
+# columns of the hydrograph (.SIM) files that K2 writes for each hillslope and channel
+SIM_COLUMNS = ["tim_min", "Rainfall_Rate_mmhr", "Runoff_Rate_mmhr", "Runoff_Rate_cms", "Total_Sediment_Yield_kgs",
+               "sed_p250mm_kgs", "sed_p033mm_kgs", "sed_p004mm_kgs"]
+# folders of the simulation directory that hold the .SIM files, and the element type of each
+SIM_FOLDERS = {"hillslopes": "Hillslope", "channels": "Channel"}
+# files of the hydrograph store, in the simulation directory. The values are a float32 array of shape
+# (len(SIM_COLUMNS), total time steps), and the index holds the element type, ID, start, and count of each element.
+STORE_VALUES_NAME = "hydrographs_values.npy"
+STORE_INDEX_NAME = "hydrographs_index.npz"
+
+
+def tweet(msg):
+    """Produce a message for both arcpy and python"""
+    m = "\n{}\n".format(msg)
+    arcpy.AddMessage(m)
+    print(arcpy.GetMessages())
+
+
+def build_hydrograph_store(simulation_abspath):
+    """Pack the .SIM files of all hillslopes and channels of a simulation into one columnar store: a float32 .npy
+    file with one row per variable (SIM_COLUMNS) and the time steps of all elements one after the other, and an
+    .npz index with the ElementType, ElementID, Start, and Count of each element. The .SIM files are read in
+    parallel. Returns the path of the index file. Called by import_k2_results and load_hydrograph_store."""
+
+    sim_files = list_sim_files(simulation_abspath)
+    if not sim_files:
+        raise Exception(f"Cannot proceed. \nNo hydrograph (.SIM) files were found in {simulation_abspath}.")
+
+    paths = [path for _, _, path in sim_files]
+    worker_count = code_process_pool.get_worker_count(len(paths))
+    chunks = [chunk.tolist() for chunk in np.array_split(np.array(paths, dtype=object), worker_count * 4)
+              if len(chunk)]
+    if len(chunks) > 1:
+        with code_process_pool.create_process_pool(len(chunks)) as executor:
+            hydrographs = [hydrograph for chunk_hydrographs in executor.map(read_sim_files, chunks)
+                           for hydrograph in chunk_hydrographs]
+    else:
+        hydrographs = read_sim_files(paths)
+
+    counts = np.array([len(hydrograph) for hydrograph in hydrographs], dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    values_path = os.path.join(simulation_abspath, STORE_VALUES_NAME)
+    index_path = os.path.join(simulation_abspath, STORE_INDEX_NAME)
+    values = np.lib.format.open_memmap(values_path + ".tmp", mode="w+", dtype=np.float32,
+                                       shape=(len(SIM_COLUMNS), int(counts.sum())))
+    for start, count, hydrograph in zip(starts.tolist(), counts.tolist(), hydrographs):
+        values[:, start:start + count] = hydrograph.T
+    values.flush()
+    del values
+    with open(index_path + ".tmp", "wb") as index_file:
+        np.savez(index_file, ElementType=np.array([element_type for element_type, _, _ in sim_files]),
+                 ElementID=np.array([element_id for _, element_id, _ in sim_files], dtype=np.int64),
+                 Start=starts, Count=counts, Variables=np.array(SIM_COLUMNS),
+                 Signature=get_sim_files_signature(sim_files))
+    os.replace(values_path + ".tmp", values_path)
+    os.replace(index_path + ".tmp", index_path)
+    tweet(f"    Packed the hydrographs of {len(sim_files)} elements into {index_path}")
+
+    return index_path
+
+
+def list_sim_files(simulation_abspath):
+    """Return (element type, element ID, path) of each .SIM file of a simulation, sorted by element type and ID.
+    Raises an exception for simulations with several runs in their kin.fil, since every run writes the same .SIM
+    files and they only hold the hydrographs of the last run. Called by build_hydrograph_store and 
+    load_hydrograph_store."""
+
+    run_count = get_run_count(simulation_abspath)
+    if run_count > 1:
+        raise Exception(f"Cannot proceed. \nThe simulation {simulation_abspath} has {run_count} runs in its kin.fil. "
+                        f"Every run writes the same hillslope and channel (.SIM) files, so they only hold the "
+                        f"hydrographs of the last run. Write the runs as separate simulations to plot or compare "
+                        f"their hydrographs.")
+
+    sim_files = []
+    for folder in os.listdir(simulation_abspath):
+        element_type = SIM_FOLDERS.get(folder.lower())
+        if element_type is None or not os.path.isdir(os.path.join(simulation_abspath, folder)):
+            continue
+        for entry in os.scandir(os.path.join(simulation_abspath, folder)):
+            name, extension = os.path.splitext(entry.name)
+            element_id = name.rsplit("_", 1)[-1]
+            if extension.upper() == ".SIM" and element_id.isdigit():
+                sim_files.append((element_type, int(element_id), entry.path))
+
+    return sorted(sim_files)
+
+
+def get_run_count(simulation_abspath):
+    """Return the number of runs in the kin.fil of a simulation, or 0 if it has no kin.fil. Called by 
+    list_sim_files and code_import_results.import_k2_results."""
+
+    runfile_abspath = os.path.join(simulation_abspath, "kin.fil")
+    if not os.path.exists(runfile_abspath):
+        return 0
+    with open(runfile_abspath, "r") as runfile:
+        return sum(1 for line in runfile if len(line.split(",")) >= 3)
+
+
+def get_sim_files_signature(sim_files):
+    """Return the number, total size, and latest modification time of the .SIM files, which tell whether the store
+    is up to date. Called by build_hydrograph_store and load_hydrograph_store."""
+
+    stats = [os.stat(path) for _, _, path in sim_files]
+    return np.array([len(stats), sum(stat.st_size for stat in stats),
+                     max((stat.st_mtime_ns for stat in stats), default=0)], dtype=np.int64)
+
+
+def read_sim_files(paths):
+    """Read .SIM files into float32 arrays of shape (time steps, len(SIM_COLUMNS)). The two title lines and the 
+    header line are skipped and the comma-separated values are converted at once. Runs in a worker process.
+    Called by build_hydrograph_store."""
+
+    hydrographs = []
+    for path in paths:
+        with open(path, "rb") as sim_file:
+            for _ in range(3):
+                sim_file.readline()
+            values = np.array(sim_file.read().replace(b",", b" ").split(), dtype=np.float32)
+        if values.size % len(SIM_COLUMNS):
+            raise Exception(f"Cannot proceed. \n{path} does not have {len(SIM_COLUMNS)} values on each line.")
+        hydrographs.append(values.reshape(-1, len(SIM_COLUMNS)))
+
+    return hydrographs
+
+
+def load_hydrograph_store(simulation_abspath):
+    """Return the hydrograph store of a simulation, building it first if it does not exist or if the .SIM files
+    changed since it was built. The store is a dictionary with the index arrays (ElementType, ElementID, Start,
+    Count, Variables), Values memory-mapped from the .npy file, and Elements mapping (element type, ID) to the
+    position of the element in the index. Called by the plot and compare modules."""
+
+    index_path = os.path.join(simulation_abspath, STORE_INDEX_NAME)
+    values_path = os.path.join(simulation_abspath, STORE_VALUES_NAME)
+    signature = get_sim_files_signature(list_sim_files(simulation_abspath))
+    store = None
+    if os.path.exists(index_path) and os.path.exists(values_path):
+        with np.load(index_path) as index:
+            store = {name: index[name] for name in index.files}
+        if not np.array_equal(store["Signature"], signature):
+            store = None
+    if store is None:
+        build_hydrograph_store(simulation_abspath)
+        with np.load(index_path) as index:
+            store = {name: index[name] for name in index.files}
+
+    store["Values"] = np.load(values_path, mmap_mode="r")
+    store["Elements"] = {(element_type, element_id): position for position, (element_type, element_id)
+                         in enumerate(zip(store["ElementType"].tolist(), store["ElementID"].tolist()))}
+    return store
+
+
+def read_hydrograph(store, element_type, element_id, variables=None):
+    """Return the hydrograph of one element as a DataFrame with the given variables (all of SIM_COLUMNS when not
+    given). Only the time steps of the element are read from the store."""
+
+    position = store["Elements"].get((element_type, int(element_id)))
+    if position is None:
+        raise Exception(f"Cannot proceed. \nThe hydrograph of {element_type} {element_id} is not in the store.")
+    start, count = int(store["Start"][position]), int(store["Count"][position])
+    variables = list(store["Variables"]) if variables is None else variables
+    rows = [get_variable_row(store, variable) for variable in variables]
+
+    return pd.DataFrame(np.asarray(store["Values"][rows, start:start + count], dtype=np.float64).T,
+                        columns=variables)
+
+
+def get_hydrograph_statistics(store, variable):
+    """Return the peak, time to peak, and total (time integral by the trapezoidal rule, in variable units times
+    minutes) of one variable for every element, computed from the store at once. Called by 
+    code_plot_hydrograph.read_statistics."""
+
+    times = store["Values"][get_variable_row(store, "tim_min")].astype(np.float64)
+    values = store["Values"][get_variable_row(store, variable)].astype(np.float64)
+    starts, counts = store["Start"], store["Count"]
+    has_values = counts > 0
+    peaks = np.full(len(counts), np.nan)
+    peak_times = np.full(len(counts), np.nan)
+    totals = np.zeros(len(counts))
+    if np.any(has_values):
+        peaks[has_values] = np.maximum.reduceat(values, starts[has_values])
+        # the first time step of each element where the value equals the peak
+        at_peak = values == np.repeat(peaks, counts)
+        first_peak = np.minimum.reduceat(np.where(at_peak, np.arange(len(values)), len(values)), starts[has_values])
+        peak_times[has_values] = times[first_peak]
+        # trapezoids between consecutive time steps of the same element
+        areas = np.diff(times) * (values[1:] + values[:-1]) / 2
+        same_element = np.repeat(np.arange(len(counts)), counts)
+        same_element = same_element[1:] == same_element[:-1]
+        totals = np.bincount(np.repeat(np.arange(len(counts)), counts)[1:][same_element],
+                             weights=areas[same_element], minlength=len(counts))
+
+    return pd.DataFrame({"ElementType": store["ElementType"], "ElementID": store["ElementID"],
+                         f"Peak_{variable}": peaks, "Time_To_Peak_min": peak_times, f"Total_{variable}": totals})
+
+
+def get_variable_row(store, variable):
+    """Return the row of a variable in the values of the store."""
+
+    variables = store["Variables"].tolist()
+    if variable not in variables:
+        raise Exception(f"Cannot proceed. \nVariable {variable} is not in the hydrograph store.")
+    return variables.index(variable)
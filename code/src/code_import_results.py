@@ -1,12 +1,16 @@
 import os
 import io
 import sys
+import mmap
 import arcpy
 import datetime
+import numpy as np
 import pandas as pd
 import arcpy.management
 sys.path.append(os.path.join(os.path.dirname(__file__)))
 from config import AGWA_VERSION, AGWAGDB_VERSION
+import code_process_pool
+import code_hydrograph_store
 
 def tweet(msg):
     """Produce a message for both arcpy and python    """
@@ -15,190 +19,405 @@ def tweet(msg):
     print(arcpy.GetMessages())
 
 
+# aliases of the fields of table k2_results, set when the table is created
+K2_RESULTS_FIELD_ALIASES = {
+    "DelineationName": "Delineation Name",
+    "DiscretizationName": "Discretization Name",
+    "ParameterizationName": "Parameterization Name",
+    "SimulationName": "Simulation Name",
+    "OutFileName": "Output File Name",
+    "Element_ID": "Element ID",
+    "Element_Type": "Element Type",
+    "peak_flow_times": "Peak Flow Time (min)",
+    "peak_sediment_times": "Peak Sediment Time (min)",
+    "peak_sediment_discharge_kgs": "Peak Sediment Discharge (kg/s)",
+    "Element_Area_m2": "Element Area (m2)",
+    "Contributing_Area_m2": "Contributing Area (m2)",
+    "Inflow_cum": "Inflow (cum)",
+    "Rainfall_cum": "Rainfall (cum)",
+    "Outflow_cum": "Outflow (cum)",
+    "Peak_Flow_mmhr": "Peak Flow (mm/hr)",
+    "Total_Infil_cum": "Total Infiltration (cum)",
+    "Initial_Water_Content": "Initial Water Content",
+    "Sediment_Yield_kg": "Sediment Yield (kg)",
+    "Rainfall_mm": "Rainfall (mm)",
+    "Outflow_mm": "Outflow (mm)",
+    "Inflow_mm": "Inflow (mm)",
+    "Total_Infil_mm": "Total Infiltration (mm)",
+    "Sediment_Yield_kgha": "Sediment Yield (kg/ha)",
+    "Contributing_Area_sqft": "Contributing Area (sqft)",
+    "Element_Area_sqft": "Element Area (sqft)",
+    "Inflow_cfs": "Inflow (cfs)",
+    "Inflow_cft": "Inflow (cft)",
+    "Inflow_inches": "Inflow (inches)",
+    "Outflow_cft": "Outflow (cft)",
+    "Outflow_inches": "Outflow (inches)",
+    "Peak_Flow_cfs": "Peak Flow (cfs)",
+    "Peak_Flow_inhr": "Peak Flow (in/hr)",
+    "Peak_Sediment_Discharge_lbs_s": "Peak Sediment Discharge (lbs/s)",
+    "Rainfall_inches": "Rainfall (inches)",
+    "Sediment_Yield_pounds": "Sediment Yield (pounds)",
+    "Sediment_Yield_pounds_acre": "Sediment Yield (pounds/acre)",
+    "Sediment_Yield_tons": "Sediment Yield (tons)",
+    "Sediment_Yield_tons_acre": "Sediment Yield (tons/acre)",
+    "Total_Infil_inches": "Total Infiltration (inches)"}
+
+
 def import_k2_results(workspace, delineation_name, discretization_name, parameterization_name, simulation_name, simulation_abspath): 
     
     tweet(f"    Reading results for simulation '{simulation_name}'")
     df_results = read_simulation_results(delineation_name, discretization_name, parameterization_name, simulation_name, simulation_abspath)
 
-    tweet(f"    Creating table k2_results if it does not exist")
     results_table = os.path.join(workspace, "k2_results")
     if not arcpy.Exists(results_table):
-        arcpy.CreateTable_management(workspace, "k2_results")
-        for field in df_results.columns:
-            if df_results[field].dtype == "int64":
-                field_type = "LONG"
-            elif df_results[field].dtype == "float64":
-                field_type = "DOUBLE"
-            else:
-                field_type = "TEXT"
-            arcpy.AddField_management(results_table, field, field_type)
-
-    tweet(f"    Adding field aliases to table k2_results")
-    add_field_alias(workspace, "k2_results")
+        tweet(f"    Creating table k2_results")
+        create_results_table(workspace, df_results)
 
     tweet("    Removing existing records for the simulation if they exist")
-    where_clause = (f"DelineationName = '{delineation_name}' AND DiscretizationName = '{discretization_name}' "
-                    f"AND ParameterizationName = '{parameterization_name}' AND SimulationName = '{simulation_name}'")
-    with arcpy.da.UpdateCursor(results_table, df_results.columns, where_clause) as cursor:
-        for row in cursor:
-            cursor.deleteRow()
-    
-    tweet(f"    Importing simulation {simulation_name} into table k2_results")    
-    with arcpy.da.InsertCursor(results_table, df_results.columns) as cursor:
-        for row in df_results.itertuples(index=False):
-            cursor.insertRow(row)
-    
-def add_field_alias(results_gdb_abspath, table_name):
-    """Add field aliases to the table k2_results, called by import_k2_results."""
-    field_aliases = {"DelineationName": "Delineation Name",
-                    "DiscretizationName": "Discretization Name",
-                    "ParameterizationName": "Parameterization Name",
-                    "SimulationName": "Simulation Name",
-                    "OutFileName": "Output File Name",
-                    "Element_ID": "Element ID",
-                    "Element_Type": "Element Type",
-                    "peak_flow_times": "Peak Flow Time (min)",
-                    "peak_sediment_times": "Peak Sediment Time (min)",
-                    "peak_sediment_discharge_kgs": "Peak Sediment Discharge (kg/s)",
-                    "Element_Area_m2": "Element Area (m2)",
-                    "Contributing_Area_m2": "Contributing Area (m2)",
-                    "Inflow_cum": "Inflow (cum)",
-                    "Rainfall_cum": "Rainfall (cum)",
-                    "Outflow_cum": "Outflow (cum)",
-                    "Peak_Flow_mmhr": "Peak Flow (mm/hr)",
-                    "Total_Infil_cum": "Total Infiltration (cum)",
-                    "Initial_Water_Content": "Initial Water Content",
-                    "Sediment_Yield_kg": "Sediment Yield (kg)",
-                    "Rainfall_mm": "Rainfall (mm)",
-                    "Outflow_mm": "Outflow (mm)",
-                    "Inflow_mm": "Inflow (mm)",
-                    "Total_Infil_mm": "Total Infiltration (mm)",
-                    "Sediment_Yield_kgha": "Sediment Yield (kg/ha)",
-                    "Contributing_Area_sqft": "Contributing Area (sqft)",
-                    "Element_Area_sqft": "Element Area (sqft)",
-                    "Inflow_cfs": "Inflow (cfs)",
-                    "Inflow_cft": "Inflow (cft)",
-                    "Inflow_inches": "Inflow (inches)",
-                    "Outflow_cft": "Outflow (cft)",
-                    "Outflow_inches": "Outflow (inches)",
-                    "Peak_Flow_cfs": "Peak Flow (cfs)",
-                    "Peak_Flow_inhr": "Peak Flow (in/hr)",
-                    "Peak_Sediment_Discharge_lbs_s": "Peak Sediment Discharge (lbs/s)",
-                    "Rainfall_inches": "Rainfall (inches)",
-                    "Sediment_Yield_pounds": "Sediment Yield (pounds)",
-                    "Sediment_Yield_pounds_acre": "Sediment Yield (pounds/acre)",
-                    "Sediment_Yield_tons": "Sediment Yield (tons)",
-                    "Sediment_Yield_tons_acre": "Sediment Yield (tons/acre)",
-                    "Total_Infil_inches": "Total Infiltration (inches)"}
-
-    for field, alias in field_aliases.items():
-        arcpy.AlterField_management(os.path.join(results_gdb_abspath, table_name), field, new_field_alias=alias)
-
-   
+    delineation_name_field = arcpy.AddFieldDelimiters(workspace, "DelineationName")
+    discretization_name_field = arcpy.AddFieldDelimiters(workspace, "DiscretizationName")
+    parameterization_name_field = arcpy.AddFieldDelimiters(workspace, "ParameterizationName")
+    simulation_name_field = arcpy.AddFieldDelimiters(workspace, "SimulationName")
+    parameterization_names = ", ".join(f"'{escape_text(name)}'" for name in df_results.ParameterizationName.unique())
+    where_clause = (f"{delineation_name_field} = '{escape_text(delineation_name)}' AND "
+                    f"{discretization_name_field} = '{escape_text(discretization_name)}' AND "
+                    f"{parameterization_name_field} IN ({parameterization_names}) AND "
+                    f"{simulation_name_field} = '{escape_text(simulation_name)}'")
+    delete_rows(results_table, where_clause)
+
+    tweet(f"    Importing {df_results.OutFileName.nunique()} output files of simulation {simulation_name} into table "
+          f"k2_results")
+    append_rows(results_table, df_results)
+
+    # the runs of a batch all write the same .SIM files, which only hold the hydrographs of the last run
+    run_count = code_hydrograph_store.get_run_count(simulation_abspath)
+    if run_count > 1:
+        tweet(f"    Warning: the hydrographs of simulation {simulation_name} are not packed, since its {run_count} "
+              f"runs write the same .SIM files, which only hold the hydrographs of the last run")
+    elif code_hydrograph_store.list_sim_files(simulation_abspath):
+        tweet(f"    Packing the hydrographs of simulation {simulation_name} into one store")
+        code_hydrograph_store.build_hydrograph_store(simulation_abspath)
+
+
+def create_results_table(workspace, df_results):
+    """Create table k2_results with fields typed after the columns of df_results and their aliases. 
+    Called by import_k2_results."""
+
+    arcpy.CreateTable_management(workspace, "k2_results")
+    fields = []
+    for field in df_results.columns:
+        if df_results[field].dtype == "int64":
+            field_type = "LONG"
+        elif df_results[field].dtype == "float64":
+            field_type = "DOUBLE"
+        else:
+            field_type = "TEXT"
+        fields.append([field, field_type, K2_RESULTS_FIELD_ALIASES.get(field, field)])
+    arcpy.management.AddFields(os.path.join(workspace, "k2_results"), fields)
+
+
+def delete_rows(table, where_clause):
+    """Delete the rows of a table that match where_clause at once, through a table view. 
+    Called by import_k2_results."""
+
+    table_view = f"{os.path.basename(table)}_tableview"
+    # a view left over from an import that failed would keep MakeTableView from creating it
+    if arcpy.Exists(table_view):
+        arcpy.management.Delete(table_view)
+    arcpy.management.MakeTableView(table, table_view, where_clause)
+    if int(arcpy.management.GetCount(table_view)[0]) > 0:
+        arcpy.management.DeleteRows(table_view)
+    arcpy.management.Delete(table_view)
+
+
+def append_rows(table, df):
+    """Append the rows of a DataFrame to a table at once. The DataFrame is converted to a structured array, written
+    to an in-memory table, and appended, matching fields by name. Called by import_k2_results."""
+
+    columns = {}
+    dtypes = []
+    for field in df.columns:
+        if df[field].dtype == "int64":
+            columns[field] = df[field].to_numpy(dtype=np.int32)
+        elif df[field].dtype == "float64":
+            columns[field] = df[field].to_numpy()
+        else:
+            columns[field] = df[field].fillna("").astype(str).to_numpy(dtype=str)
+        dtypes.append((field, columns[field].dtype))
+    array = np.empty(len(df), dtype=dtypes)
+    for field, values in columns.items():
+        array[field] = values
+
+    memory_table = os.path.join("in_memory", f"{os.path.basename(table)}_append")
+    if arcpy.Exists(memory_table):
+        arcpy.management.Delete(memory_table)
+    arcpy.da.NumPyArrayToTable(array, memory_table)
+    arcpy.management.Append(memory_table, table, "NO_TEST")
+    arcpy.management.Delete(memory_table)
+
+
+def escape_text(value):
+    """Escape single quotes in a text value of a where clause. Called by import_k2_results."""
+
+    return str(value).replace("'", "''")
+
+
 def read_simulation_results(delineation_name, discretization_name, parameterization_name, simulation_name, simulation_abspath):
-    """Reads simulation results from the output file and returns a pandas DataFrame. Called by import_k2_results."""
+    """Reads simulation results from the output files listed in kin.fil and returns a pandas DataFrame with one row 
+    per element and output file, keyed by OutFileName. For batch runs (kin.fil with several lines), the output files
+    are read in parallel. The ParameterizationName of each output file is read from its parameter file, falling 
+    back to parameterization_name. Called by import_k2_results."""
+
+    runs = read_runfile(simulation_abspath)
+    outfile_abspaths = [os.path.join(simulation_abspath, out_name) for _, out_name in runs]
+    if len(outfile_abspaths) > 1:
+        tweet(f"    Reading {len(outfile_abspaths)} output files in parallel")
+        with code_process_pool.create_process_pool(len(outfile_abspaths)) as executor:
+            df_metrics = list(executor.map(read_output_metrics, outfile_abspaths))
+    else:
+        df_metrics = [read_output_metrics(outfile_abspath) for outfile_abspath in outfile_abspaths]
+
+    parameterization_names = {}
+    for (par_name, out_name), df_metric in zip(runs, df_metrics):
+        if par_name not in parameterization_names:
+            parameterization_names[par_name] = (get_parameterization_name(os.path.join(simulation_abspath, par_name)) 
+                                                or parameterization_name)
+        df_metric.insert(0, "ParameterizationName", parameterization_names[par_name])
+        df_metric.insert(1, "OutFileName", out_name)
+    df_metric = pd.concat(df_metrics, ignore_index=True)
+
+    tweet(f"    Converting units")
+    df_metric_english = unit_conversion(df_metric)
+    key_columns = ["ParameterizationName", "OutFileName"]
+    df_metric_english = df_metric_english[key_columns + sorted(set(df_metric_english.columns) - set(key_columns))]
+
+    df_metric_english["CreationDate"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    df_metric_english["AGWAVersionAtCreation"] = AGWA_VERSION
+    df_metric_english["AGWAGDBVersionAtCreation"] = AGWAGDB_VERSION
+    df_metric_english["Status"] = "Complete"
+    df_metric_english.insert(0, "DelineationName", delineation_name)
+    df_metric_english.insert(1, "DiscretizationName", discretization_name)
+    df_metric_english.insert(3, "SimulationName", simulation_name)
 
+    return df_metric_english
+
+
+def read_runfile(simulation_abspath):
+    """Return (parameter file name, output file name) for each run in the kin.fil of a simulation. 
+    Called by read_simulation_results."""
+
+    runs = []
     runfile_abspath = os.path.join(simulation_abspath, "kin.fil")
     with open(runfile_abspath, "r") as runfile:
         for line in runfile:  # this is to handle Batch runs
-            out_name = line.split(",")[2].strip()
-            outfile_abspath = os.path.join(simulation_abspath, out_name)
-
-            # Reading simulation results from {out_name}
-            df_block = read_element(outfile_abspath)
-            df_tabular = read_tabular_data(outfile_abspath)
-            df_metric = pd.merge(df_block, df_tabular, how="left", on=["Element_ID", "Element_Type"])
-            df_metric.loc[df_metric.Element_Type=="Hillslope", "Rainfall_mm"] = df_metric["Rainfall_cum"] / df_metric["Element_Area_m2"] * 1000
-            df_metric.loc[df_metric.Element_Type=="Hillslope", "Outflow_mm"] = df_metric["Outflow_cum"] / df_metric["Element_Area_m2"] * 1000
-            df_metric.loc[df_metric.Element_Type=="Hillslope", "Inflow_mm"] = df_metric["Inflow_cum"] / df_metric["Element_Area_m2"] * 1000
-            df_metric.loc[df_metric.Element_Type=="Hillslope", "Total_Infil_mm"] = df_metric["Total_Infil_cum"] / df_metric["Element_Area_m2"] * 1000
-            df_metric.loc[df_metric.Element_Type=="Hillslope", "Sediment_Yield_kgha"] = df_metric["Sediment_Yield_kg"] / (df_metric["Element_Area_m2"] / 10000)
-            df_metric.loc[df_metric.Element_Type=="Channel", "Rainfall_mm"] = 0.
-            df_metric.loc[df_metric.Element_Type=="Channel", "Outflow_mm"] = df_metric["Outflow_cum"] / df_metric["Contributing_Area_m2"] * 1000
-            df_metric.loc[df_metric.Element_Type=="Channel", "Inflow_mm"] = df_metric["Inflow_cum"] / df_metric["Contributing_Area_m2"] * 1000
-            df_metric.loc[df_metric.Element_Type=="Channel", "Total_Infil_mm"] = df_metric["Total_Infil_cum"] / df_metric["Contributing_Area_m2"] * 1000
-            df_metric.loc[df_metric.Element_Type=="Channel", "Sediment_Yield_kgha"] = df_metric["Sediment_Yield_kg"] / (df_metric["Contributing_Area_m2"] / 10000)
-
-            
-            tweet(f"    Converting units")
-            df_metric_english = unit_conversion(df_metric)
-            df_metric_english = df_metric_english.reindex(sorted(df_metric_english.columns), axis=1)
-
-            df_metric_english["CreationDate"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            df_metric_english["AGWAVersionAtCreation"] = AGWA_VERSION
-            df_metric_english["AGWAGDBVersionAtCreation"] = AGWAGDB_VERSION
-            df_metric_english["Status"] = "Complete"
-            df_metric_english.insert(0, "DelineationName", delineation_name)
-            df_metric_english.insert(1, "DiscretizationName", discretization_name)
-            df_metric_english.insert(2, "ParameterizationName", parameterization_name)
-            df_metric_english.insert(3, "SimulationName", simulation_name)
-            df_metric_english.insert(4, "OutFileName", out_name)
+            parts = [part.strip() for part in line.split(",")]
+            if len(parts) >= 3:
+                runs.append((parts[0], parts[2]))
+    if not runs:
+        raise Exception(f"Cannot proceed. \nNo runs were found in {runfile_abspath}.")
 
-    return df_metric_english
+    return runs
+
+
+def get_parameterization_name(par_abspath):
+    """Return the parameterization name written in the header of a parameter file, or None if it is not found. 
+    Called by read_simulation_results."""
+
+    if not os.path.exists(par_abspath):
+        return None
+    with open(par_abspath, "r") as par_file:
+        for line in par_file:
+            if "!  Parameterization" in line:
+                # the name follows the label, and may itself contain "Parameterization"
+                words = line.split(None, 2)
+                return words[2].strip() if len(words) > 2 else None
+            if line.strip().upper().startswith("BEGIN"):
+                return None
+
+
+def read_output_metrics(outfile_abspath):
+    """Read an output file and return its element results in metric units, with depths per unit area. 
+    Runs in a worker process for batch runs. Called by read_simulation_results."""
+
+    element_columns, tabular_columns = read_output_file(outfile_abspath)
+    df_block = pd.DataFrame(element_columns)
+    df_tabular = pd.DataFrame(tabular_columns)
+    df_metric = pd.merge(df_block, df_tabular, how="left", on=["Element_ID", "Element_Type"])
+    df_metric.loc[df_metric.Element_Type=="Hillslope", "Rainfall_mm"] = df_metric["Rainfall_cum"] / df_metric["Element_Area_m2"] * 1000
+    df_metric.loc[df_metric.Element_Type=="Hillslope", "Outflow_mm"] = df_metric["Outflow_cum"] / df_metric["Element_Area_m2"] * 1000
+    df_metric.loc[df_metric.Element_Type=="Hillslope", "Inflow_mm"] = df_metric["Inflow_cum"] / df_metric["Element_Area_m2"] * 1000
+    df_metric.loc[df_metric.Element_Type=="Hillslope", "Total_Infil_mm"] = df_metric["Total_Infil_cum"] / df_metric["Element_Area_m2"] * 1000
+    df_metric.loc[df_metric.Element_Type=="Hillslope", "Sediment_Yield_kgha"] = df_metric["Sediment_Yield_kg"] / (df_metric["Element_Area_m2"] / 10000)
+    df_metric.loc[df_metric.Element_Type=="Channel", "Rainfall_mm"] = 0.
+    df_metric.loc[df_metric.Element_Type=="Channel", "Outflow_mm"] = df_metric["Outflow_cum"] / df_metric["Contributing_Area_m2"] * 1000
+    df_metric.loc[df_metric.Element_Type=="Channel", "Inflow_mm"] = df_metric["Inflow_cum"] / df_metric["Contributing_Area_m2"] * 1000
+    df_metric.loc[df_metric.Element_Type=="Channel", "Total_Infil_mm"] = df_metric["Total_Infil_cum"] / df_metric["Contributing_Area_m2"] * 1000
+    df_metric.loc[df_metric.Element_Type=="Channel", "Sediment_Yield_kgha"] = df_metric["Sediment_Yield_kg"] / (df_metric["Contributing_Area_m2"] / 10000)
+
+    return df_metric
+
+
+# columns of the Tabular Summary of Element Hydrologic Components and their types
+TABULAR_COLUMNS = [
+    ('Element_ID', np.int64), ('Element_Type', str), ('Element_Area_m2', np.float64), 
+    ('Contributing_Area_m2', np.float64), ('Inflow_cum', np.float64), ('Rainfall_cum', np.float64), 
+    ('Outflow_cum', np.float64), ('Peak_Flow_mmhr', np.float64), ('Total_Infil_cum', np.float64), 
+    ('Initial_Water_Content', np.float64), ('Sediment_Yield_kg', np.float64)]
+TABULAR_SUMMARY_TITLE = b"Tabular Summary of Element Hydrologic Components"
+# lines of the element blocks that are read: the element lines, then the peak flow and peak sediment discharge lines
+ELEMENT_KEYWORDS = [(b" Plane Element  ", "Hillslope"), (b" Channel Elem.   ", "Channel"), 
+                    (b" Pond Element     ", "Pond")]
+PEAK_FLOW_KEYWORD = b"Peak flow = "
+PEAK_SEDIMENT_KEYWORD = b"Peak sediment discharge = "
 
 
 def read_tabular_data(filename):
     """Reads tabular data from the output file and returns a pandas DataFrame. Called by read_simulation_results."""
-    with open(filename) as f:
-        lines = f.readlines()    
-    start_index = 0
-    for i, line in enumerate(lines):
-        if "Tabular Summary of Element Hydrologic Components" in line:
-            start_index = i + 5 
-            break    
-    data = ''.join(lines[start_index:])
-    column_names = [
-        'Element_ID', 'Element_Type', 'Element_Area_m2', 'Contributing_Area_m2',
-        'Inflow_cum', 'Rainfall_cum', 'Outflow_cum',
-        'Peak_Flow_mmhr', 'Total_Infil_cum', 'Initial_Water_Content', 'Sediment_Yield_kg']    
-    df = pd.read_csv(io.StringIO(data), delim_whitespace=True, names=column_names)
-    df.loc[df.Element_Type=="Plane", "Element_Type"] = "Hillslope"
-    return df
+
+    return pd.DataFrame(read_output_file(filename)[1])
 
 
 def read_element(outfile_abspath):
     """Reads element data from the output file and returns a pandas DataFrame. Called by read_simulation_results."""
-    data = []
-    with open(outfile_abspath, "r") as outfile:
-        for i, line in enumerate(outfile):
-            # print(i, line)
-            if " Plane Element  " in line:
-                element_id = line.split()[-1]
-                element_type = "Hillslope"
-                read_block = True
-            elif " Channel Elem.   " in line:
-                element_id = line.split()[-1]
-                element_type = "Channel"
-                read_block = True
-            elif " Pond Element     " in line:
-                element_id = line.split()[-1]
-                element_type = "Pond"
-                read_block = True
-            else:
-                continue
-
-            while read_block:
-                block_line = next(outfile, False)
-                if not block_line:
-                    read_block = False
-                else:
-                    if "Peak flow = " in block_line:
-                        peak_flow_time = block_line.split()[-2]
-                    elif "Peak sediment discharge = " in block_line:
-                        peak_sediment_discharge_kgs = block_line.split()[-5]
-                        peak_sediment_time = block_line.split()[-2]
-                        read_block = False
-
-            # Append the row to the data list
-            data.append([int(element_id), element_type, float(peak_flow_time), float(peak_sediment_time), 
-                         float(peak_sediment_discharge_kgs)])
-
-    # Create a DataFrame from the data list
-    df = pd.DataFrame(data, columns=['Element_ID', "Element_Type", 'peak_flow_times', 'peak_sediment_times', 'peak_sediment_discharge_kgs'])
-
-    return df
-
- 
+
+    return pd.DataFrame(read_output_file(outfile_abspath)[0])
+
+
+def read_output_file(outfile_abspath):
+    """Read a K2 output file in one pass. The file is memory-mapped, the lines of the element blocks are found 
+    with vectorized searches over the bytes of the file, and the Tabular Summary of Element Hydrologic Components 
+    is parsed into typed columns. Returns two dictionaries of numpy arrays: the element peaks (Element_ID, 
+    Element_Type, peak_flow_times, peak_sediment_times, peak_sediment_discharge_kgs) and the tabular summary. 
+    Called by read_simulation_results."""
+
+    with open(outfile_abspath, "rb") as outfile:
+        if os.fstat(outfile.fileno()).st_size == 0:
+            return read_element_blocks(b"", 0), read_tabular_summary(b"", -1)
+        with mmap.mmap(outfile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            summary_start = data.find(TABULAR_SUMMARY_TITLE)
+            blocks_end = summary_start if summary_start >= 0 else len(data)
+            element_columns = read_element_blocks(data, blocks_end)
+            tabular_columns = read_tabular_summary(data, summary_start)
+            return element_columns, tabular_columns
+
+
+def read_element_blocks(data, blocks_end):
+    """Read the ID, type, and peak flow and sediment discharge of each element block. A block starts with the 
+    element line and ends with its peak sediment discharge line. The blocks are in the first blocks_end bytes of 
+    data. Called by read_output_file."""
+
+    view = np.frombuffer(data, dtype=np.uint8, count=blocks_end)
+    # find the keywords, all of which start with P or C after their leading spaces
+    candidates = np.flatnonzero((view == ord("P")) | (view == ord("C")))
+    keywords = [keyword for keyword, _ in ELEMENT_KEYWORDS] + [PEAK_FLOW_KEYWORD, PEAK_SEDIMENT_KEYWORD]
+    positions = [find_keyword(view, candidates, keyword) for keyword in keywords]
+    kinds = np.concatenate([np.full(len(found), kind) for kind, found in enumerate(positions)]).astype(np.int64)
+    positions = np.concatenate(positions).astype(np.int64)
+    order = np.argsort(positions, kind="stable")
+    kinds, positions = kinds[order], positions[order]
+    element_kinds = len(ELEMENT_KEYWORDS)
+    flow_kind, sediment_kind = element_kinds, element_kinds + 1
+
+    # the lines that hold the keywords, and the start and end of every word
+    newlines = np.flatnonzero(view == ord("\n"))
+    line_numbers = np.searchsorted(newlines, positions)
+    line_starts = np.where(line_numbers > 0, newlines[np.maximum(line_numbers - 1, 0)] + 1, 0)
+    line_ends = np.where(line_numbers < len(newlines), newlines[np.minimum(line_numbers, len(newlines) - 1)], 
+                         len(view))
+    is_space = np.r_[True, view <= ord(" "), True]
+    word_starts = np.flatnonzero(is_space[:-2] & ~is_space[1:-1])
+    word_ends = np.flatnonzero(~is_space[1:-1] & is_space[2:]) + 1
+    words = (view, word_starts, word_ends, line_starts, line_ends)
+
+    # blocks are usually complete (element, peak flow, and peak sediment discharge lines), which is checked so 
+    # they can be read at once. Otherwise the lines are followed one by one, skipping element lines within a block.
+    if (len(kinds) % 3 == 0 and np.all(kinds[0::3] < element_kinds) and np.all(kinds[1::3] == flow_kind) and 
+            np.all(kinds[2::3] == sediment_kind)):
+        element_lines = np.arange(0, len(kinds), 3)
+        flow_lines = element_lines + 1
+        sediment_lines = element_lines + 2
+    else:
+        element_lines, flow_lines, sediment_lines = [], [], []
+        block_start, flow_line = None, None
+        for line, kind in enumerate(kinds.tolist()):
+            if block_start is None:
+                if kind < element_kinds:
+                    block_start, flow_line = line, None
+            elif kind == flow_kind:
+                flow_line = line
+            elif kind == sediment_kind:
+                element_lines.append(block_start)
+                flow_lines.append(-1 if flow_line is None else flow_line)
+                sediment_lines.append(line)
+                block_start = None
+        element_lines = np.array(element_lines, dtype=np.int64)
+        flow_lines = np.array(flow_lines, dtype=np.int64)
+        sediment_lines = np.array(sediment_lines, dtype=np.int64)
+
+    # blocks without a peak flow line have no peak flow time
+    peak_flow_times = np.full(len(flow_lines), np.nan)
+    has_flow = flow_lines >= 0
+    peak_flow_times[has_flow] = get_line_words(words, flow_lines[has_flow], -2, np.float64)
+
+    element_types = np.array([element_type for _, element_type in ELEMENT_KEYWORDS], dtype=object)
+    return {"Element_ID": get_line_words(words, element_lines, -1, np.int64), 
+            "Element_Type": element_types[kinds[element_lines]],
+            "peak_flow_times": peak_flow_times,
+            "peak_sediment_times": get_line_words(words, sediment_lines, -2, np.float64),
+            "peak_sediment_discharge_kgs": get_line_words(words, sediment_lines, -5, np.float64)}
+
+
+def find_keyword(view, candidates, keyword):
+    """Return the positions of a keyword in view. candidates are the positions of the first letter of the keyword,
+    among others. Called by read_element_blocks."""
+
+    anchor = len(keyword) - len(keyword.lstrip())
+    starts = candidates - anchor
+    starts = starts[(starts >= 0) & (starts + len(keyword) <= len(view))]
+    for offset, character in enumerate(keyword):
+        starts = starts[view[starts + offset] == character]
+    return starts
+
+
+def get_line_words(words, lines, word_index, dtype):
+    """Return the word at word_index (counted from the end of the line) of each of the lines, converted to dtype. 
+    words holds the bytes, the word starts and ends, and the line starts and ends from read_element_blocks. 
+    The words are copied into a fixed-width byte string array, which numpy converts at once. 
+    Called by read_element_blocks."""
+
+    view, word_starts, word_ends, line_starts, line_ends = words
+    word_numbers = np.searchsorted(word_starts, line_ends[lines]) + word_index
+    if np.any(word_numbers < 0) or np.any(word_starts[np.maximum(word_numbers, 0)] < line_starts[lines]):
+        raise Exception("Cannot proceed. \nThe output file has element lines with fewer words than expected.")
+
+    starts, ends = word_starts[word_numbers], word_ends[word_numbers]
+    width = max(int((ends - starts).max(initial=1)), 1)
+    offsets = np.arange(width)
+    characters = view[np.minimum(starts[:, np.newaxis] + offsets, len(view) - 1)]
+    characters[offsets >= (ends - starts)[:, np.newaxis]] = 0
+    return np.ascontiguousarray(characters).view(f"S{width}").ravel().astype(dtype)
+
+
+def read_tabular_summary(data, summary_start):
+    """Read the rows of the tabular summary, which start 5 lines after its title and continue to the end of the 
+    file, into typed columns. Called by read_output_file."""
+
+    position = summary_start
+    for _ in range(5):
+        position = data.find(b"\n", position) + 1 if position >= 0 else -1
+    if summary_start < 0 or position <= 0 or not data[position:].strip():
+        return {name: np.array([], dtype=object if column_type is str else column_type) 
+                for name, column_type in TABULAR_COLUMNS}
+
+    df = pd.read_csv(io.BytesIO(data[position:]), sep=r"\s+", header=None, 
+                     names=[name for name, _ in TABULAR_COLUMNS], 
+                     dtype={name: column_type for name, column_type in TABULAR_COLUMNS})
+    columns = {name: df[name].to_numpy() for name, _ in TABULAR_COLUMNS}
+    columns["Element_Type"][columns["Element_Type"] == "Plane"] = "Hillslope"
+
+    return columns
+
+
 def unit_conversion(df_metric):
     """Convert units from metric to English units. Called by read_simulation_results."""
 
@@ -0,0 +1,179 @@
+import os
+import glob
+import json
+import arcpy
+import hashlib
+import numpy as np
+import pandas as pd
+import config
+
+# tables read from lookup_tables.gdb, keyed by (table path, fields, null value, index, modification time)
+_lookup_tables = {}
+# polygon indexes of lookup feature classes, keyed by (feature class path, name field, modification time)
+_polygon_indexes = {}
+
+
+def get_lookup_table_path(agwa_directory, table_name):
+    """Return the path of a table in the lookup_tables.gdb of the AGWA directory."""
+
+    return os.path.join(agwa_directory, "lookup_tables.gdb", table_name)
+
+
+def get_modification_time(table_path):
+    """Return the modification time of the geodatabase that holds the table. File geodatabase tables are stored
+    in several files of the .gdb folder, so the latest modification time of those files is used."""
+
+    database_directory = os.path.dirname(table_path)
+    return int(max([entry.stat().st_mtime for entry in os.scandir(database_directory)] + 
+                   [os.stat(database_directory).st_mtime]))
+
+
+def read_lookup_table(table_path, fields="*", null_value=None, index=None):
+    """Read a lookup table into a dataframe, indexed by the index field if given. 
+    The table is read once per process and read again only when its geodatabase is modified. When 
+    config.LOOKUP_TABLE_PARQUET_MIRROR is True, the table is also kept as a Parquet file and read from it.
+    Geometry tokens such as "SHAPE@WKT" can be listed in fields. A copy is returned, so callers may modify it."""
+
+    modification_time = get_modification_time(table_path)
+    fields_key = fields if isinstance(fields, str) else tuple(fields)
+    key = (os.path.normcase(os.path.abspath(table_path)), fields_key, null_value, index, modification_time)
+    if key not in _lookup_tables:
+        df = None
+        if config.LOOKUP_TABLE_PARQUET_MIRROR:
+            mirror_path = get_mirror_path(table_path, fields_key, null_value, modification_time)
+            try:
+                df = read_mirror(table_path, mirror_path, fields, null_value)
+            except (ImportError, OSError) as e:
+                arcpy.AddMessage(f"Parquet copy of {table_path} is not available. {e}")
+        if df is None:
+            df = read_table(table_path, fields, null_value)
+        if index is not None:
+            df = df.set_index(index, drop=False)
+        _lookup_tables[key] = df
+
+    return _lookup_tables[key].copy()
+
+
+def read_table(table_path, fields, null_value):
+    """Read a table from the geodatabase. Tables with geometry tokens are read with a search cursor."""
+
+    if not isinstance(fields, str) and any(field.upper().startswith("SHAPE@") for field in fields):
+        with arcpy.da.SearchCursor(table_path, fields) as cursor:
+            return pd.DataFrame([row for row in cursor], columns=fields)
+    return pd.DataFrame(arcpy.da.TableToNumPyArray(table_path, fields, null_value=null_value))
+
+
+def get_mirror_path(table_path, fields_key, null_value, modification_time):
+    """Return the path of the Parquet copy of a table for the given fields, null value, and modification time."""
+
+    mirror_directory = config.LOOKUP_TABLE_CACHE_DIRECTORY or os.path.join(
+        os.path.dirname(os.path.dirname(table_path)), "lookup_tables_cache")
+    read_key = hashlib.sha1(repr((fields_key, null_value)).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(mirror_directory, f"{os.path.basename(table_path)}_{read_key}_{modification_time}.parquet")
+
+
+def read_mirror(table_path, mirror_path, fields, null_value):
+    """Read the Parquet copy of a table, creating it from the geodatabase if it does not exist. Copies made 
+    before the geodatabase was modified are removed."""
+
+    if os.path.exists(mirror_path):
+        return pd.read_parquet(mirror_path)
+
+    df = read_table(table_path, fields, null_value)
+    os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+    for outdated_path in glob.glob(mirror_path.rsplit("_", 1)[0] + "_*.parquet"):
+        os.remove(outdated_path)
+    df.to_parquet(mirror_path + ".tmp", index=False)
+    os.replace(mirror_path + ".tmp", mirror_path)
+    return df
+
+
+def read_polygon_index(table_path, name_field):
+    """Read the polygons of a lookup feature class, such as nrcs_precipitation_distributions, into an index for 
+    finding the polygons that contain many points at once with find_polygons. The index holds the name, bounding 
+    box, and ring edges of each polygon, and the spatial reference of the feature class. It is built once per 
+    process and built again only when the geodatabase is modified."""
+
+    modification_time = get_modification_time(table_path)
+    key = (os.path.normcase(os.path.abspath(table_path)), name_field, modification_time)
+    if key not in _polygon_indexes:
+        df_polygons = read_lookup_table(table_path, [name_field, "SHAPE@JSON"])
+        names, bounding_boxes, edges = [], [], []
+        spatial_reference = None
+        for name, shape_json in df_polygons.itertuples(index=False):
+            if spatial_reference is None:
+                spatial_reference = arcpy.AsShape(shape_json, True).spatialReference
+            # the edges of all rings of a polygon, holes included, as x1, y1, x2, y2
+            rings = [np.asarray(ring, dtype=np.float64)[:, :2] for ring in json.loads(shape_json).get("rings", [])]
+            rings = [ring for ring in rings if len(ring) > 1]
+            if not rings:
+                continue
+            polygon_edges = np.concatenate([np.hstack([ring[:-1], ring[1:]]) for ring in rings])
+            names.append(name)
+            bounding_boxes.append((polygon_edges[:, 0].min(), polygon_edges[:, 1].min(), 
+                                   polygon_edges[:, 0].max(), polygon_edges[:, 1].max()))
+            edges.append(polygon_edges)
+        _polygon_indexes[key] = {"Names": names, "BoundingBoxes": np.array(bounding_boxes).reshape(-1, 4), 
+                                 "Edges": edges, "SpatialReference": spatial_reference}
+
+    return _polygon_indexes[key]
+
+
+def find_polygons(polygon_index, x, y, chunk_size=4000000):
+    """Return the name of the first polygon of the index that contains each point, or None for points outside all 
+    polygons. x and y are arrays in the spatial reference of the index. Points are first compared with the 
+    bounding boxes, and the points within a bounding box are tested by counting the edges crossed by a ray from 
+    each point (even-odd rule). The points are sorted by y, so each edge is only tested with the points within 
+    its y range. chunk_size limits the number of point-edge pairs tested at a time."""
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    found = np.full(len(x), -1, dtype=np.int64)
+    for polygon_number, ((x_min, y_min, x_max, y_max), edges) in enumerate(
+            zip(polygon_index["BoundingBoxes"], polygon_index["Edges"])):
+        candidates = np.flatnonzero((found < 0) & (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max))
+        if len(candidates) == 0:
+            continue
+        candidates = candidates[np.argsort(y[candidates], kind="stable")]
+        candidate_y = y[candidates]
+
+        # the points crossed by the ray of each edge are a contiguous range of the sorted points
+        x1, y1, x2, y2 = (edges[:, i] for i in range(4))
+        first_points = np.searchsorted(candidate_y, np.minimum(y1, y2), "left")
+        last_points = np.searchsorted(candidate_y, np.maximum(y1, y2), "left")
+        pair_counts = last_points - first_points
+        crossings = np.zeros(len(candidates), dtype=np.int64)
+        # the edges that cross points, split into groups of about chunk_size pairs
+        crossing_edges = np.flatnonzero(pair_counts)
+        group_starts = np.searchsorted(np.cumsum(pair_counts[crossing_edges]), 
+                                       np.arange(chunk_size, pair_counts.sum(), chunk_size))
+        for group in np.split(crossing_edges, np.unique(group_starts)):
+            if len(group) == 0:
+                continue
+            counts = pair_counts[group]
+            pair_edges = np.repeat(group, counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            pair_points = first_points[pair_edges] + offsets
+            px, py = x[candidates[pair_points]], candidate_y[pair_points]
+            ex1, ey1, ex2, ey2 = x1[pair_edges], y1[pair_edges], x2[pair_edges], y2[pair_edges]
+            crossed = px < (ex2 - ex1) * (py - ey1) / (ey2 - ey1) + ex1
+            crossings += np.bincount(pair_points[crossed], minlength=len(candidates))
+        found[candidates[crossings % 2 == 1]] = polygon_number
+
+    names = polygon_index["Names"]
+    return [names[i] if i >= 0 else None for i in found.tolist()]
+
+
+def clear_lookup_table_cache(agwa_directory=None):
+    """Forget the lookup tables read so far, only those of the given AGWA directory if one is given. 
+    Called when the AGWA directory of the workspace changes."""
+
+    if agwa_directory is None:
+        _lookup_tables.clear()
+        _polygon_indexes.clear()
+        return
+
+    database_directory = os.path.normcase(os.path.abspath(os.path.join(agwa_directory, "lookup_tables.gdb")))
+    for cache in (_lookup_tables, _polygon_indexes):
+        for key in [key for key in cache if os.path.dirname(key[0]) == database_directory]:
+            del cache[key]
@@ -8,6 +8,7 @@ from arcpy._mp import Table
 from collections import deque
 import arcpy.management  # Import statement added to provide intellisense in PyCharm
 import config
+import code_lookup_tables
 arcpy.env.parallelProcessingFactor = config.PARALLEL_PROCESSING_FACTOR
 
 
@@ -873,22 +874,17 @@ def calculate_stream_geometries(workspace, delineation_name, discretization_name
     arcpy.management.MakeTableView(parameters_channels_table, parameters_channels_table_view, expression)
 
     # Acquire channel width and depth coefficients and exponents from the hydraulic geometry relationship table
-    datafiles_directory = os.path.join(agwa_directory, "lookup_tables.gdb")
-    hgr_table = os.path.join(datafiles_directory, "HGR")
+    hgr_table = code_lookup_tables.get_lookup_table_path(agwa_directory, "HGR")
 
     width_coefficient = None
     width_exponent = None
     depth_coefficient = None
     depth_exponent = None
     fields = ["wCoef", "wExp", "dCoef", "dExp"]
-    name_field = arcpy.AddFieldDelimiters(workspace, "HGRNAME")
-    expression = "{0} = '{1}'".format(name_field, hydraulic_geometry_relationship)
-    with arcpy.da.SearchCursor(hgr_table, fields, expression) as cursor:
-        for row in cursor:
-            width_coefficient = row[0]
-            width_exponent = row[1]
-            depth_coefficient = row[2]
-            depth_exponent = row[3]
+    df_hgr = code_lookup_tables.read_lookup_table(hgr_table, ["HGRNAME"] + fields)
+    df_hgr = df_hgr[df_hgr.HGRNAME == hydraulic_geometry_relationship]
+    if not df_hgr.empty:
+        width_coefficient, width_exponent, depth_coefficient, depth_exponent = df_hgr[fields].values[-1].tolist()
 
     # Calculate side slopes first so they can be used to calculate bottom width of channel from bank full depth
     side_slope1 = 1
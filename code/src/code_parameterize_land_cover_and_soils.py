@@ -1,13 +1,34 @@
 import os
 import math
 import arcpy
+import shutil
+import hashlib
+import tempfile
+import contextlib
 import numpy as np
 import pandas as pd
 import arcpy.analysis
+import concurrent.futures
 from datetime import datetime
 import config
+import code_process_pool
+import code_lookup_tables
 arcpy.env.parallelProcessingFactor = config.PARALLEL_PROCESSING_FACTOR
 
+# gSSURGO tables used in soil parameterization: fields to read and the key each table is filtered on
+SOIL_TABLE_FIELDS = {
+    "component": (["cokey", "comppct_r", "mukey"], "mukey"),
+    "chorizon": (["cokey", "chkey", "hzname", "hzdept_r", "hzdepb_r", "ksat_r", "sandtotal_r", "silttotal_r", 
+                  "claytotal_r", "dbthirdbar_r", "partdensity", "sieveno10_r", "kwfact"], "cokey"),
+    "chtexturegrp": (["chkey", "chtgkey", "texture", "texdesc", "rvindicator"], "chkey"),
+    "chtexture": (["chtgkey", "texcl", "lieutex"], "chtgkey")}
+
+# field types of the soil results tables. To be safe, ComponentPercentage and HorizonThickness are set to DOUBLE.
+SOIL_RESULTS_TEXT_FIELDS = ["DelineationName", "ParameterizationName", "DiscretizationName", "HorizonName", 
+                            "Texture", "TextureClass", "TextureDesc", "CreationDate", "AGWAVersionAtCreation", 
+                            "AGWAGDBVersionAtCreation", "Status"]
+SOIL_RESULTS_LONG_FIELDS = ["MapUnitMukey", "ComponentCokey", "HorizonChkey", "HorizonNumber", "TextureGroupChtgkey"]
+
 
 def tweet(msg):
     """Produce a message for both arcpy and python"""
@@ -72,6 +93,121 @@ def parameterize(prjgdb, workspace, delineation_name, discretization_name, param
                                                   channel_type, AGWA_directory)
 
 
+def parameterize_scenarios(prjgdb, workspace, delineation_name, discretization_name, parameterization_names, 
+                           save_intermediate_outputs):
+    """Parameterize land cover and soils for several parameterizations of the same discretization that differ 
+    only in land cover, for example the pre-fire, burn severity, and treatment land covers of a post-fire study.
+    Each parameterization must be initialized in the metaParameterization table and use the same soils inputs.
+    The soils are intersected, queried, and weighted once, the land cover of each parameterization is weighted 
+    in a worker process, and all parameterizations are saved in one edit session.
+    functions called: extract_parameters, calculate_soil_parameters, weight_soil_parameters_by_area_fractions,
+    weight_land_cover_in_scratch_workspace, calculate_channel_parameters, prepare_soil_results"""
+
+    # Step 1. Extract parameters from the metadata tables and check that the soils inputs are the same
+    scenarios = {}
+    for parameterization_name in parameterization_names:
+        (max_thickness, max_horizons, land_cover, land_cover_lut, soil_layer_path, soils_database_path, 
+         AGWA_directory, channel_type) = extract_parameters(prjgdb, delineation_name, discretization_name, 
+                                                            parameterization_name)
+        soils_inputs = (max_thickness, max_horizons, soil_layer_path, soils_database_path, AGWA_directory)
+        if scenarios and soils_inputs != scenarios[parameterization_names[0]]["soils_inputs"]:
+            raise Exception(f"Parameterization '{parameterization_name}' does not use the same soils inputs as "
+                            f"parameterization '{parameterization_names[0]}'.")
+        scenarios[parameterization_name] = {"soils_inputs": soils_inputs, "land_cover": land_cover, 
+                                            "land_cover_lut": land_cover_lut, "channel_type": channel_type}
+    (max_thickness, max_horizons, soil_layer_path, soils_database_path, 
+     AGWA_directory) = scenarios[parameterization_names[0]]["soils_inputs"]
+
+    hillslope_table = os.path.join(workspace, "parameters_hillslopes")
+    channel_table = os.path.join(workspace, "parameters_channels")
+    for arcgis_table in [hillslope_table, channel_table]:
+        if not arcpy.Exists(arcgis_table):
+            raise Exception(f"The table '{os.path.basename(arcgis_table)}' does not exist in the workspace {workspace}.")
+
+    # Step 2. Get weighted soils once for all parameterizations
+    tweet("Intersecting soils with hillslopes.")
+    (df_intersections, df_horizon_parameters, df_weighted_by_horizon, 
+     df_weighted_by_component) = calculate_soil_parameters(workspace, delineation_name, discretization_name, 
+        soil_layer_path, soils_database_path, AGWA_directory, max_thickness, max_horizons, save_intermediate_outputs)
+
+    tweet("Calculating weighted soil parameters for each hillslope.")
+    df_soil = weight_soil_parameters_by_area_fractions(df_weighted_by_component, df_intersections)
+
+    # Step 3. Get weighted land cover of each parameterization in parallel
+    tweet(f"Intersecting {len(parameterization_names)} land covers with hillslopes.")
+    with code_process_pool.create_process_pool(len(parameterization_names)) as executor:
+        futures = {parameterization_name: executor.submit(weight_land_cover_in_scratch_workspace, workspace, 
+                        delineation_name, discretization_name, scenario["land_cover"], scenario["land_cover_lut"],
+                        AGWA_directory) 
+                   for parameterization_name, scenario in scenarios.items()}
+        df_covers = {parameterization_name: future.result() for parameterization_name, future in futures.items()}
+
+    # Step 4. Merge soils and land cover, then get channel parameters from the merged hillslope parameters
+    tweet("Calculating channel parameters.")
+    df_areas = pd.DataFrame(arcpy.da.TableToNumPyArray(hillslope_table, ["DelineationName", "DiscretizationName", 
+                                                                         "ParameterizationName", "HillslopeID", "Area"]))
+    for parameterization_name, scenario in scenarios.items():
+        df_soil_cover = pd.merge(df_soil, df_covers[parameterization_name], left_on="HillslopeID", 
+                                 right_on="HillslopeID", how="left")
+        df_area = df_areas[(df_areas["DelineationName"] == delineation_name) & 
+                           (df_areas["DiscretizationName"] == discretization_name) & 
+                           (df_areas["ParameterizationName"] == parameterization_name)][["HillslopeID", "Area"]]
+        df_hillslope_parameters = pd.merge(df_area, df_soil_cover, on="HillslopeID", how="left")
+        scenario["df_soil_cover"] = df_soil_cover
+        scenario["df_channel_parameters"] = calculate_channel_parameters(workspace, discretization_name, 
+            df_hillslope_parameters, scenario["channel_type"], AGWA_directory)
+        scenario["soil_results"] = prepare_soil_results(delineation_name, discretization_name, parameterization_name,
+            save_intermediate_outputs, df_horizon_parameters, df_weighted_by_horizon, df_weighted_by_component)
+
+    # Step 5. Save all parameterizations. Fields are added before the edit session, which does not allow schema 
+    # changes, so that either all parameterizations are saved or none.
+    tweet("Saving the parameterizations to the workspace geodatabase.")
+    for scenario in scenarios.values():
+        add_missing_fields(hillslope_table, scenario["df_soil_cover"].columns)
+        add_missing_fields(channel_table, scenario["df_channel_parameters"].columns, text_fields=["Woolhiser"])
+        for table_name, df in scenario["soil_results"]:
+            create_soil_results_table(workspace, table_name, df.columns)
+
+    with arcpy.da.Editor(workspace):
+        for parameterization_name, scenario in scenarios.items():
+            where_clause = get_parameterization_where_clause(workspace, delineation_name, discretization_name, 
+                                                             parameterization_name)
+            for table_name, df in scenario["soil_results"]:
+                write_dataframe_to_table(os.path.join(workspace, table_name), df, where_clause, 
+                                         text_fields=SOIL_RESULTS_TEXT_FIELDS, long_fields=SOIL_RESULTS_LONG_FIELDS)
+            write_dataframe_to_table(hillslope_table, scenario["df_soil_cover"], where_clause, id_field="HillslopeID")
+            write_dataframe_to_table(channel_table, scenario["df_channel_parameters"], where_clause, 
+                                     id_field="ChannelID", text_fields=["Woolhiser"])
+
+
+def weight_land_cover_in_scratch_workspace(workspace, delineation_name, discretization_name, land_cover, 
+                                           land_cover_lut, agwa_directory):
+    """Intersect land cover with hillslopes and weight the land cover parameters, writing the intermediate outputs 
+    to a scratch geodatabase of its own so that several land covers can be processed in parallel worker processes.
+    Called in parameterize_scenarios function."""
+
+    with create_scratch_workspace("agwa_land_cover_") as scratch_workspace:
+        return intersect_weight_land_cover_by_area(workspace, delineation_name, discretization_name, land_cover,
+                                                   land_cover_lut, agwa_directory, scratch_workspace)
+
+
+@contextlib.contextmanager
+def create_scratch_workspace(prefix):
+    """Create a file geodatabase in a new temporary folder for the intermediate outputs of a worker process, and 
+    set it as the scratch workspace. The folder is deleted on exit.
+    Called in weight_land_cover_in_scratch_workspace and intersect_soil_with_hillslope_tile functions."""
+
+    scratch_directory = tempfile.mkdtemp(prefix=prefix)
+    try:
+        arcpy.CreateFileGDB_management(scratch_directory, "scratch.gdb")
+        scratch_workspace = os.path.join(scratch_directory, "scratch.gdb")
+        with arcpy.EnvManager(scratchWorkspace=scratch_workspace):
+            yield scratch_workspace
+    finally:
+        arcpy.ClearWorkspaceCache_management()
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+
+
 def parameterize_hillslopes(workspace, delineation_name, discretization_name, parameterization_name, 
                             soil_layer_path, soils_database_path, agwa_directory, max_thickness,
                             max_horizons, land_cover, land_cover_lut, save_intermediate_outputs):
@@ -80,12 +216,12 @@ def parameterize_hillslopes(workspace, delineation_name, discretization_name, pa
 
     # Step 1. intersect soils and land cover with hillslopes
     tweet("Intersecting soils with hillslopes.")
-    intersect_feature_class = intersect_soils(workspace, delineation_name, discretization_name, parameterization_name,
+    df_intersections = intersect_soils(workspace, delineation_name, discretization_name, parameterization_name,
         soil_layer_path, soils_database_path, agwa_directory, max_thickness, max_horizons, save_intermediate_outputs)
     
     tweet("Calculating weighted soil parameters for each hillslope.")
     df_soil = weight_hillsope_parameters_by_area_fractions(workspace, delineation_name, discretization_name, 
-                parameterization_name, intersect_feature_class)
+                parameterization_name, df_intersections)
     
     # Step 2. intersect land cover with hillslopes
     tweet("Intersecting land cover with hillslopes.")
@@ -98,29 +234,9 @@ def parameterize_hillslopes(workspace, delineation_name, discretization_name, pa
     arcgis_table = os.path.join(workspace, "parameters_hillslopes")
     if not arcpy.Exists(arcgis_table):
         raise Exception(f"The table 'parameters_hillslopes' does not exist in the workspace {workspace}.")
-    else:        
-        for column in df_soil_cover.columns:
-            if column not in [f.name for f in arcpy.ListFields(arcgis_table)]:
-                arcpy.AddField_management(arcgis_table, column, "DOUBLE")
-
-    fields = [field.name for field in arcpy.ListFields(arcgis_table)]
-    with arcpy.da.UpdateCursor(arcgis_table, fields) as cursor:
-        for row in cursor:
-            # Check conditions
-            if (row[cursor.fields.index("DelineationName")] == delineation_name and 
-                row[cursor.fields.index("DiscretizationName")] == discretization_name and 
-                row[cursor.fields.index("ParameterizationName")] == parameterization_name):
-
-                hillslope_id = row[cursor.fields.index("HillslopeID")]
-
-                # Iterate through DataFrame columns to update corresponding fields in the row
-                for column in df_soil_cover.columns:
-                    if column not in ["HillslopeID"]:  # Assuming you don't want to update HillslopeID
-                        df_value = df_soil_cover.loc[df_soil_cover["HillslopeID"] == hillslope_id, column].values
-                        if df_value.size > 0:
-                            # Update the row's field directly by name
-                            row[cursor.fields.index(column)] = df_value[0]
-            cursor.updateRow(row)
+    where_clause = get_parameterization_where_clause(arcgis_table, delineation_name, discretization_name, 
+                                                     parameterization_name)
+    write_dataframe_to_table(arcgis_table, df_soil_cover, where_clause, id_field="HillslopeID")
 
 
 def parameterize_channels(workspace, delineation_name, discretization_name, parameterization_name, 
@@ -128,8 +244,36 @@ def parameterize_channels(workspace, delineation_name, discretization_name, para
     """Parameterize channel elements. Note: it is important to make sure parameters match in this function.
     Called in parameterize function."""    
 
+    tweet("Calculating channel parameters.")
+    # Get channel parameters based on weighted parameters from adjacent hillslopes (17 parameters in total)
+    df_hillslope_parameters = pd.DataFrame(arcpy.da.TableToNumPyArray(
+                                            os.path.join(workspace, "parameters_hillslopes"), "*"))
+    df_hillslope_parameters = df_hillslope_parameters[
+                                    (df_hillslope_parameters['DelineationName'] == delineation_name) & 
+                                    (df_hillslope_parameters['DiscretizationName'] == discretization_name) & 
+                                    (df_hillslope_parameters['ParameterizationName'] == parameterization_name)]
+                                                
+    df_channel_parameters = calculate_channel_parameters(workspace, discretization_name, df_hillslope_parameters,
+                                                         channel_type, agwa_directory)
+
+    tweet("Saving channel results to the workspace geodatabase.")
+    arcgis_table = os.path.join(workspace, "parameters_channels")
+    if not arcpy.Exists(arcgis_table):
+        raise Exception(f"The table 'parameters_channels' does not exist in the workspace {workspace}.")
+    where_clause = get_parameterization_where_clause(arcgis_table, delineation_name, discretization_name, 
+                                                     parameterization_name)
+    write_dataframe_to_table(arcgis_table, df_channel_parameters, where_clause, id_field="ChannelID", 
+                             text_fields=["Woolhiser"])
+
+
+def calculate_channel_parameters(workspace, discretization_name, df_hillslope_parameters, channel_type, 
+                                 agwa_directory):
+    """Calculate channel parameters from the parameters of the adjacent hillslopes and the channel type.
+    df_hillslope_parameters holds the hillslope parameters of one parameterization, including Area.
+    Called in parameterize_channels and parameterize_scenarios functions."""
+
     def get_channel_parameters_based_on_adj_hillslopes(workspace, discretization_name, df_hillslope_parameters):
-        """Get channel parameters based on adjacent hillslopes. Called in parameterize_channels function.
+        """Get channel parameters based on adjacent hillslopes. Called in calculate_channel_parameters function.
         returned 17 parameters"""
 
         parameters = ["Ksat", "Manning", "Pave", "Imperviousness", "SMax", "CV", "G", "Porosity", "Rock",
@@ -138,14 +282,17 @@ def parameterize_channels(workspace, delineation_name, discretization_name, para
         df_channels = pd.DataFrame(arcpy.da.TableToNumPyArray(
             os.path.join(workspace, f"{discretization_name}_channels"), ["ChannelID"]))
 
-        for channel_id in df_channels.ChannelID:
-            hillslope_ids = [channel_id-1, channel_id-2, channel_id-3]
-            hillslope_ids = [hid for hid in hillslope_ids if hid in df_hillslope_parameters.HillslopeID.values]
-            df_hillslopes_filtered = df_hillslope_parameters[df_hillslope_parameters.HillslopeID.isin(hillslope_ids)]
-            total_area = df_hillslopes_filtered.Area.sum()
-            for parameter in parameters:
-                weighted_value = (df_hillslopes_filtered[parameter] * df_hillslopes_filtered.Area).sum() / total_area
-                df_channels.loc[df_channels.ChannelID == channel_id, parameter] = weighted_value
+        # The adjacent hillslopes of a channel have IDs ChannelID-1, ChannelID-2, and ChannelID-3, and ChannelIDs 
+        # end in 4, so the channel of a hillslope is found from the last digit of its HillslopeID.
+        hillslope_ids = df_hillslope_parameters.HillslopeID
+        adjacent = hillslope_ids.mod(10).isin([1, 2, 3])
+        df_adjacent = df_hillslope_parameters.loc[adjacent, parameters + ["Area"]]
+        channel_ids = hillslope_ids[adjacent] - hillslope_ids[adjacent].mod(10) + 4
+
+        weighted_sums = df_adjacent[parameters].mul(df_adjacent.Area, axis=0).groupby(channel_ids).sum()
+        total_areas = df_adjacent.Area.groupby(channel_ids).sum()
+        df_weighted = weighted_sums.div(total_areas, axis=0)
+        df_channels = df_channels.join(df_weighted, on="ChannelID")
 
         # Weight the texture factions, so that they sum to 1. When the sum of Sand, Silt, and Clay is 0, set them to 0.
         df_channels[["Sand", "Clay", "Silt"]] = df_channels[["Sand", "Clay", "Silt"]].div(
@@ -153,15 +300,7 @@ def parameterize_channels(workspace, delineation_name, discretization_name, para
         
         return df_channels
 
-    tweet("Calculating channel parameters.")
     # Get channel parameters based on weighted parameters from adjacent hillslopes (17 parameters in total)
-    df_hillslope_parameters = pd.DataFrame(arcpy.da.TableToNumPyArray(
-                                            os.path.join(workspace, "parameters_hillslopes"), "*"))
-    df_hillslope_parameters = df_hillslope_parameters[
-                                    (df_hillslope_parameters['DelineationName'] == delineation_name) & 
-                                    (df_hillslope_parameters['DiscretizationName'] == discretization_name) & 
-                                    (df_hillslope_parameters['ParameterizationName'] == parameterization_name)]
-                                                
     df_channel_parameters = get_channel_parameters_based_on_adj_hillslopes(workspace, discretization_name, 
                                                                            df_hillslope_parameters)
 
@@ -169,8 +308,8 @@ def parameterize_channels(workspace, delineation_name, discretization_name, para
     df_channel_parameters = df_channel_parameters.assign(Woolhiser="Yes")
 
     # Modify 3 parameters (ksat, manning, and pave) based on the user selected input channel type. 
-    df_channel_type = pd.DataFrame(arcpy.da.TableToNumPyArray(
-        os.path.join(agwa_directory, "lookup_tables.gdb", "channel_types"), "*", null_value=-9999))
+    df_channel_type = code_lookup_tables.read_lookup_table(
+        code_lookup_tables.get_lookup_table_path(agwa_directory, "channel_types"), null_value=-9999)
     channel_type_row = df_channel_type[df_channel_type.Channel_Type == channel_type][["Ksat", "Manning", "Pave"]]
     if not channel_type_row.empty:
         ksat, manning, pave = channel_type_row.values[0]
@@ -179,50 +318,83 @@ def parameterize_channels(workspace, delineation_name, discretization_name, para
     else:
         tweet(f"Channel type {channel_type} not found in the Lookup table.")
 
-    tweet("Saving channel results to the workspace geodatabase.")
-    arcgis_table = os.path.join(workspace, "parameters_channels")
-    if not arcpy.Exists(arcgis_table):
-        raise Exception(f"The table 'parameters_channels' does not exist in the workspace {workspace}.")
+    return df_channel_parameters
+
+
+def get_parameterization_where_clause(table, delineation_name, discretization_name, parameterization_name):
+    """Return the where clause that selects the rows of one parameterization in the parameter tables. Field names
+    are delimited for the workspace of the table, and quotes in the names are doubled."""
+
+    conditions = []
+    for field, value in [("DelineationName", delineation_name), ("DiscretizationName", discretization_name), 
+                         ("ParameterizationName", parameterization_name)]:
+        value = str(value).replace("'", "''")
+        conditions.append(f"{arcpy.AddFieldDelimiters(table, field)} = '{value}'")
+
+    return " AND ".join(conditions)
+
+
+def write_dataframe_to_table(table, df, where_clause, id_field=None, text_fields=(), long_fields=()):
+    """Write a dataframe to a geodatabase table, adding the fields that do not exist yet. Fields are DOUBLE 
+    unless listed in text_fields or long_fields. Only the rows selected by where_clause are touched.
+    With id_field, each selected row is updated from the dataframe row with the same ID, looked up in a 
+    dictionary built once. Without id_field, the selected rows are replaced by the rows of the dataframe.
+    Called in parameterize_hillslopes, parameterize_channels, and save_results functions."""
+
+    add_missing_fields(table, df.columns, text_fields, long_fields)
+
+    if id_field:
+        columns = [column for column in df.columns if column != id_field]
+        df_unique = df.drop_duplicates(subset=id_field)
+        rows_by_id = dict(zip(df_unique[id_field], df_unique[columns].itertuples(index=False, name=None)))
+        with arcpy.da.UpdateCursor(table, [id_field] + columns, where_clause) as cursor:
+            for row in cursor:
+                values = rows_by_id.get(row[0])
+                if values is not None:
+                    cursor.updateRow((row[0],) + values)
     else:
-        for column in df_channel_parameters.columns:
-            if column not in [f.name for f in arcpy.ListFields(arcgis_table)]:
-                if column in ["Woolhiser"]:
-                    arcpy.AddField_management(arcgis_table, column, "TEXT")
-                else:   
-                    arcpy.AddField_management(arcgis_table, column, "DOUBLE")
-    
-    fields = [field.name for field in arcpy.ListFields(arcgis_table)]
-    with arcpy.da.UpdateCursor(arcgis_table, fields) as cursor:
-        for row in cursor:
-            if (row[cursor.fields.index("DelineationName")] == delineation_name and 
-                row[cursor.fields.index("DiscretizationName")] == discretization_name and 
-                row[cursor.fields.index("ParameterizationName")] == parameterization_name):
-
-                channel_id = row[cursor.fields.index("ChannelID")]
-                for column in df_channel_parameters.columns:
-                    if column not in ["ChannelID"]:
-                        df_value = df_channel_parameters.loc[
-                            df_channel_parameters["ChannelID"] == channel_id, column].values
-                        if df_value.size > 0:
-                            row[cursor.fields.index(column)] = df_value[0]
-                cursor.updateRow(row)
+        with arcpy.da.UpdateCursor(table, ["OID@"], where_clause) as cursor:
+            for _ in cursor:
+                cursor.deleteRow()
+        with arcpy.da.InsertCursor(table, df.columns.tolist()) as cursor:
+            for row in df.itertuples(index=False, name=None):
+                cursor.insertRow(row)
+
+
+def add_missing_fields(table, columns, text_fields=(), long_fields=()):
+    """Add the columns that are not fields of the table yet. Fields are DOUBLE unless listed in text_fields or 
+    long_fields. Called in write_dataframe_to_table and parameterize_scenarios functions."""
+
+    existing_fields = [field.name.lower() for field in arcpy.ListFields(table)]
+    for column in columns:
+        if column.lower() not in existing_fields:
+            if column in text_fields:
+                arcpy.AddField_management(table, column, "TEXT")
+            elif column in long_fields:
+                arcpy.AddField_management(table, column, "LONG")
+            else:
+                arcpy.AddField_management(table, column, "DOUBLE")
 
 
 def intersect_weight_land_cover_by_area(workspace, delineation_name, discretization_name, land_cover, land_cover_lut, 
-                                        agwa_directory):
+                                        agwa_directory, scratch_workspace=None):
 
     """Intersect land cover with hillslopes and calculate weighted parameters for each hillslope.
+    Intermediate outputs are written to scratch_workspace, which defaults to the workspace.
     called in parameterize function."""
 
+    if scratch_workspace is None:
+        scratch_workspace = workspace
+
     # test if land cover needs a buffer
     watershed_feature_class = os.path.join(workspace, f"{delineation_name}")
     buffer_size = is_raster_larger_and_buffer(land_cover, watershed_feature_class)
     if buffer_size:
-        watershed_buffer = os.path.join(workspace, f"{delineation_name}_buffer")
+        watershed_buffer = os.path.join(scratch_workspace, f"{delineation_name}_buffer")
         if not arcpy.Exists(watershed_buffer):
             arcpy.analysis.Buffer(watershed_feature_class, watershed_buffer, f"{buffer_size} Meters", 
                                 "FULL", "ROUND", "NONE", None, "PLANAR")        
-        clipped_lc_raster = os.path.join(workspace, f"landcover_clipped")
+        clipped_lc_raster = os.path.join(scratch_workspace, f"landcover_clipped")
         if arcpy.Exists(clipped_lc_raster):
             arcpy.Delete_management(clipped_lc_raster)
             tweet(f"Clipping land cover raster.")
@@ -234,15 +406,15 @@ def intersect_weight_land_cover_by_area(workspace, delineation_name, discretizat
     sr1 = arcpy.Describe(clipped_lc_raster).spatialReference
     sr2 = arcpy.Describe(watershed_feature_class).spatialReference
     if sr1.name != sr2.name:
-        prj_lc_raster = os.path.join(workspace, f"{os.path.basename(clipped_lc_raster)}_prj")
+        prj_lc_raster = os.path.join(scratch_workspace, f"{os.path.basename(clipped_lc_raster)}_prj")
         arcpy.management.ProjectRaster(clipped_lc_raster, prj_lc_raster, sr2)
     else:
         prj_lc_raster = clipped_lc_raster
 
     # convert land cover raster to polygon, then intersect with hillslopes
     hillslope_feature_class = os.path.join(workspace, f"{discretization_name}_hillslopes")
-    land_cover_feature_class = os.path.join(workspace, f"{discretization_name}_land_cover")
-    intersect_feature_class = os.path.join(workspace, f"{discretization_name}_land_cover_PairwiseIntersect")
+    land_cover_feature_class = os.path.join(scratch_workspace, f"{discretization_name}_land_cover")
+    intersect_feature_class = os.path.join(scratch_workspace, f"{discretization_name}_land_cover_PairwiseIntersect")
 
     if arcpy.Exists(land_cover_feature_class):
         arcpy.Delete_management(land_cover_feature_class) ## delete this when testing is done
@@ -254,8 +426,8 @@ def intersect_weight_land_cover_by_area(workspace, delineation_name, discretizat
     arcpy.analysis.PairwiseIntersect(f"'{land_cover_feature_class}'; '{hillslope_feature_class}'", 
                                      intersect_feature_class, "ALL", None, "INPUT")
     
-    df_cover_lut = pd.DataFrame(arcpy.da.TableToNumPyArray(
-        os.path.join(agwa_directory, "lookup_tables.gdb", land_cover_lut), "*"))
+    df_cover_lut = code_lookup_tables.read_lookup_table(
+        code_lookup_tables.get_lookup_table_path(agwa_directory, land_cover_lut))
 
     cover_lut_fields = ["CLASS", "NAME", "COVER", "INT", "N", "IMPERV"]
     df_cover_lut = df_cover_lut[cover_lut_fields]
@@ -287,36 +459,72 @@ def intersect_soils(workspace, delineation_name, discretization_name, parameteri
                     soil_gdb, agwa_directory, max_thickness, max_horizons, save_intermediate_outputs):
 
     """Intersect soils with gSSURGO tables and query parameters for each soil component, horizon, and texture.
-    Outputs include tables that are saved to the workspace geodatabase. Called in parameterize function."""
+    Outputs include tables that are saved to the workspace geodatabase. Called in parameterize function.
+    Returns the area of each soil map unit within each hillslope (HillslopeID, MUKEY, Shape_Area)."""
+
+    (df_intersections, df_horizon_parameters, df_weighted_by_horizon, 
+     df_weighted_by_component) = calculate_soil_parameters(workspace, delineation_name, discretization_name, 
+        soil_layer_path, soil_gdb, agwa_directory, max_thickness, max_horizons, save_intermediate_outputs)
+
+    save_results(workspace, delineation_name, discretization_name, parameterization_name, save_intermediate_outputs,
+                 df_horizon_parameters, df_weighted_by_horizon, df_weighted_by_component)
+    
+    return df_intersections
+
+
+def calculate_soil_parameters(workspace, delineation_name, discretization_name, soil_layer_path, soil_gdb, 
+                              agwa_directory, max_thickness, max_horizons, save_intermediate_outputs):
+    """Intersect soils with hillslopes and calculate the soil parameters of each map unit. Nothing is saved.
+    Returns df_intersections, df_horizon_parameters, df_weighted_by_horizon, and df_weighted_by_component. 
+    The horizon dataframes are None when the parameters come from the soil parameter lookup.
+    Called in intersect_soils and parameterize_scenarios functions."""
             
     # Step 1: Intersect soils with hillslopes
-    intersect_feature_class = intersect_soil_with_hillslopes(soil_layer_path, delineation_name, discretization_name, workspace)
+    df_intersections = intersect_soil_with_hillslopes(soil_layer_path, delineation_name, discretization_name, workspace)
     
     # Step 2: Load tables       
     df_mapunit, df_component, df_horizon, df_texture_group, df_texture, df_kin_lut = load_tables(
-        soil_gdb, agwa_directory, intersect_feature_class)    
-
-    # Step 3: Query soil parameters
-    df_horizon_parameters = query_soil_parameters(df_mapunit, df_component, df_horizon,
-         df_texture_group, df_texture, df_kin_lut, max_thickness, max_horizons)
+        soil_gdb, agwa_directory, df_intersections)    
+
+    # Step 3: Use the soil parameter lookup built by build_soil_parameter_lookup, if any. 
+    # The horizon tables are not in the lookup, so it is not used when intermediate outputs are saved.
+    df_weighted_by_component = None
+    if not save_intermediate_outputs:
+        df_weighted_by_component = lookup_soil_parameters(soil_gdb, agwa_directory, df_mapunit.mukey.astype(str).unique(),
+                                                          df_kin_lut, max_thickness, max_horizons)
+    if df_weighted_by_component is not None:
+        tweet("Soil parameters found in the soil parameter lookup.")
+        df_horizon_parameters, df_weighted_by_horizon = None, None
+    else:
+        # Step 4: Query soil parameters
+        df_horizon_parameters = query_soil_parameters(df_mapunit, df_component, df_horizon,
+            df_texture_group, df_texture, df_kin_lut, max_thickness, max_horizons)
 
-    # Step 4: Calculate weighted soil parameters
-    df_weighted_by_horizon, df_weighted_by_component = calculate_weighted_hillslope_soil_parameters(df_horizon_parameters)
+        # Step 5: Calculate weighted soil parameters
+        df_weighted_by_horizon, df_weighted_by_component = calculate_weighted_hillslope_soil_parameters(df_horizon_parameters)
 
-    # Step 5: Save results
-    save_results(workspace, delineation_name, discretization_name, parameterization_name, save_intermediate_outputs,
-                 df_horizon_parameters, df_weighted_by_horizon, df_weighted_by_component)
-    
-    return intersect_feature_class
+    return df_intersections, df_horizon_parameters, df_weighted_by_horizon, df_weighted_by_component
 
 
-def intersect_soil_with_hillslopes(soil_layer_path, delineation_name, discretization_name,workspace):
-    """Intersect soil with hillslopes."""
+def intersect_soil_with_hillslopes(soil_layer_path, delineation_name, discretization_name, workspace):
+    """Intersect soil with hillslopes. Returns a dataframe with the area of each soil map unit within each 
+    hillslope (HillslopeID, MUKEY, Shape_Area).
+    When the soil layer is a raster and config.SOIL_AREA_FRACTION_METHOD is "Raster", the areas are 
+    cross-tabulated directly on the raster grid and no soil polygons or intersection feature class are created.
+    When config.SOIL_INTERSECTION_TILE_SIZE is set, the hillslopes are processed in tiles in worker processes."""
 
     # convert soil raster to polygon
     watershed_feature_class = os.path.join(workspace, f"{delineation_name}")
+    hillslope_feature_class = os.path.join(workspace, f"{discretization_name}_hillslopes")
+    tiled = config.SOIL_INTERSECTION_TILE_SIZE > 0
     desc = arcpy.Describe(soil_layer_path)
-    if desc.dataType == "RasterDataset":
+    if desc.dataType == "RasterDataset" and config.SOIL_AREA_FRACTION_METHOD == "Raster":
+        soil_raster = prepare_soil_raster(soil_layer_path, watershed_feature_class, delineation_name, workspace)
+        if tiled:
+            return intersect_soil_with_hillslope_tiles(soil_raster, hillslope_feature_class, "Raster")
+        hillslope_raster = os.path.join(workspace, f"{discretization_name}_hillslopes_soil_grid")
+        return tabulate_soil_raster_by_hillslopes(soil_raster, hillslope_feature_class, hillslope_raster)
+    elif desc.dataType == "RasterDataset":
         soil_feature_class = convert_soil_raster_to_polygon(soil_layer_path, watershed_feature_class, 
                                                             delineation_name, workspace)
         soil_feature_class_name = os.path.basename(soil_feature_class)    
@@ -327,7 +535,10 @@ def intersect_soil_with_hillslopes(soil_layer_path, delineation_name, discretiza
         soil_feature_class = soil_layer_path
         soil_feature_class_name = os.path.basename(soil_feature_class).replace(".shp", "")
 
-    hillslope_feature_class = os.path.join(workspace, f"{discretization_name}_hillslopes")
+    if tiled:
+        tweet(f"Intersecting {soil_feature_class_name} with {discretization_name}_hillslopes in tiles.")
+        return intersect_soil_with_hillslope_tiles(soil_feature_class, hillslope_feature_class, "Polygon")
+
     intersect_feature_class = os.path.join(workspace, 
                                 f"{discretization_name}_{soil_feature_class_name}_PairwiseIntersect")
     if arcpy.Exists(intersect_feature_class):
@@ -336,38 +547,380 @@ def intersect_soil_with_hillslopes(soil_layer_path, delineation_name, discretiza
     tweet(f"Intersecting {soil_feature_class_name} with {discretization_name}_hillslopes.")
     arcpy.analysis.PairwiseIntersect(f"'{soil_feature_class}'; '{hillslope_feature_class}'", 
                                     intersect_feature_class, "ALL", None, "INPUT")
+    df_intersections = pd.DataFrame(arcpy.da.TableToNumPyArray(intersect_feature_class, 
+                                                               ["HillslopeID", "MUKEY", "Shape_Area"]))
+    
+    return df_intersections
+
+
+def intersect_soil_with_hillslope_tiles(soil_layer, hillslope_feature_class, method):
+    """Calculate the area of each soil map unit within each hillslope tile by tile. The hillslopes are split
+    into tiles of consecutive HillslopeIDs, which follow the channel network, and each tile is processed in a 
+    worker process. A hillslope is never split between tiles, so the result is the same as processing all 
+    hillslopes at once. With the "Polygon" method, the soil layer is the soil feature class and only the 
+    intersection is tiled; with the "Raster" method, each tile cross-tabulates its own window of the soil raster.
+    Called in intersect_soil_with_hillslopes function."""
+
+    hillslope_ids = np.sort(arcpy.da.TableToNumPyArray(hillslope_feature_class, ["HillslopeID"])["HillslopeID"])
+    number_of_tiles = max(code_process_pool.get_worker_count(), 
+                          math.ceil(len(hillslope_ids) / config.SOIL_INTERSECTION_TILE_SIZE))
+    tiles = [tile for tile in np.array_split(hillslope_ids, number_of_tiles) if len(tile) > 0]
+
+    tweet(f"Processing {len(hillslope_ids)} hillslopes in {len(tiles)} tiles.")
+    with code_process_pool.create_process_pool(len(tiles)) as executor:
+        futures = [executor.submit(intersect_soil_with_hillslope_tile, soil_layer, hillslope_feature_class, 
+                                   int(tile[0]), int(tile[-1]), method) for tile in tiles]
+        df_intersections = pd.concat([future.result() for future in futures], ignore_index=True)
+
+    return df_intersections
+
+
+def intersect_soil_with_hillslope_tile(soil_layer, hillslope_feature_class, first_hillslope_id, last_hillslope_id, 
+                                       method):
+    """Calculate the area of each soil map unit within the hillslopes whose HillslopeID is between 
+    first_hillslope_id and last_hillslope_id. Intermediate outputs are written to a scratch workspace of the worker
+    process. Called in intersect_soil_with_hillslope_tiles function."""
+
+    where_clause = f"HillslopeID >= {first_hillslope_id} AND HillslopeID <= {last_hillslope_id}"
+    with create_scratch_workspace("agwa_soil_tile_") as scratch_workspace:
+        hillslope_tile = os.path.join(scratch_workspace, "hillslopes")
+        arcpy.analysis.Select(hillslope_feature_class, hillslope_tile, where_clause)
+        if method == "Raster":
+            return tabulate_soil_raster_by_hillslopes(soil_layer, hillslope_tile, 
+                                                      os.path.join(scratch_workspace, "hillslopes_soil_grid"))
+
+        intersect_feature_class = os.path.join(scratch_workspace, "soil_PairwiseIntersect")
+        arcpy.analysis.PairwiseIntersect(f"'{soil_layer}'; '{hillslope_tile}'", intersect_feature_class, 
+                                         "ALL", None, "INPUT")
+        return pd.DataFrame(arcpy.da.TableToNumPyArray(intersect_feature_class, 
+                                                       ["HillslopeID", "MUKEY", "Shape_Area"]))
+
+
+def tabulate_soil_raster_by_hillslopes(soil_raster, hillslope_feature_class, hillslope_raster):
+    """Calculate the area of each soil map unit within each hillslope directly from the soil raster.
+    The hillslopes are rasterized onto the soil raster grid (saved as hillslope_raster), and the two label 
+    rasters are cross-tabulated. Unlike the polygon intersection, the areas are not affected by polygon 
+    simplification. Called in intersect_soil_with_hillslopes and intersect_soil_with_hillslope_tile functions."""
+
+    if arcpy.Exists(hillslope_raster):
+        arcpy.Delete_management(hillslope_raster)
+
+    # snap to the soil raster so that both rasters share the same cells
+    tweet(f"Rasterizing {os.path.basename(hillslope_feature_class)} on the soil raster grid.")
+    soil_raster_desc = arcpy.Describe(soil_raster)
+    with arcpy.EnvManager(snapRaster=soil_raster, extent=arcpy.Describe(hillslope_feature_class).extent,
+                          outputCoordinateSystem=soil_raster_desc.spatialReference):
+        arcpy.conversion.PolygonToRaster(hillslope_feature_class, "HillslopeID", hillslope_raster, "CELL_CENTER", 
+                                         "NONE", soil_raster_desc.meanCellWidth)
+
+    tweet("Cross-tabulating soil map units and hillslopes.")
+    df_counts = crosstab_label_rasters(hillslope_raster, soil_raster, config.SOIL_RASTER_BLOCK_ROWS)
+    
+    # raster values are mapped to map unit keys through the raster attribute table
+    value_to_mukey = {row[0]: row[1] for row in arcpy.da.SearchCursor(soil_raster, ["Value", "MUKEY"])}
+    hillslope_raster_desc = arcpy.Describe(hillslope_raster)
+    cell_area = hillslope_raster_desc.meanCellWidth * hillslope_raster_desc.meanCellHeight
+    df_intersections = pd.DataFrame({"HillslopeID": df_counts.Zone,
+                                     "MUKEY": df_counts.Class.map(value_to_mukey).astype(str),
+                                     "Shape_Area": df_counts.CellCount * cell_area})
     
-    return intersect_feature_class
+    return df_intersections
 
 
-def load_tables(soil_gdb, agwa_directory, intersect_feature_class):
-    """Load tables from gSSURGO database and AGWA lookup table."""
+def crosstab_label_rasters(zone_raster, class_raster, block_rows):
+    """Count the cells of each (zone, class) pair of two aligned integer rasters. The zone raster defines the
+    window that is read from the class raster. Rasters are read in blocks of rows to limit memory use.
+    Returns a dataframe with Zone, Class and CellCount columns. Called in tabulate_soil_raster_by_hillslopes."""
+
+    zone = arcpy.Raster(zone_raster)
+    class_nodata = arcpy.Raster(class_raster).noDataValue
+    extent = zone.extent
+    
+    block_counts = []
+    for first_row in range(0, zone.height, block_rows):
+        number_of_rows = min(block_rows, zone.height - first_row)
+        lower_left = arcpy.Point(extent.XMin, extent.YMax - (first_row + number_of_rows) * zone.meanCellHeight)
+        zones = arcpy.RasterToNumPyArray(zone_raster, lower_left, zone.width, number_of_rows).ravel()
+        classes = arcpy.RasterToNumPyArray(class_raster, lower_left, zone.width, number_of_rows).ravel()
+
+        valid = np.ones(zones.shape, dtype=bool)
+        if zone.noDataValue is not None:
+            valid &= zones != zone.noDataValue
+        if class_nodata is not None:
+            valid &= classes != class_nodata
+        
+        # pack each pair into one 64-bit key so a single unique call counts the pairs
+        keys = (zones[valid].astype(np.int64) << 32) | classes[valid].astype(np.int64)
+        unique_keys, counts = np.unique(keys, return_counts=True)
+        block_counts.append(pd.Series(counts, index=unique_keys))
+
+    df_counts = pd.DataFrame(columns=["Zone", "Class", "CellCount"])
+    if block_counts:
+        total_counts = pd.concat(block_counts).groupby(level=0).sum()
+        df_counts = pd.DataFrame({"Zone": total_counts.index.values >> 32,
+                                  "Class": total_counts.index.values & 0xFFFFFFFF,
+                                  "CellCount": total_counts.values})
+
+    return df_counts
+
+
+def load_tables(soil_gdb, agwa_directory, df_intersections):
+    """Load tables from gSSURGO database and AGWA lookup table.
+    When config.SOIL_DATABASE_CACHE is True, the gSSURGO tables are read from the soil database cache and
+    only the rows reachable from the map units in df_intersections are loaded."""
 
     # reading tables from AGWA directory and gSSURGO database
-    component_table = os.path.join(soil_gdb, "component")
-    horizon_table = os.path.join(soil_gdb, "chorizon")
-    texture_table = os.path.join(soil_gdb, "chtexture")
-    texture_group_table = os.path.join(soil_gdb, "chtexturegrp")
-    kin_lut_table = os.path.join(agwa_directory, "lookup_tables.gdb", "kin_lut")
+    kin_lut_table = code_lookup_tables.get_lookup_table_path(agwa_directory, "kin_lut")
     
     # define fields needed and read tables into dataframes
-    component_fields = ["cokey", "comppct_r", "mukey"]
-    horizon_fields = ["cokey", "chkey", "hzname", "hzdept_r", "hzdepb_r", "ksat_r", "sandtotal_r", "silttotal_r", "claytotal_r",
-                    "dbthirdbar_r", "partdensity", "sieveno10_r", "kwfact"]
-    # texture_group_fields = ["chkey", "chtgkey", "texture", "texdesc", "rvindicator"]
-    # texture_fields = ["chtgkey", "texcl", "lieutex"]
     # kin_lut_fields = ["TextureName", "KS", "G", "POR", "SMAX", "CV", "SAND", "SILT", "CLAY", "DIST", "KFF"]
-    df_mapunit = pd.DataFrame(arcpy.da.TableToNumPyArray(intersect_feature_class, ["mukey"]))
-    df_component = pd.DataFrame(arcpy.da.TableToNumPyArray(component_table, component_fields, skip_nulls=False))
-    df_horizon = pd.DataFrame(arcpy.da.TableToNumPyArray(horizon_table, horizon_fields))
-    df_texture_group = pd.DataFrame(arcpy.da.TableToNumPyArray(texture_group_table, "*"))
-    df_texture = pd.DataFrame(arcpy.da.TableToNumPyArray(texture_table, "*"))
-    df_kin_lut = pd.DataFrame(arcpy.da.TableToNumPyArray(kin_lut_table, "*"))
+    df_mapunit = df_intersections[["MUKEY"]].rename(columns={"MUKEY": "mukey"})
+    soil_tables = None
+    if config.SOIL_DATABASE_CACHE:
+        try:
+            soil_tables = load_soil_tables_from_cache(soil_gdb, agwa_directory, df_mapunit.mukey.astype(str).unique())
+        except (ImportError, OSError) as e:
+            tweet(f"Soil database cache is not available, reading the gSSURGO tables directly. {e}")
+    if soil_tables is None:
+        soil_tables = {table: read_soil_table(soil_gdb, table) for table in SOIL_TABLE_FIELDS}
+    df_kin_lut = code_lookup_tables.read_lookup_table(kin_lut_table)
+
+    return (df_mapunit, soil_tables["component"], soil_tables["chorizon"], soil_tables["chtexturegrp"], 
+            soil_tables["chtexture"], df_kin_lut)
+
+
+def read_soil_table(soil_gdb, table):
+    """Read the fields used by AGWA from a gSSURGO table. Called in load_tables and export_soil_database_cache."""
+
+    fields, _ = SOIL_TABLE_FIELDS[table]
+    skip_nulls = {"skip_nulls": False} if table == "component" else {}
+    return pd.DataFrame(arcpy.da.TableToNumPyArray(os.path.join(soil_gdb, table), fields, **skip_nulls))
+
+
+def get_soil_database_cache_directory(soil_gdb, agwa_directory):
+    """Return the cache directory of a gSSURGO database. The directory is keyed by the database path and 
+    the latest modification time of the files in the database, so the cache is rebuilt when the database changes.
+    Called in load_soil_tables_from_cache."""
+
+    soil_gdb = os.path.normcase(os.path.abspath(soil_gdb))
+    modification_time = max([os.path.getmtime(soil_gdb)] + 
+                            [entry.stat().st_mtime for entry in os.scandir(soil_gdb) if entry.is_file()])
+    path_key = hashlib.sha1(soil_gdb.encode("utf-8")).hexdigest()[:12]
+    cache_root = config.SOIL_DATABASE_CACHE_DIRECTORY or os.path.join(agwa_directory, "soil_database_cache")
+    database_directory = os.path.join(cache_root, f"{os.path.splitext(os.path.basename(soil_gdb))[0]}_{path_key}")
+
+    return database_directory, os.path.join(database_directory, f"{int(modification_time)}")
+
+
+def export_soil_database_cache(soil_gdb, agwa_directory):
+    """Export the fields used by AGWA from the gSSURGO tables to Parquet files. Each table is sorted by 
+    the key it is filtered on, so row group statistics let later reads skip unrelated map units.
+    The files are written to a temporary directory that is moved into place once complete, so an interrupted 
+    export is not mistaken for a complete cache, and a cache completed in the meantime by another process is kept.
+    Caches of older versions of the same database are removed. Called in load_soil_tables_from_cache."""
+
+    database_directory, cache_directory = get_soil_database_cache_directory(soil_gdb, agwa_directory)
+    tweet(f"Creating soil database cache for {soil_gdb}. This is done once per database.")
+    os.makedirs(database_directory, exist_ok=True)
+    for entry in os.scandir(database_directory):
+        # temporary directories of exports in progress end with .tmp and are left to their process
+        if entry.is_dir() and entry.path != cache_directory and not entry.name.endswith(".tmp"):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    temporary_directory = tempfile.mkdtemp(prefix=os.path.basename(cache_directory) + ".", suffix=".tmp", 
+                                           dir=database_directory)
+    try:
+        for table, (_, key) in SOIL_TABLE_FIELDS.items():
+            df = read_soil_table(soil_gdb, table)
+            df[key] = df[key].astype(str)
+            df = df.sort_values(by=key, kind="stable").reset_index(drop=True)
+            df.to_parquet(os.path.join(temporary_directory, f"{table}.parquet"), index=False, row_group_size=50000)
+        if os.path.isdir(cache_directory) and not is_soil_database_cache_complete(cache_directory):
+            # an incomplete cache left by an interrupted export is moved aside, then removed
+            stale_directory = tempfile.mkdtemp(prefix=os.path.basename(cache_directory) + ".", suffix=".tmp", 
+                                               dir=database_directory)
+            with contextlib.suppress(OSError):
+                os.replace(cache_directory, os.path.join(stale_directory, "stale"))
+            shutil.rmtree(stale_directory, ignore_errors=True)
+        try:
+            os.replace(temporary_directory, cache_directory)
+        except OSError:
+            # another process has created the cache in the meantime
+            if not is_soil_database_cache_complete(cache_directory):
+                raise
+    finally:
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+
+
+def is_soil_database_cache_complete(cache_directory):
+    """Return True if the cache directory has the Parquet file of every gSSURGO table.
+    Called in export_soil_database_cache and load_soil_tables_from_cache."""
+
+    return all(os.path.exists(os.path.join(cache_directory, f"{table}.parquet")) for table in SOIL_TABLE_FIELDS)
+
+
+def load_soil_tables_from_cache(soil_gdb, agwa_directory, mukeys):
+    """Load the gSSURGO tables from the soil database cache, creating the cache if needed.
+    Only the rows reachable from the given map unit keys are read: components by mukey, horizons by cokey,
+    texture groups by chkey, and textures by chtgkey. All rows are read when mukeys is None. 
+    Called in load_tables and build_soil_parameter_lookup."""
+
+    _, cache_directory = get_soil_database_cache_directory(soil_gdb, agwa_directory)
+    if not is_soil_database_cache_complete(cache_directory):
+        export_soil_database_cache(soil_gdb, agwa_directory)
+
+    if mukeys is None:
+        return {table: pd.read_parquet(os.path.join(cache_directory, f"{table}.parquet")) 
+                for table in SOIL_TABLE_FIELDS}
+
+    soil_tables = {}
+    keys = [str(mukey) for mukey in mukeys]
+    for table, parent_key in [("component", "cokey"), ("chorizon", "chkey"), ("chtexturegrp", "chtgkey"), 
+                              ("chtexture", None)]:
+        key = SOIL_TABLE_FIELDS[table][1]
+        # an empty filter list is not accepted, and no gSSURGO key is an empty string
+        soil_tables[table] = pd.read_parquet(os.path.join(cache_directory, f"{table}.parquet"), 
+                                             filters=[(key, "in", keys or [""])])
+        if parent_key:
+            keys = soil_tables[table][parent_key].astype(str).unique().tolist()
+
+    return soil_tables
+
+
+def get_soil_parameter_lookup_path(soil_gdb, agwa_directory, df_kin_lut, max_thickness, max_horizons):
+    """Return the path of the soil parameter lookup in the soil database cache. Besides the database, the weighted 
+    parameters only depend on kin_lut, max_thickness, and max_horizons, so those are part of the file name.
+    Called in build_soil_parameter_lookup and lookup_soil_parameters."""
+
+    _, cache_directory = get_soil_database_cache_directory(soil_gdb, agwa_directory)
+    kin_lut_key = hashlib.sha1(pd.util.hash_pandas_object(df_kin_lut, index=False).values.tobytes()).hexdigest()[:12]
+    return os.path.join(cache_directory, 
+                        f"soil_parameters_{kin_lut_key}_{float(max_thickness):g}_{int(max_horizons)}.parquet")
+
+
+def build_soil_parameter_lookup(soil_gdb, agwa_directory, max_thickness, max_horizons, chunk_size=250):
+    """Compute parameters_soil_weighted_by_component for every map unit in a gSSURGO database and store it as 
+    a lookup sorted by MapUnitMukey in the soil database cache. Map units are split into chunks of chunk_size and 
+    processed in a pool of worker processes. Once the lookup exists, intersect_soils uses it instead of querying 
+    the soil parameters, as long as kin_lut, max_thickness, and max_horizons are unchanged.
+    This is an offline step, for example to prepare a state database that many watersheds are parameterized against:
+        code_parameterize_land_cover_and_soils.build_soil_parameter_lookup(soil_gdb, agwa_directory, 200, 1)
+    """
 
-    return df_mapunit, df_component, df_horizon, df_texture_group, df_texture, df_kin_lut
+    tweet(f"Reading gSSURGO tables from {soil_gdb}.")
+    soil_tables = load_soil_tables_from_cache(soil_gdb, agwa_directory, None)
+    df_kin_lut = code_lookup_tables.read_lookup_table(
+        code_lookup_tables.get_lookup_table_path(agwa_directory, "kin_lut"))
+
+    # partition the tables by chunk of map units, following the keys from components down to textures
+    df_component, df_horizon = soil_tables["component"], soil_tables["chorizon"]
+    df_texture_group, df_texture = soil_tables["chtexturegrp"], soil_tables["chtexture"]
+    mukeys = df_component.mukey.astype(str).unique()
+    chunk_of_mukey = pd.Series(np.arange(len(mukeys)) // chunk_size, index=mukeys)
+    component_chunks = df_component.mukey.astype(str).map(chunk_of_mukey)
+    horizon_chunks = df_horizon.cokey.astype(str).map(
+        pd.Series(component_chunks.values, index=df_component.cokey.astype(str)).groupby(level=0).first())
+    texture_group_chunks = df_texture_group.chkey.astype(str).map(
+        pd.Series(horizon_chunks.values, index=df_horizon.chkey.astype(str)).groupby(level=0).first())
+    texture_chunks = df_texture.chtgkey.astype(str).map(
+        pd.Series(texture_group_chunks.values, index=df_texture_group.chtgkey.astype(str)).groupby(level=0).first())
+    
+    horizon_groups = dict(tuple(df_horizon.groupby(horizon_chunks)))
+    texture_group_groups = dict(tuple(df_texture_group.groupby(texture_group_chunks)))
+    texture_groups = dict(tuple(df_texture.groupby(texture_chunks)))
+    empty_tables = (df_horizon.iloc[0:0], df_texture_group.iloc[0:0], df_texture.iloc[0:0])
+
+    number_of_chunks = int(chunk_of_mukey.max()) + 1 if len(mukeys) else 0
+    tweet(f"Calculating weighted soil parameters for {len(mukeys)} map units in {number_of_chunks} chunks.")
+    results = []
+    with code_process_pool.create_process_pool(number_of_chunks) as executor:
+        futures = []
+        for chunk, df_component_chunk in df_component.groupby(component_chunks):
+            df_mapunit_chunk = pd.DataFrame({"mukey": df_component_chunk.mukey.astype(str).unique()})
+            futures.append(executor.submit(
+                calculate_soil_parameters_for_map_units, df_mapunit_chunk, df_component_chunk,
+                horizon_groups.get(chunk, empty_tables[0]), texture_group_groups.get(chunk, empty_tables[1]),
+                texture_groups.get(chunk, empty_tables[2]), df_kin_lut, max_thickness, max_horizons))
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+
+    results = [result for result in results if not result.empty]
+    if not results:
+        raise Exception(f"No map units with soil horizons were found in {soil_gdb}.")
+    df_lookup = pd.concat(results, ignore_index=True)
+    df_lookup = df_lookup.sort_values(by="MapUnitMukey", kind="stable").reset_index(drop=True)
+    lookup_path = get_soil_parameter_lookup_path(soil_gdb, agwa_directory, df_kin_lut, max_thickness, max_horizons)
+    df_lookup.to_parquet(lookup_path + ".tmp", index=False, row_group_size=50000)
+    os.replace(lookup_path + ".tmp", lookup_path)
+    tweet(f"Soil parameter lookup with {int(df_lookup.Valid.sum())} map units saved to {lookup_path}. "
+          f"{int((~df_lookup.Valid).sum())} map units could not be parameterized and will be queried "
+          f"during parameterization.")
+
+    return lookup_path
+
+
+def calculate_soil_parameters_for_map_units(df_mapunit, df_component, df_horizon, df_texture_group, df_texture,
+                                            df_kin_lut, max_thickness, max_horizons):
+    """Calculate the weighted soil parameters of a chunk of map units. Runs in a worker process of 
+    build_soil_parameter_lookup. Map units whose textures are not in kin_lut, or that fail to be queried, 
+    are returned with Valid set to False so that parameterization queries them and reports the error."""
+
+    def calculate(df_mapunit_subset):
+        df_horizon_parameters = query_soil_parameters(df_mapunit_subset, df_component, df_horizon, df_texture_group,
+                                                      df_texture, df_kin_lut, max_thickness, max_horizons,
+                                                      raise_on_missing_textures=False)
+        if df_horizon_parameters.empty:
+            return pd.DataFrame(), []
+        invalid_mukeys = df_horizon_parameters[~df_horizon_parameters.Texture.isin(
+            df_kin_lut.TextureName)].MapUnitMukey.unique().tolist()
+        df_horizon_parameters = df_horizon_parameters[~df_horizon_parameters.MapUnitMukey.isin(invalid_mukeys)]
+        if df_horizon_parameters.empty:
+            return pd.DataFrame(), invalid_mukeys
+        _, df_weighted_by_component = calculate_weighted_hillslope_soil_parameters(df_horizon_parameters)
+        return df_weighted_by_component, invalid_mukeys
+
+    try:
+        df_weighted_by_component, invalid_mukeys = calculate(df_mapunit)
+    except Exception:
+        # process the map units one at a time to isolate the ones that fail
+        df_weighted_list, invalid_mukeys = [], []
+        for mukey in df_mapunit.mukey:
+            try:
+                df_weighted, invalid = calculate(pd.DataFrame({"mukey": [mukey]}))
+                df_weighted_list.append(df_weighted)
+                invalid_mukeys += invalid
+            except Exception:
+                invalid_mukeys.append(mukey)
+        df_weighted_by_component = pd.concat(df_weighted_list, ignore_index=True)
+
+    df_invalid = pd.DataFrame({"MapUnitMukey": invalid_mukeys, "Valid": False})
+    return pd.concat([df_weighted_by_component.assign(Valid=True), df_invalid], ignore_index=True)
+
+
+def lookup_soil_parameters(soil_gdb, agwa_directory, mukeys, df_kin_lut, max_thickness, max_horizons):
+    """Return the weighted soil parameters of the given map units from the soil parameter lookup, in the format of
+    calculate_weighted_hillslope_soil_parameters. Returns None if there is no lookup for this database, kin_lut,
+    max_thickness, and max_horizons, or if one of the map units could not be parameterized when the lookup 
+    was built. Called in intersect_soils function."""
+
+    lookup_path = get_soil_parameter_lookup_path(soil_gdb, agwa_directory, df_kin_lut, max_thickness, max_horizons)
+    if not os.path.exists(lookup_path):
+        return None
+    
+    keys = [str(mukey) for mukey in mukeys]
+    df_lookup = pd.read_parquet(lookup_path, filters=[("MapUnitMukey", "in", keys or [""])])
+    if not df_lookup.Valid.all():
+        return None
+    
+    # keep the map unit order of the watershed, as in calculate_weighted_hillslope_soil_parameters
+    lookup_keys = set(df_lookup.MapUnitMukey)
+    found_keys = [key for key in keys if key in lookup_keys]
+    df_lookup = df_lookup.set_index("MapUnitMukey").loc[found_keys]
+    return df_lookup.drop(columns="Valid").reset_index()
 
 
-def query_soil_parameters(df_mapunit, df_component, df_horizon, df_texture_group, df_texture, df_kin_lut, max_thickness, max_horizons):
+def query_soil_parameters(df_mapunit, df_component, df_horizon, df_texture_group, df_texture, df_kin_lut, max_thickness, max_horizons,
+                          raise_on_missing_textures=True):
     """Query soil parameters. Called in intersect_soils function.
 
         Note on Pave Textures:
@@ -474,11 +1027,11 @@ def query_soil_parameters(df_mapunit, df_component, df_horizon, df_texture_group
                 df_horizon_parameters_all = pd.concat([df_horizon_parameters_all, 
                                                 df_horizon_parameters], axis=0, ignore_index=True)
     
-    if textures_list_not_in_kinlut:
+    if textures_list_not_in_kinlut and raise_on_missing_textures:
         textures_not_in_kinlut_string = ", ".join(textures_list_not_in_kinlut)
         raise Exception(f"   Can not proceed because the following textures in the watershed "
                         f"do not match any in AGWA lookup table:\n      {textures_not_in_kinlut_string}.")
-    if textures_list_not_usda_type:
+    if textures_list_not_usda_type and raise_on_missing_textures:
         textures_not_usda_string = ", ".join(textures_list_not_usda_type)
         tweet(f"   Textures in watershed not matching the 12 standard USDA types:\n      {textures_not_usda_string}.")
 
@@ -491,40 +1044,52 @@ def save_results(workspace, delineation_name, discretization_name, parameterizat
     """Save the results to the workspace geodatabase. Called in parameterize function.
     To make sure the correct datatype, use insertrow instead of converting to table from csv """
     
+    soil_results = prepare_soil_results(delineation_name, discretization_name, parameterization_name, 
+                                        save_intermediate_outputs, df_horizon_parameters, df_weighted_by_horizon, 
+                                        df_weighted_by_component)
+    for table_name, df in soil_results:
+        # create table if not exists, then replace the rows of this parameterization
+        arcgis_table = create_soil_results_table(workspace, table_name, df.columns)
+        where_clause = get_parameterization_where_clause(arcgis_table, delineation_name, discretization_name, 
+                                                         parameterization_name)
+        write_dataframe_to_table(arcgis_table, df, where_clause, text_fields=SOIL_RESULTS_TEXT_FIELDS, 
+                                 long_fields=SOIL_RESULTS_LONG_FIELDS)
+
+
+def prepare_soil_results(delineation_name, discretization_name, parameterization_name, save_intermediate_outputs,
+                         df_horizon_parameters, df_weighted_by_horizon, df_weighted_by_component):
+    """Return the soil results to save as a list of (table name, dataframe), with the parameterization names
+    and creation metadata added. The input dataframes are not modified.
+    Called in save_results and parameterize_scenarios functions."""
+
     df_to_save = [df_weighted_by_component]
     table_names = ["parameters_soil_weighted_by_component"]
     if save_intermediate_outputs:
         df_to_save = df_to_save + [df_horizon_parameters, df_weighted_by_horizon]
         table_names = table_names + ["parameters_soil_horizons", "parameters_soil_weighted_by_horizon"]
    
+    soil_results = []
     for df, table_name in zip(df_to_save, table_names):
+        df = df.copy()
         df.insert(0, "DelineationName", delineation_name)
         df.insert(1, "ParameterizationName", parameterization_name)
         df.insert(2, "DiscretizationName", discretization_name)
         df = df.assign(CreationDate=datetime.now().isoformat(), AGWAVersionAtCreation=config.AGWA_VERSION,
                        AGWAGDBVersionAtCreation=config.AGWAGDB_VERSION, Status="X")
+        soil_results.append((table_name, df))
 
-        # define field types. To be safe, ComponentPercentage and HorizonThickness are set to DOUBLE.
-        Text_fields = ["DelineationName", "ParameterizationName", "DiscretizationName", "HorizonName",
-                       "Texture", "TextureClass", "TextureDesc", "CreationDate", "AGWAVersionAtCreation", 
-                       "AGWAGDBVersionAtCreation", "Status"]
-        Long_fields = ["MapUnitMukey", "ComponentCokey", "HorizonChkey", "HorizonNumber", "TextureGroupChtgkey"]
+    return soil_results
 
-        # create table if not exists
-        arcgis_table = os.path.join(workspace, table_name)
-        if not arcpy.Exists(arcgis_table):
-            arcpy.CreateTable_management(workspace, table_name)
-            for column in df.columns:
-                if column in Text_fields:
-                    arcpy.AddField_management(arcgis_table, column, "TEXT")
-                elif column in Long_fields:
-                    arcpy.AddField_management(arcgis_table, column, "LONG")
-                else:
-                    arcpy.AddField_management(arcgis_table, column, "DOUBLE")
-        # instert rows from df
-        with arcpy.da.InsertCursor(arcgis_table, df.columns.tolist()) as cursor:
-            for row in df.itertuples(index=False):
-                cursor.insertRow(row)
+
+def create_soil_results_table(workspace, table_name, columns):
+    """Create a soil results table if it does not exist and add the missing fields. 
+    Called in save_results and parameterize_scenarios functions."""
+
+    arcgis_table = os.path.join(workspace, table_name)
+    if not arcpy.Exists(arcgis_table):
+        arcpy.CreateTable_management(workspace, table_name)
+    add_missing_fields(arcgis_table, columns, SOIL_RESULTS_TEXT_FIELDS, SOIL_RESULTS_LONG_FIELDS)
+    return arcgis_table
 
 
 def query_soil_horizon_parameters(row, horizon_count, max_horizons):
@@ -741,9 +1306,9 @@ def query_kin_lut_update_horizon_parameters(df_kin_lut, texture, df_horizon_para
 
 
 def weight_hillsope_parameters_by_area_fractions(workspace, delineation_name, discretization_name,
-                                                 parameterization_name, intersect_feature_class):
+                                                 parameterization_name, df_intersections):
     """Weight soil parameters for each hillslope based on the intersection of hillslopes and soils. 
-        14 parameters are weighted.
+        14 parameters are weighted. df_intersections holds HillslopeID, MUKEY, and Shape_Area.
         called in parameterize function."""
     
     # Step 1: read 2 tables    
@@ -753,12 +1318,18 @@ def weight_hillsope_parameters_by_area_fractions(workspace, delineation_name, di
                         (df_soils["DiscretizationName"] == discretization_name) &
                         (df_soils["ParameterizationName"] == parameterization_name)]
     
-    # soil_feature_class_name = os.path.basename(soil_layer)
-    # intersection_table = os.path.join(workspace, f"{discretization_name}_{soil_feature_class_name}_intersection")
-    df_intersections = pd.DataFrame(arcpy.da.TableToNumPyArray(intersect_feature_class, 
-                                                               ["HillslopeID", "MUKEY", "Shape_Area"])) 
+    return weight_soil_parameters_by_area_fractions(df_soils, df_intersections)
+
+
+def weight_soil_parameters_by_area_fractions(df_soils, df_intersections):
+    """Weight the soil parameters of each map unit (df_soils) by the area of the map unit in each hillslope
+    (df_intersections). Called in weight_hillsope_parameters_by_area_fractions and parameterize_scenarios 
+    functions."""
 
-    # Step 2: Merge intersection polygons with soils
+    df_soils = df_soils.copy()
+    df_intersections = df_intersections.copy()
+
+    # Step 1: Merge intersection polygons with soils
     df_soils.MapUnitMukey = df_soils.MapUnitMukey.astype(str)
     df_intersections.MUKEY = df_intersections.MUKEY.astype(str)
     # here to assign values so it won't be NaN #TODO: add a warning or error if there are missing_mukeys
@@ -766,7 +1337,7 @@ def weight_hillsope_parameters_by_area_fractions(workspace, delineation_name, di
     
     df_intersections_soils = pd.merge(df_intersections, df_soils, left_on="MUKEY", right_on="MapUnitMukey", how="left")
     
-    # Step 3: Weight soil parameters by area fractions
+    # Step 2: Weight soil parameters by area fractions
     parameters = ["Ksat", "G", "Porosity", "Rock", "Sand", "Silt", "Clay", "Splash", "Cohesion", "Pave",
                    "SMax", "CV", "Distribution"]
     df_weighted_by_area = pd.DataFrame().assign(HillslopeID=df_intersections_soils.HillslopeID.unique())
@@ -857,9 +1428,8 @@ def copy_parameterization(workspace, delineation_name, discretization_name, prev
 
             field_indices = {field: all_fields.index(field) for field in fields_to_copy}
 
-            where_clause = (f"DelineationName = '{delineation_name}' AND "
-                            f"DiscretizationName = '{discretization_name}' AND "
-                            f"ParameterizationName = '{parameterization_name}'")
+            where_clause = get_parameterization_where_clause(table_path, delineation_name, discretization_name, 
+                                                             parameterization_name)
 
             with arcpy.da.UpdateCursor(table_path, all_fields, where_clause) as cursor:
                 for row in cursor:
@@ -930,6 +1500,23 @@ def convert_soil_raster_to_polygon(raster, watershed_feature_class, delineation,
     """Convert soil raster to polygon and clip to the watershed extent.
         Called in intersect_soils function."""
 
+    prj_lc_raster = prepare_soil_raster(raster, watershed_feature_class, delineation, workspace)
+
+    # Convert raster to polygon
+    tweet("Converting soil raster to polygon")
+    soil_data_name = os.path.basename(raster)
+    raster_polygon = os.path.join(workspace, f"{soil_data_name}")
+    if arcpy.Exists(raster_polygon):
+        arcpy.Delete_management(raster_polygon)
+    arcpy.RasterToPolygon_conversion(prj_lc_raster, raster_polygon, "SIMPLIFY", "MUKEY")
+
+    return raster_polygon
+
+
+def prepare_soil_raster(raster, watershed_feature_class, delineation, workspace):
+    """Clip the soil raster to the buffered watershed and project it to the watershed coordinate system if needed.
+        Called in convert_soil_raster_to_polygon and intersect_soil_with_hillslopes functions."""
+
     # Check if raster is substantially larger than the watershed
     buffer_size = is_raster_larger_and_buffer(raster, watershed_feature_class)                                        
 
@@ -955,12 +1542,4 @@ def convert_soil_raster_to_polygon(raster, watershed_feature_class, delineation,
     else:
         prj_lc_raster = clipped_soil_raster
 
-    # Convert raster to polygon
-    tweet("Converting soil raster to polygon")
-    soil_data_name = os.path.basename(raster)
-    raster_polygon = os.path.join(workspace, f"{soil_data_name}")
-    if arcpy.Exists(raster_polygon):
-        arcpy.Delete_management(raster_polygon)
-    arcpy.RasterToPolygon_conversion(prj_lc_raster, raster_polygon, "SIMPLIFY", "MUKEY")
-
-    return raster_polygon
+    return prj_lc_raster
@@ -1,9 +1,12 @@
 import os
+import sys
 import arcpy
 import pandas as pd
 from PIL import Image
 import arcpy.management
 import matplotlib.pyplot as plt
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+import code_hydrograph_store
 
 figsize=(15, 12)
 title_size = 24
@@ -15,6 +18,14 @@ pad = 40
 labelpad = 20
 grid= False
 line_width = 2.0
+# columns added to hydrographs in English units, with the metric column and conversion factor of each
+ENGLISH_COLUMNS = {"Rainfall_Rate_inhr": ("Rainfall_Rate_mmhr", 0.0393701),
+                   "Runoff_Rate_inhr": ("Runoff_Rate_mmhr", 0.0393701),
+                   "Runoff_Rate_cft": ("Runoff_Rate_cms", 35.3147),
+                   "Total_Sediment_Yield_lbs": ("Total_Sediment_Yield_kgs", 2.20462),
+                   "sed_p250mm_lbs": ("sed_p250mm_kgs", 2.20462),
+                   "sed_p033mm_lbs": ("sed_p033mm_kgs", 2.20462),
+                   "sed_p004mm_lbs": ("sed_p004mm_kgs", 2.20462)}
 
 
 def tweet(msg):
@@ -29,6 +40,7 @@ def plot_hydrograph(simulation, element_type, elementid_list, multiple_elements,
 
     simulation_name = os.path.basename(simulation)
     column_to_plot, variable_name = transform_label(output_variable)
+    store = code_hydrograph_store.load_hydrograph_store(os.path.join(simulation_directory, simulation))
 
     if multiple_elements:
 
@@ -40,8 +52,7 @@ def plot_hydrograph(simulation, element_type, elementid_list, multiple_elements,
         color_cycle = ['blue', 'red', 'green', 'orange', 'purple', 'brown']
 
         for element_id in elementid_list:
-            file_path = get_file_path(simulation_directory, simulation, element_type, element_id)
-            df_sim_results = read_simulation_data(file_path, unit)
+            df_sim_results = read_element_data(store, element_type, element_id, unit)
             plot_color = color_cycle[list(elementid_list).index(element_id)]
 
             ax.plot(df_sim_results['tim_min'], df_sim_results[column_to_plot], linewidth=line_width,
@@ -59,8 +70,7 @@ def plot_hydrograph(simulation, element_type, elementid_list, multiple_elements,
             fig, ax = plt.subplots(figsize=figsize)
             fig.subplots_adjust(left=0.1, right=0.9, top=0.85, bottom=0.15)
 
-            file_path = get_file_path(simulation_directory, simulation, element_type, element_id)
-            df_sim_results = read_simulation_data(file_path, unit)
+            df_sim_results = read_element_data(store, element_type, element_id, unit)
 
             plot_individual_element(ax, df_sim_results, column_to_plot, output_variable, variable_name, element_id, simulation_name, 
                                     element_type, simulation_directory, unit, auto_display_graphs)
@@ -73,9 +83,10 @@ def plot_hydrograph(simulation, element_type, elementid_list, multiple_elements,
             os.remove(excel_file_path)
         with pd.ExcelWriter(excel_file_path, engine='openpyxl') as writer:
             for element_id in elementid_list:
-                file_path = get_file_path(simulation_directory, simulation, element_type, element_id)
-                df_sim_results = read_simulation_data(file_path, unit)[['tim_min', column_to_plot]]
+                df_sim_results = read_element_data(store, element_type, element_id, unit)[['tim_min', column_to_plot]]
                 df_sim_results.to_excel(writer, sheet_name=f"{element_type}ID_{element_id}", index=False)
+            df_statistics = read_statistics(store, element_type, elementid_list, column_to_plot)
+            df_statistics.to_excel(writer, sheet_name="Statistics", index=False)
         tweet(f"Data has been saved to {excel_file_path}.")
 
 
@@ -100,31 +111,34 @@ def save_and_show_plot(fig, path, auto_display_graphs):
         image.show()
 
 
-def read_simulation_data(file_path, unit):
-    """Reads simulation data from a file."""
-    df = pd.read_csv(file_path, skiprows=2)
-    df.columns = [
-        "tim_min", "Rainfall_Rate_mmhr", "Runoff_Rate_mmhr", "Runoff_Rate_cms",
-        "Total_Sediment_Yield_kgs", "sed_p250mm_kgs", "sed_p033mm_kgs", "sed_p004mm_kgs"]
-    
+def read_element_data(store, element_type, element_id, unit):
+    """Reads the hydrograph of an element from the hydrograph store of a simulation."""
+    df = code_hydrograph_store.read_hydrograph(store, element_type, element_id)
+
+    return convert_units(df, unit)
+
+
+def convert_units(df, unit):
+    """Adds columns in English units to a hydrograph when unit is English."""
     if unit == "English":
-        df['Rainfall_Rate_inhr'] = df['Rainfall_Rate_mmhr'] * 0.0393701
-        df['Runoff_Rate_inhr'] = df['Runoff_Rate_mmhr'] * 0.0393701
-        df['Runoff_Rate_cft'] = df['Runoff_Rate_cms'] * 35.3147
-        df['Total_Sediment_Yield_lbs'] = df['Total_Sediment_Yield_kgs'] * 2.20462
-        df['sed_p250mm_lbs'] = df['sed_p250mm_kgs'] * 2.20462
-        df['sed_p033mm_lbs'] = df['sed_p033mm_kgs'] * 2.20462
-        df['sed_p004mm_lbs'] = df['sed_p004mm_kgs'] * 2.20462  
+        for column, (metric_column, factor) in ENGLISH_COLUMNS.items():
+            df[column] = df[metric_column] * factor
 
     return df
 
 
-def get_file_path(simullation_dir, simulation, element_type, element_id):
-
-    prefix = "HillSLOPE_" if element_type == 'Hillslope' else "CHAN_"
-    folder = f"{element_type}s"
+def read_statistics(store, element_type, elementid_list, column):
+    """Returns the peak, time to peak, and total (time integral in the column units times minutes) of a hydrograph
+    column for the given elements, computed for all elements of the simulation at once from its hydrograph store."""
+    metric_column, factor = ENGLISH_COLUMNS.get(column, (column, 1.))
+    df = code_hydrograph_store.get_hydrograph_statistics(store, metric_column)
+    df = df[(df.ElementType == element_type) & df.ElementID.isin([int(element_id) for element_id in elementid_list])]
+    # peaks and totals scale with the unit, unlike the time to peak
+    df = df.assign(**{f"Peak_{metric_column}": df[f"Peak_{metric_column}"] * factor,
+                      f"Total_{metric_column}": df[f"Total_{metric_column}"] * factor})
 
-    return os.path.join(simullation_dir, simulation, folder, f"{prefix}{element_id}.SIM")
+    return df.rename(columns={f"Peak_{metric_column}": f"Peak_{column}", 
+                              f"Total_{metric_column}": f"Total_{column}"}).reset_index(drop=True)
 
 
 def transform_label(label):
@@ -0,0 +1,29 @@
+import os
+import sys
+import multiprocessing
+import concurrent.futures
+import config
+
+
+def get_worker_count(number_of_tasks=None):
+    """Return the number of worker processes to use, based on config.MAX_WORKER_PROCESSES.
+    The count is never larger than the number of tasks."""
+
+    worker_count = config.MAX_WORKER_PROCESSES
+    if worker_count <= 0:
+        worker_count = os.cpu_count() or 1
+    if number_of_tasks is not None:
+        worker_count = min(worker_count, number_of_tasks)
+    return max(worker_count, 1)
+
+
+def create_process_pool(number_of_tasks=None):
+    """Create a process pool executor for AGWA's parallel steps.
+    Inside ArcGIS Pro, sys.executable is ArcGISPro.exe, so worker processes are started with the python
+    executable of the active conda environment instead."""
+
+    python_executable = os.path.join(sys.exec_prefix, "python.exe")
+    if os.path.basename(sys.executable).lower() == "arcgispro.exe" and os.path.exists(python_executable):
+        multiprocessing.set_executable(python_executable)
+
+    return concurrent.futures.ProcessPoolExecutor(max_workers=get_worker_count(number_of_tasks))
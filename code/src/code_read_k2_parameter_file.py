@@ -0,0 +1,251 @@
+import os
+import re
+import mmap
+import numpy as np
+from itertools import chain
+
+# element blocks read from K2 parameter files. Other blocks, such as GLOBAL, are copied as they are when patching.
+ELEMENT_TYPES = ("PLANE", "CHANNEL", "POND")
+# BEGIN lines of element blocks and END lines, as whole lines with their line ending
+BLOCK_MARKER = re.compile(rb"^[^\S\n]*(?:BEGIN[^\S\n]+(?P<element_type>" + "|".join(ELEMENT_TYPES).encode() +
+                          rb")|(?P<end>END))(?![^\s])[^\n]*\n?", re.IGNORECASE | re.MULTILINE)
+
+
+def read_parfile(par_file):
+    """Read the element blocks of a K2 parameter file into columns. Returns a dictionary keyed by element type
+    (PLANE, CHANNEL, POND), each holding a dictionary of numpy arrays, one per parameter. Parameters with several
+    values, such as FR = sand, silt, clay, are split into FR_1, FR_2, FR_3. Integer and float parameters are typed,
+    other parameters are kept as text, and parameters missing from a block are NaN or "". Start and End hold the
+    byte offsets of each block in the file. The file is memory-mapped, so large files can be read."""
+
+    # each block is kept as its parameter names, numbers of values, and values, in tuples of text rather than a
+    # dictionary of lists, which the garbage collector would keep going through as the blocks pile up
+    records = {element_type: [] for element_type in ELEMENT_TYPES}
+    shapes = {}
+    for element_type, start, end, lines in iterate_blocks(par_file):
+        parameters = parse_block(lines)
+        shape = (tuple(parameters), tuple(map(len, parameters.values())))
+        values = tuple(chain.from_iterable(parameters.values()))
+        records[element_type].append((shapes.setdefault(shape, shape), values, start, end))
+
+    return {element_type: records_to_columns(element_records) for element_type, element_records in records.items()}
+
+
+def iterate_blocks(par_file):
+    """Yield (element type, start, end, lines) for each element block of a parameter file. start and end are the
+    byte offsets of the BEGIN line and of the end of the END line, and lines are the lines in between. The BEGIN and
+    END lines are searched for in the memory-mapped file, rather than going through the file line by line."""
+
+    block = None
+    with open(par_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for marker in BLOCK_MARKER.finditer(data):
+                if block is None:
+                    if marker.group("element_type"):
+                        block = (marker.group("element_type").upper().decode("latin-1"), marker.start(),
+                                 marker.end())
+                elif marker.group("end"):
+                    lines = data[block[2]:marker.start()].decode("latin-1").split("\n")[:-1]
+                    yield block[0], block[1], marker.end(), [line.strip() for line in lines]
+                    block = None
+
+    if block is not None:
+        raise ValueError(f"The {block[0]} block starting at byte {block[1]} of {par_file} has no END line.")
+
+
+def parse_block(lines):
+    """Parse the lines of an element block into a dictionary of parameter name to list of values (as text).
+    Values that follow a parameter without a name of their own, as in FR = 0.1, 0.2, 0.3, belong to it."""
+
+    parameters = {}
+    for line in lines:
+        line = line.partition("!")[0]
+        # values before the first name of a line belong to no parameter
+        if "=" not in line:
+            continue
+        name = None
+        for token in line.split(","):
+            if "=" in token:
+                name, _, value = token.partition("=")
+                name = name.strip()
+                parameters[name] = [value.strip()]
+            elif name is not None:
+                token = token.strip()
+                if token:
+                    parameters[name].append(token)
+
+    return parameters
+
+
+def records_to_columns(records):
+    """Convert parsed blocks, given as ((parameter names, numbers of values), values, start, end), to a dictionary
+    of typed numpy arrays."""
+
+    # blocks with the same parameters and numbers of values, usually all the blocks of a type, are transposed
+    # together
+    groups = {}
+    for index, (shape, _, _, _) in enumerate(records):
+        groups.setdefault(shape, []).append(index)
+
+    # columns are named after the parameters, in the order they are first found
+    value_counts = {}
+    for names, counts in groups:
+        for name, count in zip(names, counts):
+            value_counts[name] = max(value_counts.get(name, 0), count)
+    column_names = {name: [name] if count == 1 else [f"{name}_{i + 1}" for i in range(count)]
+                    for name, count in value_counts.items()}
+
+    columns = {column_name: None for names in column_names.values() for column_name in names}
+    for (names, counts), indices in groups.items():
+        group_column_names = [column_name for name, count in zip(names, counts)
+                              for column_name in column_names[name][:count]]
+        group_columns = zip(*[records[index][1] for index in indices])
+        for column_name, values in zip(group_column_names, group_columns):
+            if len(indices) == len(records):
+                columns[column_name] = list(values)
+                continue
+            if columns[column_name] is None:
+                columns[column_name] = [None] * len(records)
+            column = columns[column_name]
+            for index, value in zip(indices, values):
+                column[index] = value
+    columns = {column_name: values_to_array(values) for column_name, values in columns.items()}
+    columns["Start"] = np.array([start for _, _, start, _ in records], dtype=np.int64)
+    columns["End"] = np.array([end for _, _, _, end in records], dtype=np.int64)
+
+    return columns
+
+
+def values_to_array(values):
+    """Convert a list of values as text (None when missing) to an integer, float, or text array."""
+
+    if None not in values:
+        for value_type, dtype in [(int, np.int64), (float, np.float64)]:
+            try:
+                return np.fromiter(map(value_type, values), dtype=dtype, count=len(values))
+            except ValueError:
+                pass
+        return np.array(values, dtype=str)
+    try:
+        return np.fromiter((np.nan if value is None else float(value) for value in values), dtype=np.float64,
+                           count=len(values))
+    except ValueError:
+        return np.array(["" if value is None else value for value in values], dtype=str)
+
+
+def read_blocks(par_file):
+    """Return the text of each element block of a parameter file, keyed by (element type, ID)."""
+
+    blocks = {}
+    with open(par_file, "rb") as f:
+        for element_type, start, end, lines in iterate_blocks(par_file):
+            f.seek(start)
+            blocks[(element_type, get_element_id(lines))] = f.read(end - start).decode("latin-1")
+
+    return blocks
+
+
+def get_element_id(lines):
+    """Return the ID of an element block as an integer, or as text if it is not a number."""
+
+    element_id = parse_block(lines).get("ID", [""])[0]
+    return int(element_id) if element_id.lstrip("-").isdigit() else element_id
+
+
+def diff_parfiles(old_par_file, new_par_file):
+    """Compare the element blocks of two parameter files. Returns a dictionary with the "changed", "added", and
+    "removed" elements as lists of (element type, ID). Blocks are compared as text, ignoring line endings.
+    Together with read_blocks and patch_parfile, only the changed blocks of an existing file need to be rewritten:
+        changes = diff_parfiles(par_file, regenerated_par_file)
+        new_blocks = read_blocks(regenerated_par_file)
+        patch_parfile(par_file, {key: new_blocks[key] for key in changes["changed"]})
+    """
+
+    old_blocks = {key: block.replace("\r\n", "\n") for key, block in read_blocks(old_par_file).items()}
+    new_blocks = {key: block.replace("\r\n", "\n") for key, block in read_blocks(new_par_file).items()}
+
+    return {"changed": [key for key in old_blocks if key in new_blocks and old_blocks[key] != new_blocks[key]],
+            "added": [key for key in new_blocks if key not in old_blocks],
+            "removed": [key for key in old_blocks if key not in new_blocks]}
+
+
+def patch_parfile(par_file, new_blocks, output_file=None):
+    """Replace element blocks of a parameter file. new_blocks maps (element type, ID) to the new text of the block,
+    for example from code_write_k2_parameter_file.format_element_blocks or update_block. Only the byte ranges of
+    those blocks are rewritten, the rest of the file is copied unchanged. The file keeps its line endings. The result
+    is written to output_file, or replaces par_file if output_file is not given."""
+
+    offsets = {(element_type, get_element_id(lines)): (start, end)
+               for element_type, start, end, lines in iterate_blocks(par_file)}
+    missing = [key for key in new_blocks if key not in offsets]
+    if missing:
+        raise ValueError(f"Elements {missing} were not found in {par_file}.")
+
+    output_file = output_file or par_file
+    temporary_file = output_file + ".tmp"
+    replacements = sorted((offsets[key][0], offsets[key][1], block) for key, block in new_blocks.items())
+    with open(par_file, "rb") as source, open(temporary_file, "wb") as destination:
+        position = 0
+        for start, end, block in replacements:
+            copy_bytes(source, destination, start - position)
+            old_block = source.read(end - start)
+            newline = "\r\n" if old_block.endswith(b"\r\n") else "\n"
+            block_lines = block.replace("\r\n", "\n").strip("\n").split("\n")
+            destination.write((newline.join(block_lines) + newline).encode("latin-1"))
+            position = end
+        copy_bytes(source, destination, None)
+    os.replace(temporary_file, output_file)
+
+
+def copy_bytes(source, destination, size, chunk_size=1024 * 1024):
+    """Copy size bytes, or the rest of the file if size is None, from source to destination in chunks."""
+
+    while size is None or size > 0:
+        chunk = source.read(chunk_size if size is None else min(chunk_size, size))
+        if not chunk:
+            break
+        destination.write(chunk)
+        if size is not None:
+            size -= len(chunk)
+
+
+def update_block(block, values):
+    """Return the text of an element block with some parameter values replaced, for what-if edits. values maps
+    parameter names to a value, or to a sequence of values for parameters such as FR. Floats are written with
+    4 decimals, and other values as they are given, so pass text to control the format."""
+
+    def format_value(value):
+        return f"{value:.4f}" if isinstance(value, (float, np.floating)) else str(value)
+
+    values = {name.upper(): value if isinstance(value, (list, tuple, np.ndarray)) else [value]
+              for name, value in values.items()}
+    found = set()
+    lines = []
+    for line in block.split("\n"):
+        text, separator, comment = line.partition("!")
+        tokens = text.split(",")
+        i = 0
+        while i < len(tokens):
+            if "=" in tokens[i]:
+                name_part, _ = tokens[i].split("=", 1)
+                name = name_part.strip().upper()
+                if name in values:
+                    new_values = [format_value(value) for value in values[name]]
+                    tokens[i] = f"{name_part}= {new_values[0]}"
+                    for j, new_value in enumerate(new_values[1:], start=1):
+                        if i + j >= len(tokens) or "=" in tokens[i + j]:
+                            raise ValueError(f"Parameter {name_part.strip()} has fewer than {len(new_values)} values.")
+                        tokens[i + j] = f" {new_value}"
+                    found.add(name)
+                    i += len(new_values)
+                    continue
+            i += 1
+        lines.append(",".join(tokens) + separator + comment)
+
+    missing = [name for name in values if name not in found]
+    if missing:
+        raise ValueError(f"Parameters {missing} were not found in the block.")
+
+    return "\n".join(lines)
@@ -7,6 +7,7 @@ import arcpy.management
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import config
 importlib.reload(config)
+import code_lookup_tables
 
 def tweet(msg):
     """Produce a message for both arcpy and python"""
@@ -160,6 +161,9 @@ def record_workspace_metadata(prjgdb, unfilled_dem_path, filled_dem_path, fd_pat
            fd_path, fa_path, flup_path, slope_path, aspect_path,
            creation_date, agwa_version_at_creation, agwa_gdb_version_at_creation]
     
+    # Lookup tables read from a previous AGWA directory are no longer valid
+    code_lookup_tables.clear_lookup_table_cache()
+
     # Check if the table already exists and delete it if it does
     meta_workspace_table = os.path.join(prjgdb, "metaWorkspace")
     if arcpy.Exists(meta_workspace_table):
@@ -3,6 +3,7 @@ import arcpy
 import pandas as pd
 from arcpy._mp import Table
 from datetime import datetime
+import code_process_pool
 
 
 def tweet(msg):
@@ -75,6 +76,48 @@ def write_parfile(prjgdb, workspace, delineation, discretization, parameterizati
     tweet(f"Parameter file '{parameterization_file_path}' has been created successfully.")
 
 
+def write_parfiles(prjgdb, workspace, parameter_files, parallel=False):
+    """Write several K2 parameter files. parameter_files is a list of (delineation, discretization, 
+    parameterization, parameterization_file_path). The metadata and parameter tables are read once for all files.
+    With parallel, the files are written in worker processes."""
+
+    # Step 1: Read parameters of all parameterizations
+    parameterizations = [(delineation, discretization, parameterization) 
+                         for delineation, discretization, parameterization, _ in parameter_files]
+    versions = extract_parameters_for_parameterizations(prjgdb, parameterizations)
+
+    # Step 2: Read the parameter tables once and split them by parameterization
+    tweet("Reading parameter tables")
+    df_hillslopes, df_channels, df_contributing_channels = read_all_parameter_tables(workspace)
+    parameterization_fields = ["DelineationName", "DiscretizationName", "ParameterizationName"]
+    hillslope_groups = dict(list(df_hillslopes.groupby(parameterization_fields)))
+    channel_groups = dict(list(df_channels.groupby(parameterization_fields)))
+    contributing_channel_groups = dict(list(df_contributing_channels.groupby(["DelineationName", 
+                                                                              "DiscretizationName"])))
+
+    write_file_arguments = []
+    for delineation, discretization, parameterization, parameterization_file_path in parameter_files:
+        key = (delineation, discretization, parameterization)
+        agwa_version_at_creation, agwa_gbd_version_at_creation = versions[key]
+        write_file_arguments.append((parameterization_file_path, agwa_version_at_creation, 
+            agwa_gbd_version_at_creation, delineation, discretization, 
+            hillslope_groups.get(key, df_hillslopes.iloc[:0]), channel_groups.get(key, df_channels.iloc[:0]),
+            contributing_channel_groups.get((delineation, discretization), df_contributing_channels.iloc[:0]),
+            parameterization))
+
+    # Step 3: Write the files
+    if parallel and len(write_file_arguments) > 1:
+        with code_process_pool.create_process_pool(len(write_file_arguments)) as executor:
+            futures = [executor.submit(write_file, *arguments) for arguments in write_file_arguments]
+            for future in futures:
+                future.result()
+    else:
+        for arguments in write_file_arguments:
+            write_file(*arguments)
+    for arguments in write_file_arguments:
+        tweet(f"Parameter file '{arguments[0]}' has been created successfully.")
+
+
 def write_file(output_file, agwa_version_at_creation, agwa_gbd_version_at_creation, delineation, discretization,
                   df_hillslopes , df_channels, df_contributing_channels, parameterization):
     
@@ -103,60 +146,62 @@ def write_file(output_file, agwa_version_at_creation, agwa_gbd_version_at_creati
                    f"   NELE = {number_of_hillslopes + number_of_channels}\n"
                    "END GLOBAL\n\n")
     
+    # Format the element parameters once, keyed by ID, so each element is found without scanning the tables
+    hillslopes = format_element_blocks(df_hillslopes, "HillslopeID", PLANE_TEMPLATE, HILLSLOPE_PARAMETER_FIELDS, 
+                                       {"MeanSlope": 100., "Canopy": 100.}, id_count=2)
+    channels = format_element_blocks(df_channels, "ChannelID", CHANNEL_TEMPLATE, CHANNEL_PARAMETER_FIELDS)
+    channel_id_by_sequence = dict(zip(df_channels.Sequence.tolist()[::-1], df_channels.ChannelID.tolist()[::-1]))
+    contributing_channels = {}
+    for channel, contributing_channel in zip(df_contributing_channels.ChannelID.tolist(), 
+                                             df_contributing_channels.ContributingChannel.tolist()):
+        contributing_channels.setdefault(channel, []).append(contributing_channel)
+
     # Start writing the file, create output directory if it does not exist
     output_directory = os.path.split(output_file)[0]
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
-    f = open(output_file, "w")
-    f.write(file_info)
-    f.write(global_info)
-
-    # Write elements in sequence of channels found in the contributing channels table
-    # Technically, K2 will run with any combination of up_id and lat_id. 
-    # The following code covers all possible scenarios, with warinings for missing hillslopes.    
-    for squc in range(1, number_of_channels + 1):
-
-        # get channel_id by squence
-        channel_id = df_channels.loc[df_channels.Sequence == squc, "ChannelID"].values[0]
-        
-        # get lateral ID
-        if channel_id - 2 in df_hillslopes.HillslopeID.values and channel_id - 1 in df_hillslopes.HillslopeID.values:
-            lat_id = [channel_id - 2, channel_id - 1]
-        if channel_id - 1 in df_hillslopes.HillslopeID.values and channel_id - 2 not in df_hillslopes.HillslopeID.values:
-            lat_id = [channel_id - 1]
-            tweet(f"WARNING: Hillslope {channel_id - 2} not found from discretization. ")
-        if channel_id - 2 in df_hillslopes.HillslopeID.values and channel_id - 1 not in df_hillslopes.HillslopeID.values:
-            lat_id = [channel_id - 2]
-            tweet(f"WARNING: Hillslope {channel_id - 1} not found from discretization. ")
-
-        # get upland ID
-        up_hillslope = [channel_id - 3]
-        if up_hillslope in df_hillslopes .HillslopeID.values:
-            up_hillslopes = up_hillslope + lat_id
-            up_id = [up_hillslope]
-        else:
-            up_hillslopes = lat_id
-            up_id = df_contributing_channels.loc[
-                df_contributing_channels.ChannelID == f"{channel_id}", "ContributingChannel"].values
-
-        # write hillslope parameters        
-        for hillslope_id in up_hillslopes:
-            if hillslope_id in df_hillslopes.HillslopeID.values:
-                f.write(write_hillslope(hillslope_id, parameterization, df_hillslopes))
-
-        # write channel parameters
-        f.write(write_channel(channel_id, up_id, lat_id, parameterization, df_channels))
-
-    f.close()
+    with open(output_file, "w", buffering=1024 * 1024) as f:
+        f.write(file_info)
+        f.write(global_info)
+
+        # Write elements in sequence of channels found in the contributing channels table
+        # Technically, K2 will run with any combination of up_id and lat_id. 
+        # The following code covers all possible scenarios, with warinings for missing hillslopes.    
+        for squc in range(1, number_of_channels + 1):
+
+            # get channel_id by squence
+            channel_id = channel_id_by_sequence[squc]
+            
+            # get lateral ID
+            if channel_id - 2 in hillslopes and channel_id - 1 in hillslopes:
+                lat_id = [channel_id - 2, channel_id - 1]
+            if channel_id - 1 in hillslopes and channel_id - 2 not in hillslopes:
+                lat_id = [channel_id - 1]
+                tweet(f"WARNING: Hillslope {channel_id - 2} not found from discretization. ")
+            if channel_id - 2 in hillslopes and channel_id - 1 not in hillslopes:
+                lat_id = [channel_id - 2]
+                tweet(f"WARNING: Hillslope {channel_id - 1} not found from discretization. ")
+
+            # get upland ID
+            up_hillslope = [channel_id - 3]
+            if channel_id - 3 in hillslopes:
+                up_hillslopes = up_hillslope + lat_id
+                up_id = [up_hillslope]
+            else:
+                up_hillslopes = lat_id
+                up_id = contributing_channels.get(f"{channel_id}", [])
+
+            # write hillslope parameters        
+            for hillslope_id in up_hillslopes:
+                if hillslope_id in hillslopes:
+                    f.write(hillslopes[hillslope_id])
+
+            # write channel parameters
+            f.write(write_channel(channel_id, up_id, lat_id, channels[channel_id]))
 
 
 def read_parameter_tables(workspace, delineation, discretization, parameterization):    
-    df_hilllslopes = pd.DataFrame(arcpy.da.TableToNumPyArray(
-        os.path.join(workspace, "parameters_hillslopes"), "*", null_value=-9999))
-    df_channels = pd.DataFrame(arcpy.da.TableToNumPyArray(
-        os.path.join(workspace, "parameters_channels"), "*", null_value=-9999))        
-    df_contributing_channels = pd.DataFrame(arcpy.da.TableToNumPyArray(
-        os.path.join(workspace, "contributing_channels"), "*", null_value=-9999))
+    df_hilllslopes, df_channels, df_contributing_channels = read_all_parameter_tables(workspace)
     
     df_hillslopes_filtered = df_hilllslopes[(df_hilllslopes.DelineationName == delineation) &
                                             (df_hilllslopes.DiscretizationName == discretization) &
@@ -170,84 +215,95 @@ def read_parameter_tables(workspace, delineation, discretization, parameterizati
     return df_hillslopes_filtered, df_channels_filtered, df_contributing_channels
 
 
-def write_hillslope(plane_id, par_name, df_hilllslopes):
-
-    # read hillslope table
-    hillslope_parameters = df_hilllslopes[(df_hilllslopes.HillslopeID == plane_id) &
-                                            (df_hilllslopes.ParameterizationName == par_name)].squeeze()
-    width, length = hillslope_parameters.Width, hillslope_parameters.Length
-    slope = hillslope_parameters.MeanSlope/100.
-    man, x, y = hillslope_parameters.Manning, hillslope_parameters.CentroidX, hillslope_parameters.CentroidY
-    cv, ks, g = hillslope_parameters.CV, hillslope_parameters.Ksat, hillslope_parameters.G
-    dist, por = hillslope_parameters.Distribution, hillslope_parameters.Porosity
-    rock = hillslope_parameters.Rock
-    sand = hillslope_parameters.Sand
-    silt, clay = hillslope_parameters.Silt, hillslope_parameters.Clay
-    splash, coh = hillslope_parameters.Splash, hillslope_parameters.Cohesion
-    smax = hillslope_parameters.SMax 
-    inter, canopy = hillslope_parameters.Interception, hillslope_parameters.Canopy/100.
-    pave = hillslope_parameters.Pave
-
-    # write hillslope
-    plane_info = ("BEGIN PLANE\n"
-                    f"  ID = {plane_id}, PRINT = 3, FILE = hillslopes\hillslope_{plane_id}.sim\n"
-                    f"  LEN = {length:.4f}, WID = {width:.4f}\n"
-                    f"  SLOPE = {slope:.4f}\n"
-                    f"  MAN = {man:.4f}, X = {x}, Y = {y}\n"
-                    f"  CV = {cv:.4f}\n"
-                    f"  Ks = {ks:.4f}, G = {g:.4f}, DIST = {dist:.4f}, POR = {por:.4f}"
-                    f", ROCK = {rock:.4f}\n"
-                    f"  FR = {sand:.4f}, {silt:.4f}, {clay:.4f}, SPLASH = {splash:.4f}"
-                    f", COH = {coh:.4f}, SMAX = {smax:.4f}\n"
-                    f"  INTER = {inter:.4f}, CANOPY = {canopy:.4f}, PAVE = {pave:.2f}\n"
-                    "END PLANE\n\n")
-
-    return plane_info
-
-
-def write_channel(channel_id, up_id, lat_id, par_name, df_channels):
+def read_all_parameter_tables(workspace):
+    """Read the hillslope, channel, and contributing channel tables of all parameterizations in the workspace."""
+
+    df_hilllslopes = pd.DataFrame(arcpy.da.TableToNumPyArray(
+        os.path.join(workspace, "parameters_hillslopes"), "*", null_value=-9999))
+    df_channels = pd.DataFrame(arcpy.da.TableToNumPyArray(
+        os.path.join(workspace, "parameters_channels"), "*", null_value=-9999))        
+    df_contributing_channels = pd.DataFrame(arcpy.da.TableToNumPyArray(
+        os.path.join(workspace, "contributing_channels"), "*", null_value=-9999))
+
+    return df_hilllslopes, df_channels, df_contributing_channels
+
+
+# Element blocks are formatted with one template each, which is much faster than formatting each value separately 
+# when writing tens of thousands of elements. The ID, LAT, and UP lines of channels depend on the channel network,
+# so they have a template of their own.
+PLANE_TEMPLATE = ("BEGIN PLANE\n"
+                  "  ID = %s, PRINT = 3, FILE = hillslopes\\hillslope_%s.sim\n"
+                  "  LEN = %.4f, WID = %.4f\n"
+                  "  SLOPE = %.4f\n"
+                  "  MAN = %.4f, X = %s, Y = %s\n"
+                  "  CV = %.4f\n"
+                  "  Ks = %.4f, G = %.4f, DIST = %.4f, POR = %.4f, ROCK = %.4f\n"
+                  "  FR = %.4f, %.4f, %.4f, SPLASH = %.4f, COH = %.4f, SMAX = %.4f\n"
+                  "  INTER = %.4f, CANOPY = %.4f, PAVE = %.2f\n"
+                  "END PLANE\n\n")
+
+CHANNEL_HEADER_TEMPLATE = ("BEGIN CHANNEL\n"
+                           "  ID = %s, PRINT = 3, FILE = channels\\chan_%s.sim\n"
+                           "  LAT =  %s\n"
+                           "  UP =  %s\n")
+
+CHANNEL_TEMPLATE = ("  LEN = %.4f, SLOPE = %.4f, X = %.4f, Y = %.4f\n"
+                    "  WIDTH = %.4f, %.4f, DEPTH = %.4f, %.4f\n"
+                    "  MAN = %.4f, SS1 = %.4f, SS2 = %.4f\n"
+                    "  WOOL = %s\n"
+                    "  CV = %.4f, Ks = %.4f, G = %.4f\n"
+                    "  DIST = %.4f, POR = %.4f, ROCK = %.4f\n"
+                    "  FR = %.4f, %.4f, %.4f, SP = %.4f, COH = %.4f\n"
+                    "  PAVE = %.4f\n"
+                    "  SAT = 0.2000\n"
+                    "END CHANNEL\n\n")
+
+# Fields of the hillslope and channel tables, in the order of the values of PLANE_TEMPLATE and CHANNEL_TEMPLATE
+HILLSLOPE_PARAMETER_FIELDS = ["Length", "Width", "MeanSlope", "Manning", "CentroidX", "CentroidY", "CV", "Ksat", "G", 
+                              "Distribution", "Porosity", "Rock", "Sand", "Silt", "Clay", "Splash", "Cohesion", 
+                              "SMax", "Interception", "Canopy", "Pave"]
+CHANNEL_PARAMETER_FIELDS = ["ChannelLength", "MeanSlope", "CentroidX", "CentroidY", "UpstreamBottomWidth", 
+                            "DownstreamBottomWidth", "UpstreamBankfullDepth", "DownstreamBankfullDepth", "Manning", 
+                            "SideSlope1", "SideSlope2", "Woolhiser", "CV", "Ksat", "G", "Distribution", "Porosity", 
+                            "Rock", "Sand", "Silt", "Clay", "Splash", "Cohesion", "Pave"]
+
+
+def format_element_blocks(df, id_field, template, fields, divisors=None, id_count=0):
+    """Return the text of each element, keyed by element ID, from the template filled with the ID id_count times 
+    followed by the values of fields. The first row of each ID is kept, and the columns in divisors are divided by 
+    their divisor. The values are read column by column and all blocks are formatted in one pass, which is much 
+    faster than building a row object or calling a function for each element. Called by write_file()."""
+
+    df = df.drop_duplicates(id_field)
+    divisors = divisors or {}
+    element_ids = df[id_field].tolist()
+    columns = [element_ids] * id_count + [(df[field] / divisors[field] if field in divisors else df[field]).tolist() 
+                                          for field in fields]
+    return dict(zip(element_ids, map(template.__mod__, zip(*columns))))
+
+
+def write_channel(channel_id, up_id, lat_id, channel_parameters):
 
     up_id_str = " ".join(list(map(str, up_id)))
     lat_id_str = " ".join(list(map(str, lat_id)))
 
-    # read channel table
-    channel_parameters = df_channels[(df_channels.ChannelID == channel_id) & 
-                                        (df_channels.ParameterizationName == par_name)].squeeze()
-    length = channel_parameters.ChannelLength
-    slope = channel_parameters.MeanSlope
-    man, x, y = channel_parameters.Manning, channel_parameters.CentroidX, channel_parameters.CentroidY
-    ss1, ss2 = channel_parameters.SideSlope1, channel_parameters.SideSlope2
-    cv, ks, g = channel_parameters.CV, channel_parameters.Ksat, channel_parameters.G
-    dist, por, rock = channel_parameters.Distribution, channel_parameters.Porosity, channel_parameters.Rock
-    sand, silt, clay = channel_parameters.Sand, channel_parameters.Silt, channel_parameters.Clay,
-    coh = channel_parameters.Cohesion
-    sp = channel_parameters.Splash
-    pave = channel_parameters.Pave
-    Woolhiser = channel_parameters.Woolhiser
-    sat = 0.2
-    down_width, up_width = channel_parameters.DownstreamBottomWidth, channel_parameters.UpstreamBottomWidth
-    down_depth, up_depth = channel_parameters.DownstreamBankfullDepth, channel_parameters.UpstreamBankfullDepth
-
-    channel_info = (f"BEGIN CHANNEL\n"
-                    f"  ID = {channel_id}, PRINT = 3, FILE = channels\chan_{channel_id}.sim\n"
-                    f"  LAT =  {lat_id_str}\n"
-                    f"  UP =  {up_id_str}\n"
-                    f"  LEN = {length:.4f}, SLOPE = {slope:.4f}, X = {x:.4f}, Y = {y:.4f}\n"
-                    f"  WIDTH = {up_width:.4f}, {down_width:.4f}, DEPTH = {up_depth:.4f}, {down_depth:.4f}\n"
-                    f"  MAN = {man:.4f}, SS1 = {ss1:.4f}, SS2 = {ss2:.4f}\n"
-                    f"  WOOL = {Woolhiser}\n"
-                    f"  CV = {cv:.4f}, Ks = {ks:.4f}, G = {g:.4f}\n"
-                    f"  DIST = {dist:.4f}, POR = {por:.4f}, ROCK = {rock:.4f}\n"
-                    f"  FR = {sand:.4f}, {silt:.4f}, {clay:.4f}, SP = {sp:.4f}, COH = {coh:.4f}\n"
-                    f"  PAVE = {pave:.4f}\n"
-                    f"  SAT = {sat:.4f}\n"
-                    "END CHANNEL\n\n")
+    # channel_parameters is the text of the channel parameters, from format_element_blocks
+    channel_info = CHANNEL_HEADER_TEMPLATE % (channel_id, channel_id, lat_id_str, up_id_str) + channel_parameters
 
     return channel_info
 
 
 def extract_parameters(prjgdb, delineation, discretization, parameterization):
 
+    key = (delineation, discretization, parameterization)
+    return extract_parameters_for_parameterizations(prjgdb, [key])[key]
+
+
+def extract_parameters_for_parameterizations(prjgdb, parameterizations):
+    """Read the AGWA versions of several parameterizations, given as (delineation, discretization, 
+    parameterization), from one read of the metaParameterization table. Returns a dictionary keyed by 
+    parameterization."""
+
     tweet("Reading AGWA version")
     meta_parameterization_table = os.path.join(prjgdb, "metaParameterization")
     if not arcpy.Exists(meta_parameterization_table):
@@ -255,10 +311,15 @@ def extract_parameters(prjgdb, delineation, discretization, parameterization):
 
     fields = ["DelineationName", "DiscretizationName", "ParameterizationName", "AGWAVersionAtCreation", "AGWAGDBVersionAtCreation"]
     df_parameterization = pd.DataFrame(arcpy.da.TableToNumPyArray(meta_parameterization_table, fields))
-    df_parameterization_filtered = df_parameterization[(df_parameterization.DelineationName == delineation) &
-                                 (df_parameterization.DiscretizationName == discretization) &
-                                 (df_parameterization.ParameterizationName == parameterization)].squeeze()
-    agwa_version_at_creation = df_parameterization_filtered.AGWAGDBVersionAtCreation
-    agwa_gbd_version_at_creation = df_parameterization_filtered.AGWAGDBVersionAtCreation
+    df_parameterization = df_parameterization.drop_duplicates(fields[:3]).set_index(fields[:3])
+
+    versions = {}
+    for key in parameterizations:
+        if key not in df_parameterization.index:
+            raise Exception(f"Cannot proceed. Parameterization '{key[2]}' does not exist with delineation "
+                            f"'{key[0]}' and discretization '{key[1]}'.")
+        agwa_version_at_creation = df_parameterization.at[key, "AGWAGDBVersionAtCreation"]
+        agwa_gbd_version_at_creation = df_parameterization.at[key, "AGWAGDBVersionAtCreation"]
+        versions[key] = (agwa_version_at_creation, agwa_gbd_version_at_creation)
     
-    return agwa_version_at_creation, agwa_gbd_version_at_creation
+    return versions
@@ -1,6 +1,11 @@
 import os
 import sys
+import ast
+import glob
+import json
 import math
+import time
+import shutil
 import arcpy
 import datetime
 import requests
@@ -10,11 +15,34 @@ import arcpy.management
 from pathlib import Path
 from arcpy._mp import Table
 sys.path.append(os.path.join(os.path.dirname(__file__)))
+import config
 from config import AGWA_VERSION, AGWAGDB_VERSION
+import code_lookup_tables
 
 Prop_xcoord = "xcoord"
 Prop_ycoord = "ycoord"
 
+META_PRECIPITATION_FIELDS = ["DelineationName", "DiscretizationName", "PrecipitationFileName", "StormSource",
+                             "UserDepth", "UserDuration", "NoaaDuration", "NoaaRecurrence", "NoaaQuantile",
+                             "TimeStep", "UseNRCSHyetographShape", "HyetographShape", "UserRainfallFilePath", 
+                             "InitialSoilMoisture", "CreationDate", "AGWAVersionAtCreation", "AGWAGDBVersionAtCreation"]
+
+# NOAA Atlas 14 durations and recurrence intervals, in the order of the rows and columns of the NOAA depth table
+NOAA_DURATIONS = ["5min", "10min", "15min", "30min", "60min", "2hr", "3hr", "6hr", "12hr", "24hr", 
+                  "2day", "3day", "4day", "7day", "10day", "20day", "30day", "45day", "60day"]
+NOAA_DURATION_HOURS = ["0.0833", "0.1667", "0.25", "0.5", "1", "2", "3", "6", "12", 
+                       "24", "48", "72", "96", "168", "240", "360", "540", "720"]
+NOAA_RECURRENCES = ["1", "2", "5", "10", "25", "50", "100", "200", "500", "1000"]
+# Note: AGWA (ArcMap version) was set up for storms between 0.1 to 24 hr with increments of 0.1 hr
+# Duration such as 0.0833 hr (5 min) and longer than 24 hr are not supported
+# Therefore, the duration list is limited to 30 min to 24 hr in ArcGIS pro version of AGWA
+NOAA_SUPPORTED_DURATIONS = ["30min", "60min", "2hr", "3hr", "6hr", "12hr", "24hr"]
+NOAA_QUANTILES = ["Mean", "Upper 90%", "Lower 90%"]
+NOAA_URL = "https://hdsc.nws.noaa.gov/cgi-bin/hdsc/new/cgi_readH5.py"
+
+# File names of the design storm library. The fields are cleaned of characters other than letters and numbers.
+DESIGN_STORM_NAME_FORMAT = "{duration}_{recurrence}yr_{quantile}_{shape}"
+
 arcpy.env.overwriteOutput = True
 def tweet(msg):
     """Produce a message for both arcpy and python"""
@@ -30,19 +58,10 @@ def initialize_workspace(delineation, discretization, storm_source, user_depth,
     """Create the metaK2PrecipitationFile table if it does not exist and document the precipitation parameters."""
 
     tweet("Creating metaPrecipitationFile if it does not exist")    
-    meta_precipitation_table = os.path.join(prjgdb, "metaK2PrecipitationFile")
-    fields = ["DelineationName", "DiscretizationName", "PrecipitationFileName", "StormSource",
-              "UserDepth", "UserDuration", "NoaaDuration", "NoaaRecurrence", "NoaaQuantile",
-              "TimeStep", "UseNRCSHyetographShape", "HyetographShape", "UserRainfallFilePath", 
-              "InitialSoilMoisture", "CreationDate", "AGWAVersionAtCreation", "AGWAGDBVersionAtCreation"]              
-                
-    if not arcpy.Exists(meta_precipitation_table):
-        arcpy.CreateTable_management(prjgdb, "metaK2PrecipitationFile") 
-        for field in fields:
-            arcpy.AddField_management(meta_precipitation_table, field, "TEXT")
+    meta_precipitation_table = create_meta_precipitation_table(prjgdb)
     
     tweet("Documenting precipitation parameters to metadata")
-    with arcpy.da.InsertCursor(meta_precipitation_table, fields) as cursor:
+    with arcpy.da.InsertCursor(meta_precipitation_table, META_PRECIPITATION_FIELDS) as cursor:
         cursor.insertRow((delineation, discretization, precipitation_file_name, storm_source,
                           user_depth, user_duration, noaa_duration, noaa_recurrence, noaa_quantile,
                           time_step, use_nrcs_hyetograph_shape, hyetograph_shape, user_rainfall_file_path,
@@ -59,6 +78,32 @@ def initialize_workspace(delineation, discretization, storm_source, user_depth,
     map.addTable(table)
 
 
+def create_meta_precipitation_table(prjgdb):
+    """Create the metaK2PrecipitationFile table if it does not exist and return its path.
+    Called by initialize_workspace() and write_design_storm_library()."""
+
+    meta_precipitation_table = os.path.join(prjgdb, "metaK2PrecipitationFile")
+    if not arcpy.Exists(meta_precipitation_table):
+        arcpy.CreateTable_management(prjgdb, "metaK2PrecipitationFile") 
+        for field in META_PRECIPITATION_FIELDS:
+            arcpy.AddField_management(meta_precipitation_table, field, "TEXT")
+
+    return meta_precipitation_table
+
+
+def get_meta_precipitation_where_clause(table, delineation, discretization):
+    """Return the where clause that selects the rows of one discretization in the metaK2PrecipitationFile table. 
+    Field names are delimited for the workspace of the table, and quotes in the names are doubled. 
+    Called by write_design_storm_library()."""
+
+    conditions = []
+    for field, value in [("DelineationName", delineation), ("DiscretizationName", discretization)]:
+        value = str(value).replace("'", "''")
+        conditions.append(f"{arcpy.AddFieldDelimiters(table, field)} = '{value}'")
+
+    return " AND ".join(conditions)
+
+
 def process(prjgdb, workspace, delineation, discretization, precipitation_name):
     """Write the precipitation file for the specified delineation and discretization."""
 
@@ -83,7 +128,8 @@ def process(prjgdb, workspace, delineation, discretization, precipitation_name):
         (noaa_duration, noaa_recurrence,noaa_quantile, time_step, hyetograph_shape, 
             soil_moisture, agwa_directory) = results[0][1:]
 
-        noaa_depth, noaa_dur = get_noaa_rainfall_data(workspace, delineation, noaa_duration, noaa_recurrence, noaa_quantile)
+        noaa_depth, noaa_dur = get_noaa_rainfall_data(workspace, delineation, noaa_duration, noaa_recurrence, noaa_quantile,
+                                                      agwa_directory)
 
         write_file_with_depth_duration(agwa_directory, discretization, noaa_depth, noaa_dur,
                                        time_step, hyetograph_shape, soil_moisture, output_filename, storm_source)  
@@ -91,39 +137,343 @@ def process(prjgdb, workspace, delineation, discretization, precipitation_name):
     if storm_source == "user-defined hyetograph":
         (user_rainfall_file_path, soil_moisture, agwa_directory) = results[0][1:]
         write_file_with_user_rainfall_file(user_rainfall_file_path, discretization, soil_moisture, output_filename)
+
+    if storm_source == "gridded rainfall":
+        (rainfall_workspace, time_step, soil_moisture, agwa_directory) = results[0][1:]
+        rainfall_rasters = list_rainfall_rasters(rainfall_workspace)
+        write_file_with_gridded_rainfall(workspace, discretization, rainfall_rasters, time_step, soil_moisture, 
+                                         output_filename)
     
     tweet(f"Precipitation file '{precipitation_name}.pre' has been written to {output_directory}\n")
 
 
-def write_file_with_user_rainfall_file(csvfile, discretization, soil_moisture, output_filename):
-    """Write the precipitation file using the user-defined rainfall file. Called by process()."""
+def write_design_storm_library(prjgdb, workspace, delineation, discretization, durations=None, recurrences=None,
+                               quantiles=None, hyetograph_shapes=None, time_step=5, soil_moisture=0.2,
+                               name_format=DESIGN_STORM_NAME_FORMAT):
+    """Write NOAA Atlas 14 precipitation files for every combination of duration, recurrence interval, quantile, 
+    and hyetograph shape, and document them in the metaK2PrecipitationFile table. The NOAA depth table of the 
+    watershed is fetched once and the hyetograph shapes are read once. Durations, recurrences, and quantiles default 
+    to all the values supported by AGWA, and the hyetograph shape defaults to the NRCS shape of the watershed. 
+    Files are named with name_format, which can use the duration, recurrence, quantile, and shape fields. Existing 
+    files and metadata with the same names are replaced. Returns the list of precipitation file names."""
+
+    durations = [str(duration).lower() for duration in (durations or NOAA_SUPPORTED_DURATIONS)]
+    recurrences = [str(recurrence) for recurrence in (recurrences or NOAA_RECURRENCES)]
+    quantiles = list(quantiles or NOAA_QUANTILES)
+    unsupported = [duration for duration in durations if duration not in NOAA_SUPPORTED_DURATIONS]
+    if unsupported:
+        raise Exception(f"Cannot proceed. \nThe durations {unsupported} are not supported. "
+                        f"Supported durations are {NOAA_SUPPORTED_DURATIONS}.")
+
+    # Set up the output directory
+    output_directory = os.path.join(os.path.split(workspace)[0],
+                                    "modeling_files", discretization, "precipitation_files")
+    Path(output_directory).mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_csv(csvfile, skiprows=2)
-    last_row = df.iloc[-1]
-    duration = float(last_row[0])/60.
-    depth = last_row[1]    
-    header = write_header(discretization, depth, duration, "user-defined", "user-defined")
-    
-    # write header
-    output_file = open(output_filename, "w")
-    output_file.write(header)
-    
-    # write body
-    output_file.write("BEGIN RG\n"
-            "  X = 0, Y = 0\n"         
-            "  SAT = " + str(soil_moisture) + "\n"
-            "  N = " + str(len(df)) + "\n"
-            "    TIME    DEPTH\n" + \
-            "  ! (min)    (mm)\n")
-    
-    # write rainfall data in body
-    for _, row in df.iterrows():
-        time = row[0]
-        depth = row[1]
-        output_file.write(f"    {time:.4f}     {depth:.4f}\n")
-    output_file.write("END\n")
-    output_file.close()
+    # Read the AGWA directory from the metaWorkspace table
+    meta_workspace_table = os.path.join(prjgdb, "metaWorkspace")
+    df_meta_workspace = pd.DataFrame(arcpy.da.TableToNumPyArray(meta_workspace_table, '*'))
+    agwa_directory = df_meta_workspace['AGWADirectory'].values[0]
+    precip_distribution_file = os.path.join(agwa_directory, "lookup_tables.gdb", "nrcs_precipitation_distributions_LUT")
+
+    use_nrcs_hyetograph_shape = "false"
+    if not hyetograph_shapes:
+        use_nrcs_hyetograph_shape = "true"
+        hyetograph_shapes = [get_hyetograph_shape(agwa_directory, delineation, prjgdb)]
+    distributions = read_distributions(precip_distribution_file, hyetograph_shapes)
+
+    tweet("Fetching the NOAA Atlas 14 depth table of the watershed")
+    latitude, longitude = get_watershed_centroid(workspace, delineation)
+    noaa_table = fetch_noaa_table(latitude, longitude, get_noaa_cache_directory(agwa_directory))
+
+    def clean_name(value):
+        return "".join(character for character in str(value) if character.isalnum())
+
+    tweet(f"Writing {len(durations) * len(recurrences) * len(quantiles) * len(distributions)} precipitation files")
+    rows = []
+    creation_date = datetime.datetime.now().isoformat()
+    for duration in durations:
+        for recurrence in recurrences:
+            for quantile in quantiles:
+                depth, duration_hr = get_noaa_depth(noaa_table, duration, recurrence, get_noaa_quantile_type(quantile))
+                for hyetograph_shape, distribution in distributions.items():
+                    precipitation_name = name_format.format(duration=clean_name(duration), 
+                                                            recurrence=clean_name(recurrence),
+                                                            quantile=clean_name(quantile), 
+                                                            shape=clean_name(hyetograph_shape))
+                    header = write_header(discretization, depth, duration_hr, hyetograph_shape, "NOAA Atlas 14")
+                    body = write_from_distributions_lut(depth, duration_hr, time_step, hyetograph_shape, soil_moisture,
+                                                        precip_distribution_file, distribution=distribution)
+                    if body is None:
+                        raise Exception(f"Failed to write the precipitation file '{precipitation_name}.pre'.")
+                    with open(os.path.join(output_directory, precipitation_name + ".pre"), "w") as output_file:
+                        output_file.write(header + body)
+
+                    rows.append((delineation, discretization, precipitation_name, "NOAA Atlas 14",
+                                 None, None, duration, recurrence, quantile,
+                                 str(time_step), use_nrcs_hyetograph_shape, hyetograph_shape, None,
+                                 str(soil_moisture), creation_date, AGWA_VERSION, AGWAGDB_VERSION))
+
+    # Replace the metadata of existing files with the same names, then document all the files at once
+    tweet("Documenting precipitation parameters to metadata")
+    meta_precipitation_table = create_meta_precipitation_table(prjgdb)
+    precipitation_names = [row[2] for row in rows]
+    replaced_names = set(precipitation_names)
+    where_clause = get_meta_precipitation_where_clause(meta_precipitation_table, delineation, discretization)
+    with arcpy.da.UpdateCursor(meta_precipitation_table, ["PrecipitationFileName"], where_clause) as cursor:
+        for row in cursor:
+            if row[0] in replaced_names:
+                cursor.deleteRow()
+    with arcpy.da.InsertCursor(meta_precipitation_table, META_PRECIPITATION_FIELDS) as cursor:
+        for row in rows:
+            cursor.insertRow(row)
+
+    tweet(f"{len(rows)} precipitation files have been written to {output_directory}\n")
+    return precipitation_names
+
+
+def write_file_with_user_rainfall_file(csvfile, discretization, soil_moisture, output_filename, 
+                                       thinning_tolerance=None):
+    """Write the precipitation file using the user-defined rainfall file. Called by process().
+    The rainfall file is read config.USER_RAINFALL_CHUNK_ROWS rows at a time, so long gauge records are not held
+    in memory. Times (min) must increase and cumulative depths (mm) must not decrease. Time steps within
+    thinning_tolerance (config.USER_RAINFALL_THINNING_TOLERANCE if not given) of the linear interpolation between
+    the remaining time steps are removed."""
+
+    if thinning_tolerance is None:
+        thinning_tolerance = config.USER_RAINFALL_THINNING_TOLERANCE
+
+    # The rainfall lines are written to a temporary file first, since the header needs the number of lines and 
+    # the last time and depth. The temporary file is removed even if the rainfall file is not valid.
+    body_filename = output_filename + ".tmp"
+    line_count = 0
+    last_row = None
+    previous_time, previous_depth = -np.inf, -np.inf
+    try:
+        with open(body_filename, "w", buffering=1024 * 1024) as body_file:
+            for chunk_number, chunk in enumerate(pd.read_csv(csvfile, skiprows=2, 
+                                                             chunksize=config.USER_RAINFALL_CHUNK_ROWS)):
+                # a file with a header and no rows gives an empty chunk
+                if chunk.empty:
+                    continue
+                first_row = chunk_number * config.USER_RAINFALL_CHUNK_ROWS
+                times, depths = validate_user_rainfall(chunk, first_row, previous_time, previous_depth)
+                if thinning_tolerance > 0:
+                    keep = thin_breakpoints(times, depths, thinning_tolerance)
+                    times, depths = times[keep], depths[keep]
+                body_file.write("".join(map(USER_RAINFALL_LINE_TEMPLATE.__mod__, 
+                                            zip(times.tolist(), depths.tolist()))))
+                line_count += len(times)
+                last_row = chunk.iloc[-1]
+                previous_time, previous_depth = times[-1], depths[-1]
+
+        if last_row is None:
+            raise Exception(f"Cannot proceed. \nThe rainfall file '{csvfile}' has no rainfall data.")
+        duration = float(last_row.iloc[0])/60.
+        depth = last_row.iloc[1]    
+        header = write_header(discretization, depth, duration, "user-defined", "user-defined")
+        
+        # write header and body
+        with open(output_filename, "w", buffering=1024 * 1024) as output_file:
+            output_file.write(header)
+            output_file.write("BEGIN RG\n"
+                    "  X = 0, Y = 0\n"         
+                    "  SAT = " + str(soil_moisture) + "\n"
+                    "  N = " + str(line_count) + "\n"
+                    "    TIME    DEPTH\n" + \
+                    "  ! (min)    (mm)\n")
+            with open(body_filename, "r") as body_file:
+                shutil.copyfileobj(body_file, output_file, 1024 * 1024)
+            output_file.write("END\n")
+    finally:
+        if os.path.exists(body_filename):
+            os.remove(body_filename)
+
+
+USER_RAINFALL_LINE_TEMPLATE = "    %.4f     %.4f\n"
+
+
+def validate_user_rainfall(chunk, first_row, previous_time, previous_depth):
+    """Return the times and cumulative depths of a chunk of the user rainfall file as float arrays. Raises an 
+    exception if they are not numbers, if the times do not increase, or if the depths decrease. previous_time 
+    and previous_depth are the last values of the previous chunk. Called by write_file_with_user_rainfall_file()."""
+
+    if chunk.shape[1] < 2:
+        raise Exception("Cannot proceed. \nThe rainfall file must have a time (min) and a depth (mm) column.")
+    try:
+        times = chunk.iloc[:, 0].to_numpy(dtype=np.float64)
+        depths = chunk.iloc[:, 1].to_numpy(dtype=np.float64)
+    except ValueError:
+        raise Exception(f"Cannot proceed. \nThe rainfall file has values that are not numbers between data rows "
+                        f"{first_row + 1} and {first_row + len(chunk)}.")
+
+    invalid = np.flatnonzero(np.isnan(times) | np.isnan(depths) |
+                             (np.diff(times, prepend=previous_time) <= 0) | 
+                             (np.diff(depths, prepend=previous_depth) < 0))
+    if len(invalid):
+        raise Exception(f"Cannot proceed. \nData row {first_row + invalid[0] + 1} of the rainfall file is missing a "
+                        f"value, or its time does not increase or its cumulative depth decreases.")
     
+    return times, depths
+
+
+def thin_breakpoints(times, depths, tolerance):
+    """Return a mask of the time steps to keep so that the cumulative depth of every removed time step is within 
+    tolerance of the linear interpolation between the kept time steps. The first and last time steps are kept. 
+    Called by write_file_with_user_rainfall_file()."""
+
+    keep = np.ones(len(times), dtype=bool)
+    if len(times) < 3:
+        return keep
+
+    # remove the time steps that are close to the line between their neighbors
+    interpolated = depths[:-2] + (depths[2:] - depths[:-2]) * (times[1:-1] - times[:-2]) / (times[2:] - times[:-2])
+    keep[1:-1] = np.abs(depths[1:-1] - interpolated) > tolerance
+
+    # removing consecutive time steps can add up to more than the tolerance, so time steps too far from the line
+    # between the kept time steps around them are restored until all are within the tolerance
+    indices = np.arange(len(times))
+    while True:
+        previous_kept = np.maximum.accumulate(np.where(keep, indices, 0))
+        next_kept = np.minimum.accumulate(np.where(keep, indices, len(times) - 1)[::-1])[::-1]
+        removed = np.flatnonzero(~keep)
+        start, end = previous_kept[removed], next_kept[removed]
+        interpolated = depths[start] + (depths[end] - depths[start]) * (times[removed] - times[start]) / (
+            times[end] - times[start])
+        too_far = np.abs(depths[removed] - interpolated) > tolerance
+        if not too_far.any():
+            return keep
+        # restore the time step farthest from the line in each gap
+        errors = np.where(too_far, np.abs(depths[removed] - interpolated), -1)
+        gap_order = np.lexsort((-errors, start))
+        first_in_gap = np.r_[True, start[gap_order][1:] != start[gap_order][:-1]]
+        restored = gap_order[first_in_gap & too_far[gap_order]]
+        keep[removed[restored]] = True
+
+
+GAUGE_TEMPLATE = ("BEGIN RG%s\n"
+                  "  X = %s, Y = %s\n"
+                  "  SAT = %s\n"
+                  "  N = %s\n"
+                  "  TIME        DEPTH\n"
+                  "! (min)        (mm)\n")
+
+GAUGE_LINE_TEMPLATE = "%6.2f%13.2f\n"
+
+
+def write_file_with_gridded_rainfall(workspace, discretization, rainfall_rasters, time_step, soil_moisture, 
+                                     output_filename, block_frames=None):
+    """Write the precipitation file with one rain gauge per hillslope from gridded rainfall, such as radar or MRMS 
+    rainfall. rainfall_rasters are the rainfall grids in time order, on the same grid, each holding the rainfall 
+    depth (mm) of one time step of time_step minutes. The depth of each hillslope is the mean of the cells whose 
+    centers fall within it, and hillslopes without such a cell take the cell at their centroid. Each gauge is 
+    placed at the centroid of its hillslope. The grids are read config.GRIDDED_RAINFALL_BLOCK_FRAMES at a time and 
+    the file is written one gauge at a time. Called by process()."""
+
+    block_frames = block_frames or config.GRIDDED_RAINFALL_BLOCK_FRAMES
+    hillslope_feature_class = os.path.join(workspace, f"{discretization}_hillslopes")
+    label_raster = os.path.join(workspace, f"{discretization}_hillslopes_rainfall_grid")
+    hillslope_ids, centroids, cell_indices, zone_indices, window = get_hillslope_rainfall_cells(
+        hillslope_feature_class, rainfall_rasters[0], label_raster)
+
+    # Mean depth of each hillslope and time step. The cells of a block of grids are summed by hillslope with one 
+    # bincount, each grid offset by the number of hillslopes.
+    tweet(f"Averaging {len(rainfall_rasters)} rainfall grids over {len(hillslope_ids)} hillslopes")
+    hillslope_count = len(hillslope_ids)
+    depths = np.zeros((hillslope_count, len(rainfall_rasters)), dtype=np.float32)
+    for first_frame in range(0, len(rainfall_rasters), block_frames):
+        frames = rainfall_rasters[first_frame:first_frame + block_frames]
+        values = np.stack([read_rainfall_grid(frame, *window).ravel()[cell_indices] for frame in frames])
+        keys = (zone_indices + np.arange(len(frames))[:, np.newaxis] * hillslope_count)[np.isfinite(values)]
+        values = values[np.isfinite(values)]
+        sums = np.bincount(keys, weights=values, minlength=len(frames) * hillslope_count)
+        counts = np.bincount(keys, minlength=len(frames) * hillslope_count)
+        means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+        depths[:, first_frame:first_frame + len(frames)] = means.reshape(len(frames), hillslope_count).T
+
+    duration = len(rainfall_rasters) * time_step / 60.
+    mean_depth = round(float(depths.sum(axis=1, dtype=np.float64).mean()), 2) if hillslope_count else 0.
+    header = write_header(discretization, mean_depth, duration, "gridded", "gridded rainfall")
+    times = (np.arange(len(rainfall_rasters) + 1) * time_step).tolist()
+    with open(output_filename, "w", buffering=1024 * 1024) as output_file:
+        output_file.write(header)
+        for hillslope_id, (x, y), hillslope_depths in zip(hillslope_ids.tolist(), centroids, depths):
+            cum_depths = np.concatenate([[0.], np.cumsum(hillslope_depths, dtype=np.float64)]).tolist()
+            output_file.write(GAUGE_TEMPLATE % (hillslope_id, x, y, soil_moisture, len(times)))
+            output_file.write("".join(map(GAUGE_LINE_TEMPLATE.__mod__, zip(times, cum_depths))))
+            output_file.write("END\n\n")
+
+
+def list_rainfall_rasters(rainfall_workspace):
+    """Return the paths of the rainfall grids of a folder or geodatabase, in time order. The grids are sorted by 
+    name, so their names must sort in time order, as the time stamps of radar and MRMS file names do. 
+    Called by process()."""
+
+    if not arcpy.Exists(rainfall_workspace):
+        raise Exception(f"Cannot proceed. \nThe rainfall grid workspace '{rainfall_workspace}' does not exist.")
+    with arcpy.EnvManager(workspace=rainfall_workspace):
+        raster_names = sorted(arcpy.ListRasters() or [])
+    if not raster_names:
+        raise Exception(f"Cannot proceed. \nThe rainfall grid workspace '{rainfall_workspace}' has no rasters.")
+
+    return [os.path.join(rainfall_workspace, raster_name) for raster_name in raster_names]
+
+
+def get_hillslope_rainfall_cells(hillslope_feature_class, rainfall_raster, label_raster):
+    """Rasterize the hillslopes on the rainfall grid (saved as label_raster) and find the rainfall cells of each 
+    hillslope. Returns the sorted hillslope IDs, their centroids, the indices of the cells in the label raster 
+    window with the index of their hillslope, and the window (lower left point, columns, rows) of the label raster. 
+    Called by write_file_with_gridded_rainfall()."""
+
+    if arcpy.Exists(label_raster):
+        arcpy.Delete_management(label_raster)
+
+    # snap to the rainfall raster so that both rasters share the same cells
+    tweet(f"Rasterizing {os.path.basename(hillslope_feature_class)} on the rainfall grid.")
+    rainfall_desc = arcpy.Describe(rainfall_raster)
+    with arcpy.EnvManager(snapRaster=rainfall_raster, extent=arcpy.Describe(hillslope_feature_class).extent,
+                          outputCoordinateSystem=rainfall_desc.spatialReference):
+        arcpy.conversion.PolygonToRaster(hillslope_feature_class, "HillslopeID", label_raster, "CELL_CENTER", 
+                                         "NONE", rainfall_desc.meanCellWidth)
+
+    label = arcpy.Raster(label_raster)
+    window = (arcpy.Point(label.extent.XMin, label.extent.YMin), label.width, label.height)
+    labels = arcpy.RasterToNumPyArray(label_raster).ravel()
+
+    df_hillslopes = pd.DataFrame(arcpy.da.SearchCursor(hillslope_feature_class, ["HillslopeID", "SHAPE@XY"]),
+                                 columns=["HillslopeID", "Centroid"]).sort_values("HillslopeID")
+    hillslope_ids = df_hillslopes.HillslopeID.to_numpy(dtype=np.int64)
+
+    cell_indices = np.flatnonzero(np.isin(labels, hillslope_ids))
+    zone_indices = np.searchsorted(hillslope_ids, labels[cell_indices])
+
+    # hillslopes smaller than a cell take the cell at their centroid
+    missing_ids = np.setdiff1d(hillslope_ids, labels[cell_indices])
+    if len(missing_ids):
+        centroid_cells, centroid_zones = [], []
+        where_clause = f"HillslopeID IN ({', '.join(map(str, missing_ids.tolist()))})"
+        with arcpy.da.SearchCursor(hillslope_feature_class, ["HillslopeID", "SHAPE@XY"], where_clause,
+                                   rainfall_desc.spatialReference) as cursor:
+            for hillslope_id, (x, y) in cursor:
+                column = min(max(int((x - label.extent.XMin) // label.meanCellWidth), 0), label.width - 1)
+                row = min(max(int((label.extent.YMax - y) // label.meanCellHeight), 0), label.height - 1)
+                centroid_cells.append(row * label.width + column)
+                centroid_zones.append(np.searchsorted(hillslope_ids, hillslope_id))
+        cell_indices = np.concatenate([cell_indices, centroid_cells]).astype(np.int64)
+        zone_indices = np.concatenate([zone_indices, centroid_zones]).astype(np.int64)
+
+    return hillslope_ids, df_hillslopes.Centroid.tolist(), cell_indices, zone_indices, window
+
+
+def read_rainfall_grid(rainfall_raster, lower_left, columns, rows):
+    """Read a window of a rainfall grid as floats, with NoData as NaN. Called by write_file_with_gridded_rainfall()."""
+
+    values = arcpy.RasterToNumPyArray(rainfall_raster, lower_left, columns, rows).astype(np.float64)
+    nodata = arcpy.Raster(rainfall_raster).noDataValue
+    if nodata is not None:
+        values[values == nodata] = np.nan
+    return values
+
 
 def write_file_with_depth_duration(agwa_directory, discretization, depth, duration, time_step, hyetograph_shape,
                                    soil_moisture, output_filename, storm_source):
@@ -139,10 +489,24 @@ def write_file_with_depth_duration(agwa_directory, discretization, depth, durati
     output_file.close()
 
 
-def get_noaa_rainfall_data(workspace, delineation, duration, recurrence, quantile_name):
+def get_noaa_rainfall_data(workspace, delineation, duration, recurrence, quantile_name, agwa_directory=None):
     """Get NOAA rainfall data for the specified latitude and longitude. Called by process()."""
 
     # get the latitude and longitude of the watershed
+    latitude, longitude = get_watershed_centroid(workspace, delineation)
+
+    # get the NOAA rainfall data
+    quantile_type = get_noaa_quantile_type(quantile_name)
+    noaa_depth, noaa_duration = fetch_noaa_data(latitude, longitude, duration, recurrence, quantile_type, quantile_name,
+                                                get_noaa_cache_directory(agwa_directory))
+
+    return noaa_depth, noaa_duration
+
+
+def get_watershed_centroid(workspace, delineation):
+    """Return the latitude and longitude of the watershed centroid in NAD83.
+    Called by get_noaa_rainfall_data() and write_design_storm_library()."""
+
     watershed_polygon_feature_class = os.path.join(workspace, f"{delineation}")
     fields_to_add = [("centroid_lat", "DOUBLE"), ("centroid_lon", "DOUBLE")]
     def field_exists(feature_class, field_name):
@@ -171,76 +535,161 @@ def get_noaa_rainfall_data(workspace, delineation, duration, recurrence, quantil
             latitude = row[0]
             longitude = row[1]
             break
-    # print(latitude, longitude)
 
-    # get the NOAA rainfall data
+    return latitude, longitude
+
+
+def get_noaa_quantile_type(quantile_name):
+    """Return the key of the NOAA depth table for a quantile name such as Mean or Upper 90%."""
+
     quantile_type = quantile_name.lower().split(" ")[0]
     if quantile_type == "mean":
         quantile_type = "quantiles"
-    noaa_depth, noaa_duration = fetch_noaa_data(latitude, longitude, duration, recurrence, quantile_type, quantile_name)
-
-    return noaa_depth, noaa_duration
+    return quantile_type
 
   
-def fetch_noaa_data(latitude, longitude, duration, recurrence, quantile_type, quantile_name):
+def fetch_noaa_data(latitude, longitude, duration, recurrence, quantile_type, quantile_name, cache_directory=None):
     """Fetch NOAA data for the specified latitude and longitude. Called by get_noaa_rainfall_data()."""
     
+    parsed_data = fetch_noaa_table(latitude, longitude, cache_directory)
+    rain_volume, duration_hr = get_noaa_depth(parsed_data, duration, recurrence, quantile_type)
+
+    msg = (f"NOAA data fetched successfully from https://hdsc.nws.noaa.gov/pfds\n"
+           f"   Results for {recurrence.lower()} year {duration_hr} hours {quantile_name} rainfall: {rain_volume}mm.\n"
+           f"   Watershed Centroid Point:  Lat {parsed_data['lat']}, Lon {parsed_data['lon']}\n"
+           f"   Region: {parsed_data['region']}\n   Unit: {parsed_data['unit']}\n   Datatype: {parsed_data['datatype']}\n"
+           f"   Volume: {parsed_data['volume']}\n   Version: {parsed_data['version']}\n")
+            # , authors: {parsed_data['authors']}"  authors list can be too long        
+    tweet(msg)
+
+    return rain_volume, duration_hr
+
+
+def get_noaa_cache_directory(agwa_directory):
+    """Return the directory of the NOAA Atlas 14 response cache, or None if responses are not cached."""
+
+    if not config.NOAA_CACHE:
+        return None
+    if config.NOAA_CACHE_DIRECTORY:
+        return config.NOAA_CACHE_DIRECTORY
+    if agwa_directory:
+        return os.path.join(agwa_directory, "noaa_atlas_14_cache")
+    return None
+
+
+def fetch_noaa_table(latitude, longitude, cache_directory=None):
+    """Fetch the NOAA Atlas 14 depth tables of all durations and recurrence intervals for the specified latitude 
+    and longitude. Returns the parsed response, where the quantiles, upper, and lower keys hold the depth tables.
+    When a cache directory is given, cached responses are used and new responses are cached, keyed by the latitude
+    and longitude rounded to config.NOAA_CACHE_DECIMALS. The point sent to NOAA is not rounded. With 
+    config.NOAA_OFFLINE, only cached responses are used.
+    Called by fetch_noaa_data() and write_design_storm_library()."""
+
     # Add NOAA Atlas 14 web scraping as an option for creating precipitation file
     # FAQ with NOAA's position on web scraping in question 2.5
     # https://www.weather.gov/owp/hdsc_faqs
     # Example web scraping request
     # https://hdsc.nws.noaa.gov/cgi-bin/hdsc/new/cgi_readH5.py?lat=37.4000&lon=-119.2000&type=pf&data=depth&units=english&series=pds
 
-    # fetch NOAA data
-    base_url = "https://hdsc.nws.noaa.gov/cgi-bin/hdsc/new/cgi_readH5.py"
     params = {
-        "lat": latitude,
-        "lon": longitude,
+        "lat": float(latitude),
+        "lon": float(longitude),
         "type": "pf",
         "data": "depth",
         "units": "metric",
-        "series": "pds"}    
-    response = requests.get(base_url, params=params)
-    
-    if response.status_code == 200:
-        data = response.text        
-        parsed_data = {}
-        lines = data.split('\n')        
-        for line in lines:
-            if line.startswith('quantiles') or line.startswith('upper') or line.startswith('lower'):
-                key = line.split('=')[0].strip()
-                value = eval(line.split('=')[1].strip(';'))
-                parsed_data[key] = value
-            else:
-                parts = line.split('=')
-                if len(parts) == 2:
-                    key, value = parts
-                    parsed_data[key.strip()] = value.strip().strip("';")        
-    elif response.status_code == 500:
-        raise Exception("NOAA server error. Please try again later.")
-    else:
-        raise Exception(f"Failed to fetch NOAA data: {response.status_code}")
-    
+        "series": "pds"}
+
+    cache_path = None
+    if cache_directory:
+        cache_key = dict(params, lat=round(params["lat"], config.NOAA_CACHE_DECIMALS), 
+                         lon=round(params["lon"], config.NOAA_CACHE_DECIMALS))
+        cache_path = os.path.join(cache_directory, 
+                                  "{type}_{data}_{units}_{series}_{lat}_{lon}.json".format(**cache_key))
+        remove_expired_noaa_responses(cache_directory)
+        if os.path.exists(cache_path):
+            with open(cache_path, "r") as cache_file:
+                tweet(f"Using the cached NOAA response {cache_path}")
+                return json.load(cache_file)["response"]
+
+    if config.NOAA_OFFLINE:
+        raise Exception(f"Cannot proceed. \nNOAA offline mode is enabled and there is no cached response for "
+                        f"lat {params['lat']}, lon {params['lon']} in {cache_directory}.")
+
+    parsed_data = parse_noaa_response(request_noaa_data(params))
+
+    if cache_path:
+        os.makedirs(cache_directory, exist_ok=True)
+        with open(cache_path + ".tmp", "w") as cache_file:
+            json.dump({"request": params, "fetched": datetime.datetime.now().isoformat(), "response": parsed_data},
+                      cache_file)
+        os.replace(cache_path + ".tmp", cache_path)
+
+    return parsed_data
+
+
+def request_noaa_data(params):
+    """Request the NOAA Atlas 14 precipitation frequency data and return the response text. Requests that time out, 
+    fail to connect, or get a server error are retried config.NOAA_REQUEST_RETRIES times. Called by 
+    fetch_noaa_table()."""
+
+    attempts = max(config.NOAA_REQUEST_RETRIES, 1)
+    for attempt in range(1, attempts + 1):
+        try:
+            response = requests.get(NOAA_URL, params=params, timeout=config.NOAA_REQUEST_TIMEOUT)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            if attempt == attempts:
+                raise Exception(f"Failed to fetch NOAA data after {attempts} attempts: {e}")
+        else:
+            if response.status_code == 200:
+                return response.text
+            if response.status_code < 500:
+                raise Exception(f"Failed to fetch NOAA data: {response.status_code}")
+            if attempt == attempts:
+                raise Exception("NOAA server error. Please try again later.")
+        tweet(f"NOAA request attempt {attempt} of {attempts} failed, retrying")
+        time.sleep(2 ** attempt)
+
+
+def parse_noaa_response(data):
+    """Parse the NOAA Atlas 14 response text. The depth tables are read as Python literals and the other values 
+    as text. Called by fetch_noaa_table()."""
+
+    parsed_data = {}
+    lines = data.split('\n')        
+    for line in lines:
+        if line.startswith('quantiles') or line.startswith('upper') or line.startswith('lower'):
+            key = line.split('=')[0].strip()
+            value = ast.literal_eval(line.split('=')[1].strip().strip(';'))
+            parsed_data[key] = value
+        else:
+            parts = line.split('=')
+            if len(parts) == 2:
+                key, value = parts
+                parsed_data[key.strip()] = value.strip().strip("';")        
+
+    return parsed_data
+
+
+def remove_expired_noaa_responses(cache_directory):
+    """Remove cached NOAA responses older than config.NOAA_CACHE_MAX_AGE_DAYS. Expired responses are kept in 
+    offline mode, since they cannot be fetched again. Called by fetch_noaa_table()."""
+
+    if config.NOAA_CACHE_MAX_AGE_DAYS <= 0 or config.NOAA_OFFLINE:
+        return
+    oldest_time = time.time() - config.NOAA_CACHE_MAX_AGE_DAYS * 86400
+    for cache_path in glob.glob(os.path.join(cache_directory, "*.json")):
+        if os.path.getmtime(cache_path) < oldest_time:
+            os.remove(cache_path)
+
+
+def get_noaa_depth(parsed_data, duration, recurrence, quantile_type):
+    """Return the rainfall depth (mm) and the duration (hours) of a duration and recurrence interval from the 
+    parsed NOAA response. Called by fetch_noaa_data() and write_design_storm_library()."""
+
     # get the rainfall volume for the specified duration and recurrence
-    duration_list_string = ["5min", "10min", "15min", "30min", "60min", "2hr", "3hr", "6hr", "12hr", "24hr", 
-                    "2day", "3day", "4day", "7day", "10day", "20day", "30day", "45day", "60day"]
-    duration_list_hour = ["0.0833", "0.1667", "0.25", "0.5", "1", "2", "3", "6", "12", 
-                          "24", "48", "72", "96", "168", "240", "360", "540", "720"]
-    recurrence_yearlist = ["1", "2", "5", "10", "25", "50", "100", "200", "500", "1000"]
-    # Note: AGWA (ArcMap version) was set up for storms between 0.1 to 24 hr with increments of 0.1 hr
-    # Duration such as 0.0833 hr (5 min) and longer than 24 hr are not supported
-    # Therefore, the duration list is limited to 30 min to 24 hr in ArcGIS pro version of AGWA
-    df = pd.DataFrame(parsed_data[quantile_type.lower()], columns=recurrence_yearlist, index=duration_list_string)    
+    df = pd.DataFrame(parsed_data[quantile_type.lower()], columns=NOAA_RECURRENCES, index=NOAA_DURATIONS)    
     rain_volume = float(df.loc[duration.lower(), recurrence.lower()])
-    duration_hr = float(duration_list_hour[duration_list_string.index(duration.lower())])
-
-    msg = (f"NOAA data fetched successfully from https://hdsc.nws.noaa.gov/pfds\n"
-           f"   Results for {recurrence.lower()} year {duration_hr} hours {quantile_name} rainfall: {rain_volume}mm.\n"
-           f"   Watershed Centroid Point:  Lat {parsed_data['lat']}, Lon {parsed_data['lon']}\n"
-           f"   Region: {parsed_data['region']}\n   Unit: {parsed_data['unit']}\n   Datatype: {parsed_data['datatype']}\n"
-           f"   Volume: {parsed_data['volume']}\n   Version: {parsed_data['version']}\n")
-            # , authors: {parsed_data['authors']}"  authors list can be too long        
-    tweet(msg)
+    duration_hr = float(NOAA_DURATION_HOURS[NOAA_DURATIONS.index(duration.lower())])
 
     return rain_volume, duration_hr
 
@@ -258,9 +707,10 @@ def write_header(discretization_base_name, depth, duration, storm_shape, storm_s
 
 
 def write_from_distributions_lut(depth, duration, time_step_duration, hyetograph_shape, soil_moisture,
-                                 precip_distribution_file, hillslope_id="notSet"):
-    """Write the precipitation file using the precipitation distribution lookup table. 
-       Called by write_file_with_depth_duration()."""
+                                 precip_distribution_file, hillslope_id="notSet", distribution=None):
+    """Write the precipitation file using the precipitation distribution lookup table. distribution can hold the
+       (times, cumulative fractions) arrays of the hyetograph shape from read_distributions, so the table is not
+       read again. Called by write_file_with_depth_duration() and write_design_storm_library()."""
     
     try:
         time_steps = math.floor((duration * 60 / time_step_duration) + 1)
@@ -280,54 +730,33 @@ def write_from_distributions_lut(depth, duration, time_step_duration, hyetograph
                       "! (min)        (mm)\n"
         design_storm = rg_line + coordinate_line + soil_moisture_line + time_steps_line + header_line
 
-        fields = ["Time", hyetograph_shape]
-
-        time = 0.0
-        value = 0.0
-        max_dif = 0.0
-        t_start = 0.0
-        t_end = 0.0
-        p_start = 0.0
-        p_end = 0.0
-
-        dist_curs = arcpy.da.SearchCursor(precip_distribution_file, fields)
-        for dist_row in dist_curs:
-            time = dist_row[0]
-            value = dist_row[1]
-            new_time = time + duration
-            if new_time <= 24:
-                where_clause = "Time = " + str(new_time)
-
-                upper_bound_curs = arcpy.da.SearchCursor(
-                    precip_distribution_file, fields, where_clause)
-                upper_bound_row = next(upper_bound_curs)
-                upper_time = upper_bound_row[0]
-                upper_value = upper_bound_row[1]
-                difference = upper_value - value
-
-                if difference > max_dif:
-                    t_start = time
-                    t_end = upper_time
-                    p_start = value
-                    p_end = upper_value
-                    max_dif = difference
-
-        the_kin_time = 0
-        cum_depth = 0
-        p_ratio = 0
+        # Read the distribution once as arrays sorted by time. The cumulative fractions are interpolated, which
+        # returns the tabulated values at the tabulated times.
+        if distribution is None:
+            distribution = read_distributions(precip_distribution_file, [hyetograph_shape])[hyetograph_shape]
+        times, fractions = distribution
+
+        # Find the window of the storm duration with the largest increase of the cumulative fraction, 
+        # the first one if several windows have the same increase
+        in_day = times + duration <= 24
+        window_starts = times[in_day]
+        differences = np.interp(window_starts + duration, times, fractions) - fractions[in_day]
+        if len(differences) == 0 or differences.max() <= 0:
+            raise ValueError(f"No storm window of {duration} hours found in the {hyetograph_shape} distribution.")
+        window = np.argmax(differences)
+        t_start = window_starts[window]
+        p_start = fractions[in_day][window]
+        p_end = np.interp(t_start + duration, times, fractions)
+
+        # Cumulative depths of all time steps. The times are rounded to the 0.1 hour resolution of the table.
+        step_times = t_start + np.arange(time_steps) * time_step_duration / 60
+        step_times = np.array([round(step_time, 1) for step_time in step_times.tolist()])
+        cum_depths = depth * (np.interp(step_times, times, fractions) - p_start) / (p_end - p_start)
+
         current_time = ""
         current_depth = ""
-
-        for i in range(time_steps):
-            the_time = t_start + i * time_step_duration / 60
+        for i, cum_depth in enumerate(cum_depths.tolist()):
             the_kin_time = i * time_step_duration
-            p_ratio_query = "Time = " + str(round(the_time, 1))
-            p_ratio_cursor = arcpy.da.SearchCursor(
-                precip_distribution_file, fields, p_ratio_query)
-            p_ratio_row = next(p_ratio_cursor)
-            p_ratio = p_ratio_row[1]
-
-            cum_depth = depth * (p_ratio - p_start) / (p_end - p_start)
 
             # Add the current line to the string
             current_time = "%.2f" % round(the_kin_time, 2)
@@ -364,6 +793,19 @@ def write_from_distributions_lut(depth, duration, time_step_duration, hyetograph
         tweet(msg)
 
 
+def read_distributions(precip_distribution_file, hyetograph_shapes):
+    """Read the cumulative fractions of hyetograph shapes from the precipitation distribution lookup table.
+    Returns a dictionary of hyetograph shape to (times, cumulative fractions) arrays sorted by time.
+    Called by write_from_distributions_lut() and write_design_storm_library()."""
+
+    fields = ["Time"] + [shape for shape in dict.fromkeys(hyetograph_shapes)]
+    df_distribution = code_lookup_tables.read_lookup_table(precip_distribution_file, fields)
+    df_distribution = df_distribution.sort_values("Time", kind="stable")
+    times = df_distribution.Time.to_numpy(dtype=np.float64)
+
+    return {shape: (times, df_distribution[shape].to_numpy(dtype=np.float64)) for shape in fields[1:]}
+
+
 def extract_parameters(prjgdb, delineation, discretization, precipitation_file):    
     """Extract the precipitation parameters from the metaK2PrecipitationFile table. Called by process()."""
 
@@ -385,6 +827,13 @@ def extract_parameters(prjgdb, delineation, discretization, precipitation_file):
               "TimeStep", "UseNRCSHyetographShape", "HyetographShape", "UserRainfallFilePath", "InitialSoilMoisture",  
               "CreationDate", "AGWAVersionAtCreation", "AGWAGDBVersionAtCreation"]     
     
+    # the NRCS hyetograph shape of the watershed is found once
+    nrcs_hyetograph_shape = []
+    def get_nrcs_hyetograph_shape():
+        if not nrcs_hyetograph_shape:
+            nrcs_hyetograph_shape.append(get_hyetograph_shape(agwa_directory, delineation, prjgdb))
+        return nrcs_hyetograph_shape[0]
+
     results = []
     with arcpy.da.SearchCursor(meta_precipitation_table, fields) as cursor:
         for row in cursor:
@@ -397,7 +846,7 @@ def extract_parameters(prjgdb, delineation, discretization, precipitation_file):
                     time_step = int(row[9])
                     use_nrcs_hyetograph_shape = row[10]
                     if use_nrcs_hyetograph_shape == "true":
-                        hyetograph_shape = get_hyetograph_shape(agwa_directory, delineation, prjgdb)
+                        hyetograph_shape = get_nrcs_hyetograph_shape()
                     else:
                         hyetograph_shape = row[11]
                     results.append([storm_source, user_depth, user_duration, time_step, hyetograph_shape, soil_moisture, agwa_directory])
@@ -408,13 +857,18 @@ def extract_parameters(prjgdb, delineation, discretization, precipitation_file):
                     time_step = int(row[9]) 
                     use_nrcs_hyetograph_shape = row[10]
                     if use_nrcs_hyetograph_shape == "true":
-                        hyetograph_shape = get_hyetograph_shape(agwa_directory, delineation, prjgdb)
+                        hyetograph_shape = get_nrcs_hyetograph_shape()
                     else:
                         hyetograph_shape = row[11] 
                     results.append([storm_source, noaa_duration, noaa_recurrence, noaa_quantile, time_step, hyetograph_shape, soil_moisture, agwa_directory])
                 elif storm_source == "user-defined hyetograph":
                     user_rainfall_file_path = row[12]                    
                     results.append([storm_source, user_rainfall_file_path, soil_moisture, agwa_directory])
+                elif storm_source == "gridded rainfall":
+                    # the folder or geodatabase of the rainfall grids is documented as the user rainfall file path
+                    rainfall_workspace = row[12]
+                    time_step = int(row[9])
+                    results.append([storm_source, rainfall_workspace, time_step, soil_moisture, agwa_directory])
                 else:
                     raise ValueError(f"Unknown storm source: {storm_source}")                    
     return results
@@ -423,8 +877,6 @@ def extract_parameters(prjgdb, delineation, discretization, precipitation_file):
 def get_hyetograph_shape(agwa_directory, delineation, prjgdb):
     """Get the hyetograph shape. Called by extract_parameters()."""
 
-    precipitation_distribution = os.path.join(agwa_directory, "lookup_tables.gdb", "nrcs_precipitation_distributions")    
-    
     # Create a point geometry from the centroid point of the watershed
     meta_delineation_table = os.path.join(prjgdb, "metaDelineation")
     with arcpy.da.SearchCursor(meta_delineation_table, ["DelineationName", "DelineationWorkspace"]) as cursor:
@@ -440,14 +892,24 @@ def get_hyetograph_shape(agwa_directory, delineation, prjgdb):
             break  
     centroid_point = arcpy.PointGeometry(arcpy.Point(*centroid), watershed_desc.spatialReference)
 
-    # Select the precipitation distribution for the centroid point
-    arcpy.MakeFeatureLayer_management(precipitation_distribution, "precip_layer")
-    arcpy.SelectLayerByLocation_management("precip_layer", "CONTAINS", centroid_point)
-    distribution_name = None
-    with arcpy.da.SearchCursor("precip_layer", ["Name"]) as cursor:
-        for row in cursor:
-            distribution_name = row[0]
-            break 
+    distribution_name = get_hyetograph_shapes(agwa_directory, [centroid_point])[0]
 
     tweet(f"Hyetograph shape: {distribution_name}")
     return distribution_name
+
+
+def get_hyetograph_shapes(agwa_directory, points):
+    """Return the NRCS hyetograph shape of each point, or None for points outside the NRCS regions. points are 
+    point geometries in any spatial reference. The regions are indexed once per AGWA directory, so the shapes of 
+    many points, for example the centroids of many watersheds, are found in one call. 
+    Called by get_hyetograph_shape()."""
+
+    precipitation_distribution = code_lookup_tables.get_lookup_table_path(agwa_directory, 
+                                                                          "nrcs_precipitation_distributions")
+    region_index = code_lookup_tables.read_polygon_index(precipitation_distribution, "Name")
+    region_spatial_reference = region_index["SpatialReference"]
+    xy = [point.projectAs(region_spatial_reference).firstPoint for point in points] 
+    x = [point.X for point in xy]
+    y = [point.Y for point in xy]
+
+    return code_lookup_tables.find_polygons(region_index, x, y)
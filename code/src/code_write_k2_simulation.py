@@ -0,0 +1,362 @@
+import os
+import sys
+import glob
+import stat
+import arcpy
+import shutil
+import hashlib
+import datetime
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+import config
+from config import AGWA_VERSION, AGWAGDB_VERSION
+import code_process_pool
+
+META_SIMULATION_FIELDS = ["DelineationName", "DiscretizationName", "ParameterizationFilePath",
+                          "PrecipitationFileName", "SimulationName", "SimulationDescription", "SimulationDuration",
+                          "SimulationTimeStep", "SimulationPath", "CreationDate", "AGWAVersionAtCreation",
+                          "AGWAGDBVersionAtCreation", "Status"]
+
+# content hashes of files staged so far, keyed by (path, size, modification time)
+_file_hashes = {}
+
+
+def tweet(msg):
+    """Produce a message for both arcpy and python"""
+    m = "\n{}\n".format(msg)
+    arcpy.AddMessage(m)
+    print(arcpy.GetMessages())
+
+
+def write_simulation(prjgdb, workspace, delineation, discretization, parameter_files, precipitation_files,
+                     simulation_name, simulation_description, simulation_duration, simulation_time_step, 
+                     models_directory):
+    """Write a K2 simulation that runs every combination of the parameter files and precipitation files. The 
+    simulation directory holds one copy of each file and of k2.exe, and its run file (kin.fil) has one line per 
+    combination, so K2 is started once for all of them. parameter_files and precipitation_files are paths or 
+    lists of paths. When simulation_duration is None, each run lasts the duration of its precipitation file 
+    plus 300 minutes. Each combination is documented in the metaSimulation table. Every run writes its own output 
+    (.out) file, but the same hillslope and channel hydrograph (.SIM) files, so with several runs the .SIM files 
+    hold the hydrographs of the last run only. Returns the simulation directory."""
+
+    if isinstance(parameter_files, str):
+        parameter_files = [parameter_files]
+    if isinstance(precipitation_files, str):
+        precipitation_files = [precipitation_files]
+    runs = [(parameter_file, precipitation_file) for parameter_file in parameter_files 
+            for precipitation_file in precipitation_files]
+
+    modeling_files_directory = os.path.join(os.path.split(workspace)[0], "modeling_files", discretization)
+    simulation_directory = os.path.join(modeling_files_directory, "simulations", simulation_name)
+    write_simulation_directory(simulation_directory, runs, simulation_description, simulation_duration, 
+                               simulation_time_step, models_directory)
+    document_simulation_runs(prjgdb, delineation, discretization, simulation_name, simulation_description,
+                             simulation_directory, runs, simulation_duration, simulation_time_step)
+
+    return simulation_directory
+
+
+def write_simulation_batches(prjgdb, workspace, delineation, discretization, parameter_files, precipitation_files,
+                             simulation_name, simulation_description, simulation_duration, simulation_time_step, 
+                             models_directory, batch_count=None):
+    """Split every combination of the parameter files and precipitation files into batch_count simulations 
+    (by default one per worker process, see config.MAX_WORKER_PROCESSES), named simulation_name_1, 
+    simulation_name_2, and so on. Each simulation runs its combinations from one multi-line kin.fil, so the 
+    batches can be run side by side with code_execute_k2_simulation.run_simulations. As with write_simulation, 
+    the .SIM files of a batch hold the hydrographs of its last run only. Returns the simulation directories."""
+
+    runs = [(parameter_file, precipitation_file) for parameter_file in parameter_files 
+            for precipitation_file in precipitation_files]
+    batch_count = min(batch_count or code_process_pool.get_worker_count(len(runs)), len(runs))
+
+    modeling_files_directory = os.path.join(os.path.split(workspace)[0], "modeling_files", discretization)
+    simulation_directories = []
+    for batch in range(batch_count):
+        # runs are dealt to the batches in turn, so batches with long storms are spread out
+        batch_runs = runs[batch::batch_count]
+        batch_name = f"{simulation_name}_{batch + 1}"
+        simulation_directory = os.path.join(modeling_files_directory, "simulations", batch_name)
+        write_simulation_directory(simulation_directory, batch_runs, simulation_description, simulation_duration,
+                                   simulation_time_step, models_directory)
+        document_simulation_runs(prjgdb, delineation, discretization, batch_name, simulation_description,
+                                 simulation_directory, batch_runs, simulation_duration, simulation_time_step)
+        simulation_directories.append(simulation_directory)
+
+    tweet(f"{len(runs)} runs have been written to {batch_count} simulations")
+    return simulation_directories
+
+
+def write_simulation_directory(simulation_directory, runs, simulation_description, simulation_duration,
+                               simulation_time_step, models_directory):
+    """Create the simulation directory with its subdirectories, copy the input files and k2.exe into it once, 
+    and write kin.fil with one line per (parameter file, precipitation file) run. 
+    Called by write_simulation() and write_simulation_batches()."""
+
+    tweet(f"Creating the simulation directory and subdirectories if they do not exist.")
+    if not os.path.exists(simulation_directory):
+        os.makedirs(simulation_directory)
+    parameter_files = list(dict.fromkeys(parameter_file for parameter_file, _ in runs))
+    precipitation_files = list(dict.fromkeys(precipitation_file for _, precipitation_file in runs))
+    folders = ['hillslopes', 'channels']
+    for parameter_file in parameter_files:
+        with open(parameter_file, 'r') as file:
+            if "BEGIN POND" in file.read():
+                folders = ['hillslopes', 'channels', 'ponds']
+                break
+    for folder in folders:
+        path = os.path.join(simulation_directory, folder)
+        if not os.path.exists(path):
+            os.mkdir(path)
+
+    input_files = parameter_files + precipitation_files + [os.path.join(models_directory, "k2.exe")]
+    if config.SIMULATION_STAGING == "Link":
+        tweet(f"Linking the precipitation files, parameter files, and K2 executable into the simulation directory")
+        store_directory = get_staging_store_directory(simulation_directory)
+        for input_file in input_files:
+            stage_file(input_file, simulation_directory, store_directory)
+    else:
+        tweet(f"Copying the precipitation files, parameter files, and K2 executable into the simulation directory")
+        for input_file in input_files:
+            shutil.copy2(input_file, simulation_directory)
+
+    tweet(f"Creating the run file (kin.fil) for the simulation")
+    if not simulation_description: simulation_description = ""
+    runfile_lines = []
+    for parameter_file, precipitation_file in runs:
+        duration = simulation_duration or get_simulation_duration(precipitation_file)
+        runfile_lines.append(get_runfile_line(parameter_file, precipitation_file, simulation_description, 
+                                              duration, simulation_time_step))
+    runfile_name = os.path.join(simulation_directory, "kin.fil")
+    with open(runfile_name, "w") as runfile_file:
+        runfile_file.write("\n".join(runfile_lines))
+    if len(runs) > 1:
+        tweet(f"Warning: the {len(runs)} runs of the simulation write the same hillslope and channel (.SIM) files, "
+              f"which will only hold the hydrographs of the last run. Their output (.out) files are kept.")
+
+
+def get_staging_store_directory(simulation_directory):
+    """Return the staged_files folder of the modeling files directory that holds the simulation directory: 
+    modeling_files/staged_files for modeling_files/<discretization>/simulations/<simulation>. The folder is one 
+    level above the discretization folders, so the store is shared by the simulations of all discretizations."""
+
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(simulation_directory))), "staged_files")
+
+
+def stage_file(input_file, simulation_directory, store_directory):
+    """Put a file into the simulation directory as a link to the copy of its content in the store. The store 
+    holds one read-only copy of each content, named after its SHA-256 hash. Hardlinks are used when possible, 
+    then symbolic links, and the file is copied when neither can be created. 
+    Called by write_simulation_directory()."""
+
+    stored_file = add_file_to_store(input_file, store_directory)
+    if link_file(stored_file, os.path.join(simulation_directory, os.path.basename(input_file))):
+        protect_files(store_directory)
+
+
+def link_file(source_file, destination_file):
+    """Create destination_file as a hardlink to source_file, or as a symbolic link when hardlinks are not 
+    possible, or as a copy when neither can be created. An existing destination file is replaced. Returns True 
+    when the replaced file was a hardlink whose shared copy was made writable (see remove_file)."""
+
+    made_writable = False
+    if os.path.lexists(destination_file):
+        made_writable = remove_file(destination_file)
+    try:
+        os.link(source_file, destination_file)
+    except OSError:
+        try:
+            os.symlink(source_file, destination_file)
+        except OSError:
+            shutil.copy2(source_file, destination_file)
+
+    return made_writable
+
+
+def get_file_hash(file_path):
+    """Return the SHA-256 hash of the content of a file. Hashes are kept for the life of the process and 
+    calculated again when the size or modification time of the file changes."""
+
+    file_stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), file_stat.st_size, file_stat.st_mtime_ns)
+    if key not in _file_hashes:
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                file_hash.update(chunk)
+        _file_hashes[key] = file_hash.hexdigest()
+    return _file_hashes[key]
+
+
+def add_file_to_store(input_file, store_directory):
+    """Copy a file into the store, unless a file with the same content is already there, and return the path of 
+    the stored copy. Called by stage_file()."""
+
+    stored_file = os.path.join(store_directory, get_file_hash(input_file) + os.path.splitext(input_file)[1].lower())
+    if not os.path.exists(stored_file):
+        os.makedirs(store_directory, exist_ok=True)
+        shutil.copy2(input_file, stored_file + ".tmp")
+        # stored copies are shared by many simulations, so they are made read-only
+        make_read_only(stored_file + ".tmp")
+        os.replace(stored_file + ".tmp", stored_file)
+
+    return stored_file
+
+
+def delete_simulation_directories(simulation_directories):
+    """Delete simulation directories, then remove the stored files that no simulation links to anymore. The 
+    store is cleaned once for all the directories."""
+
+    if isinstance(simulation_directories, str):
+        simulation_directories = [simulation_directories]
+    store_directories = set()
+    for simulation_directory in simulation_directories:
+        shutil.rmtree(simulation_directory, onerror=remove_read_only)
+        store_directories.add(get_staging_store_directory(simulation_directory))
+    for store_directory in store_directories:
+        if os.path.isdir(store_directory):
+            if os.name == "nt":
+                protect_files(store_directory)
+            clean_staging_store(store_directory)
+
+
+def clean_staging_store(store_directory):
+    """Remove the stored files that are not linked from any simulation directory. Hardlinked files are counted by 
+    their link count, and symbolic links are found in the simulation directories of the modeling files. 
+    Returns the number of files removed."""
+
+    unlinked_files = [stored_file for stored_file in glob.glob(os.path.join(store_directory, "*")) 
+                      if os.stat(stored_file).st_nlink == 1]
+    if not unlinked_files:
+        return 0
+
+    modeling_files_directory = os.path.dirname(store_directory)
+    symlinked_files = set()
+    for staged_file in glob.glob(os.path.join(modeling_files_directory, "*", "simulations", "*", "*")):
+        if os.path.islink(staged_file):
+            symlinked_files.add(os.path.normcase(os.path.realpath(staged_file)))
+
+    removed_count = 0
+    for stored_file in unlinked_files:
+        if os.path.normcase(os.path.realpath(stored_file)) not in symlinked_files:
+            remove_file(stored_file)
+            removed_count += 1
+
+    return removed_count
+
+
+def remove_file(file_path):
+    """Remove a file or link. Read-only files with a single link are made writable first. Files with other 
+    hardlinks, such as staged files, are only unlinked, since changing their permissions would change the shared 
+    copy of every link. Windows cannot unlink a read-only file, so there the shared copy is made writable to 
+    remove the link, and True is returned so the caller makes the shared copies read-only again with 
+    protect_files()."""
+
+    try:
+        os.remove(file_path)
+        return False
+    except PermissionError:
+        shared = os.lstat(file_path).st_nlink > 1
+        if shared and os.name != "nt":
+            raise
+        os.chmod(file_path, stat.S_IWRITE | stat.S_IREAD)
+        os.remove(file_path)
+        return shared
+
+
+def remove_read_only(function, path, exc_info):
+    """Error handler of shutil.rmtree that removes read-only files and folders. Files are removed by remove_file,
+    so hardlinks to stored files are unlinked without changing the stored copy where possible."""
+
+    if os.path.isdir(path) and not os.path.islink(path):
+        os.chmod(path, stat.S_IWRITE | stat.S_IREAD | stat.S_IEXEC)
+        function(path)
+    else:
+        remove_file(path)
+
+
+def protect_files(directory):
+    """Make the files of a directory and its subfolders read-only, as stored and cached files are. 
+    Called after remove_file() had to make a shared copy writable."""
+
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            file_path = os.path.join(root, file_name)
+            if not os.path.islink(file_path) and os.stat(file_path).st_mode & stat.S_IWRITE:
+                make_read_only(file_path)
+
+
+def make_read_only(file_path):
+    """Remove the write permissions of a file and keep its other permissions, so a stored K2 executable can 
+    still be run. Called by add_file_to_store() and protect_files()."""
+
+    mode = stat.S_IMODE(os.stat(file_path).st_mode)
+    os.chmod(file_path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def get_runfile_line(parameter_file, precipitation_file, simulation_description, simulation_duration, 
+                     simulation_time_step):
+    """Return the kin.fil line of one run. The output file is named after the parameter and precipitation files.
+    Called by write_simulation_directory()."""
+
+    par_name = os.path.split(parameter_file)[1]
+    precip_name = os.path.split(precipitation_file)[1]
+    output_file = get_output_file_name(par_name, precip_name)
+    courant = "Y"
+    sediment = "Y"
+    multipliers = "N"
+    tabular_summary = "Y"
+    return (f"{par_name},{precip_name},{output_file},{simulation_description},"
+            f"{simulation_duration},{simulation_time_step},{courant},{sediment},"
+            f"{multipliers},{tabular_summary}")
+
+
+def get_output_file_name(par_name, precip_name):
+    """Return the name of the K2 output file of a run."""
+
+    return f"{os.path.splitext(par_name)[0]}_{os.path.splitext(precip_name)[0]}.out"
+
+
+def get_simulation_duration(precipitation_file):
+    """Return the simulation duration (min) for a precipitation file: the last time of the file plus 300 minutes,
+    so the runoff hydrographs are not truncated in larger watersheds and long reaches far from the outlet."""
+
+    with open(precipitation_file) as f:
+        duration = f.readlines()[-2].split()[0]
+    return int(float(duration)) + 300
+
+
+def create_meta_simulation_table(prjgdb):
+    """Create the metaSimulation table if it does not exist and return its path."""
+
+    meta_simulation_table = os.path.join(prjgdb, "metaSimulation")
+    if not arcpy.Exists(meta_simulation_table):
+        arcpy.management.CreateTable(prjgdb, "metaSimulation")
+        for field in META_SIMULATION_FIELDS:
+            arcpy.management.AddField(meta_simulation_table, field, "TEXT")
+    return meta_simulation_table
+
+
+def document_simulation_runs(prjgdb, delineation, discretization, simulation_name, simulation_description,
+                             simulation_directory, runs, simulation_duration, simulation_time_step):
+    """Document each run of a simulation in the metaSimulation table. Raises an exception if a run is already 
+    documented. Called by write_simulation() and write_simulation_batches()."""
+
+    tweet(f"Documenting the simulation information into the metaSimulation table")
+    meta_simulation_table = create_meta_simulation_table(prjgdb)
+    df_simulation = pd.DataFrame(arcpy.da.TableToNumPyArray(meta_simulation_table, META_SIMULATION_FIELDS))
+    df_simulation = df_simulation[(df_simulation.DelineationName == delineation) &
+                                  (df_simulation.DiscretizationName == discretization) &
+                                  (df_simulation.SimulationName == simulation_name)]
+    existing_runs = set(zip(df_simulation.ParameterizationFilePath, df_simulation.PrecipitationFileName))
+    if existing_runs.intersection(runs):
+        raise Exception(f"Simulation '{simulation_name}' already exists in the metaSimulation table.")
+
+    if not simulation_description: simulation_description = ""
+    creation_date = datetime.datetime.now().isoformat()
+    with arcpy.da.InsertCursor(meta_simulation_table, META_SIMULATION_FIELDS) as cursor:
+        for parameter_file, precipitation_file in runs:
+            duration = simulation_duration or get_simulation_duration(precipitation_file)
+            cursor.insertRow((delineation, discretization, parameter_file,
+                              precipitation_file, simulation_name, simulation_description,
+                              int(duration), int(simulation_time_step), simulation_directory,
+                              creation_date, AGWA_VERSION, AGWAGDB_VERSION, "Successful"))
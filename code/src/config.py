@@ -10,4 +10,76 @@ AGWA_BUILD = "2024-07-20"
 # Parallel Processing Setting
 # Users can set this to any fixed number of cores
 PARALLEL_PROCESSING_FACTOR = 0
+# Number of worker processes used by AGWA steps that run in parallel (for example, building the soil parameter
+# lookup). 0 uses all available cores.
+MAX_WORKER_PROCESSES = 0
 
+
+# Soil Parameterization Settings
+# Method used to calculate the area of each soil map unit within each hillslope when the soil layer is a raster.
+# "Polygon": convert the soil raster to polygons and intersect them with the hillslopes
+# "Raster": cross-tabulate the soil raster with the hillslopes rasterized on the same grid
+SOIL_AREA_FRACTION_METHOD = "Polygon"
+# Number of raster rows read at a time by the "Raster" method
+SOIL_RASTER_BLOCK_ROWS = 2048
+# Number of hillslopes per tile when the soils are intersected with the hillslopes in tiles, each tile in its own
+# worker process. There are at least as many tiles as worker processes. 0 intersects all hillslopes in one step.
+SOIL_INTERSECTION_TILE_SIZE = 0
+# Cache the gSSURGO tables as Parquet files (requires pyarrow), so later runs only load the rows of the map units
+# in the watershed. The cache is created in the "soil_database_cache" folder of the AGWA directory unless
+# another directory is given. Off by default, since the cache holds a copy of the gSSURGO tables on disk.
+SOIL_DATABASE_CACHE = False
+SOIL_DATABASE_CACHE_DIRECTORY = ""
+
+
+# Lookup Table Settings
+# Keep a Parquet copy of each table read from lookup_tables.gdb (requires pyarrow), so that worker processes can
+# read the lookup tables without opening the geodatabase. The copies are created in the "lookup_tables_cache" folder
+# of the AGWA directory unless another directory is given.
+LOOKUP_TABLE_PARQUET_MIRROR = False
+LOOKUP_TABLE_CACHE_DIRECTORY = ""
+
+
+# NOAA Atlas 14 Settings
+# Cache the NOAA Atlas 14 responses as JSON files, keyed by the latitude and longitude rounded to NOAA_CACHE_DECIMALS
+# decimals (0.001 degrees is well within the 30 arc-second NOAA grid), so later precipitation files for the same
+# watershed are written without a network request. The cache is created in the "noaa_atlas_14_cache" folder of the
+# AGWA directory unless another directory is given. Responses older than NOAA_CACHE_MAX_AGE_DAYS are removed,
+# 0 keeps them indefinitely.
+NOAA_CACHE = True
+NOAA_CACHE_DIRECTORY = ""
+NOAA_CACHE_DECIMALS = 3
+NOAA_CACHE_MAX_AGE_DAYS = 365
+# Only use cached responses, for computers without internet access. The cache can be copied from another computer.
+NOAA_OFFLINE = False
+# Seconds to wait for the NOAA server, and number of attempts when the server is unavailable or does not respond
+NOAA_REQUEST_TIMEOUT = 30
+NOAA_REQUEST_RETRIES = 3
+
+
+# Gridded Rainfall Settings
+# Number of rainfall grids (time steps) read at a time when gridded rainfall is averaged over the hillslopes
+GRIDDED_RAINFALL_BLOCK_FRAMES = 64
+
+
+# User-defined Hyetograph Settings
+# Number of rows of the user rainfall file read at a time
+USER_RAINFALL_CHUNK_ROWS = 100000
+# Remove time steps whose cumulative depth is within this tolerance (mm) of the depth interpolated between the 
+# remaining time steps, to reduce the number of time steps K2 has to process. 0 keeps all time steps.
+USER_RAINFALL_THINNING_TOLERANCE = 0
+
+
+# K2 Simulation Settings
+# K2 executable used by the batch runner. When empty, the k2.exe copied into each simulation directory is used.
+K2_EXECUTABLE = ""
+# Seconds a K2 run may take before the batch runner stops it. 0 lets runs take as long as they need.
+K2_TIMEOUT_SECONDS = 0
+# How the parameter files, precipitation files, and k2.exe are put into simulation directories.
+# "Copy": copy the files into each simulation directory
+# "Link": hardlink the files (symlink when hardlinks are not possible) from one read-only copy per file content in
+# the "staged_files" folder of the modeling files, so ensembles of many simulations do not repeat the same bytes
+SIMULATION_STAGING = "Copy"
+# Reuse the outputs of earlier K2 runs with the same K2 executable, input files, and run settings instead of running
+# K2 again. Outputs are kept in the "result_cache" folder of the modeling files.
+K2_RESULT_CACHE = False
@@ -250,7 +250,8 @@ class ImportResults(object):
             lines = file.readlines()
             for line in lines:
                 if "!  Parameterization" in line:
-                    return line.split("Parameterization")[1].strip()
+                    words = line.split(None, 2)
+                    return words[2].strip() if len(words) > 2 else None
                 
 
     def postExecute(self, parameters):
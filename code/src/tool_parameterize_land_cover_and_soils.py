@@ -132,8 +132,19 @@ class ParameterizeLandCoverAndSoils(object):
                                  direction="Input")
         param15.value = False
 
+        param16 = arcpy.Parameter(displayName="Additional Land Cover Scenarios",
+                                 name="Land_Cover_Scenarios",
+                                 datatype="GPValueTable",
+                                 parameterType="Optional",
+                                 direction="Input")
+        param16.columns = [["GPRasterLayer", "Land Cover Raster"], ["GPString", "Land Cover Lookup Table"],
+                           ["GPString", "Parameterization Name"]]
+        param16.filters[1].type = "ValueList"
+        param16.filters[1].list = param5.filter.list
+        param16.filters[2].type = "ValueList"
+
         params = [param0, param1, param2, param3, param4, param5, param6, param7, param8, param9, param10, 
-                  param11, param12, param13, param14, param15]
+                  param11, param12, param13, param14, param15, param16]
 
         return params
 
@@ -208,6 +219,7 @@ class ParameterizeLandCoverAndSoils(object):
         discretization_name = parameters[1].valueAsText
         pre_soil_cover_list, pre_element_list = self.get_previous_parameterization(prjgdb, delineation_name, discretization_name)
         parameters[12].filter.list = pre_element_list
+        parameters[16].filters[2].list = pre_element_list
 
         # Use previous element parameterization
         if parameters[2].altered:
@@ -216,7 +228,7 @@ class ParameterizeLandCoverAndSoils(object):
                 parameters[3].enabled = True                
                 if len(pre_soil_cover_list) > 0:
                     parameters[3].filter.list = pre_soil_cover_list
-                    for param in parameters[4:12]:
+                    for param in parameters[4:12] + [parameters[16]]:
                         if hasattr(param, 'enabled'):
                             param.enabled = False
                         else:
@@ -315,6 +327,17 @@ class ParameterizeLandCoverAndSoils(object):
                 parameters[0].setErrorMessage("Missing metaWorkspace table in this project content. Please add or run Step 1 to create.")
 
 
+        # Each land cover scenario is a parameterization of its own, parameterized with the same soils
+        if parameters[16].value and not use_previous:
+            scenario_names = [str(row[2]) for row in parameters[16].value]
+            if parameters[12].valueAsText in scenario_names or len(set(scenario_names)) < len(scenario_names):
+                parameters[16].setErrorMessage("Each land cover scenario must have a parameterization name of its "
+                                               "own, different from the Parameterization Name.")
+            missing_names = [name for name in scenario_names if name not in pre_element_list]
+            if missing_names:
+                parameters[16].setErrorMessage(f"Element parameterization (Step 4) must be performed prior to this "
+                                               f"step for the scenarios {', '.join(missing_names)}.")
+
         if parameters[9].value is not None:
             max_horizons = int(parameters[9].value)
             if max_horizons < 1:
@@ -359,13 +382,27 @@ class ParameterizeLandCoverAndSoils(object):
         workspace = parameters[13].valueAsText
         prjgdb = parameters[14].valueAsText
         save_intermediate_outputs = (parameters[15].valueAsText or '').lower() == 'true'
+        scenarios = []
+        if not use_previous_parameterization and parameters[16].value:
+            scenarios = [(arcpy.Describe(scenario_land_cover).catalogPath, str(scenario_lookup_table), 
+                          str(scenario_name)) for scenario_land_cover, scenario_lookup_table, scenario_name 
+                          in parameters[16].value]
   
         agwa.initialize_workspace(delineation, discretization, parameterization_name, prjgdb, land_cover, 
                                   lookup_table, soils, soils_database, max_horizons, max_thickness, channel_type)
+        for scenario_land_cover, scenario_lookup_table, scenario_name in scenarios:
+            agwa.initialize_workspace(delineation, discretization, scenario_name, prjgdb, scenario_land_cover, 
+                                      scenario_lookup_table, soils, soils_database, max_horizons, max_thickness, 
+                                      channel_type)
         
         if use_previous_parameterization: 
             agwa.copy_parameterization(workspace, delineation, discretization, previous_parameterization,
                                         parameterization_name)
+        elif scenarios:
+            # the soils are parameterized once for all land cover scenarios
+            agwa.parameterize_scenarios(prjgdb, workspace, delineation, discretization, 
+                                        [parameterization_name] + [name for _, _, name in scenarios], 
+                                        save_intermediate_outputs)
         else:
             agwa.parameterize(prjgdb, workspace, delineation, discretization, parameterization_name, save_intermediate_outputs)
 
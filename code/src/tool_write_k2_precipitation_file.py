@@ -42,7 +42,7 @@ class WriteK2PrecipitationFile(object):
                                     datatype="GPString",
                                     parameterType="Required",
                                     direction="Input")
-        param2.filter.list = ["NOAA Atlas 14", "User-defined Depth", "User-defined Hyetograph"]
+        param2.filter.list = ["NOAA Atlas 14", "User-defined Depth", "User-defined Hyetograph", "Gridded Rainfall"]
 
         # parameters for user-defined depth
         param3 = arcpy.Parameter(displayName="Depth (mm)",
@@ -84,7 +84,7 @@ class WriteK2PrecipitationFile(object):
         param7.filter.type = "ValueList"
         param7.filter.list = ["Mean", "Upper 90%", "Lower 90%"]
 
-        # params for user-defined depth and Noaa Atlas 14
+        # params for user-defined depth, Noaa Atlas 14, and gridded rainfall
         param8 = arcpy.Parameter(displayName="Time Step (minutes)",
                                  name="Time_step_duration",
                                  datatype="GPDouble",
@@ -153,8 +153,16 @@ class WriteK2PrecipitationFile(object):
                                  parameterType="Derived",
                                  direction="Output")                               
 
+        # params for gridded rainfall
+        param17 = arcpy.Parameter(displayName=("Folder or Geodatabase of Rainfall Grids (mm per time step), "
+                                               "Named in Time Order"),
+                                  name="Rainfall_Grid_Workspace",
+                                  datatype="DEWorkspace",
+                                  parameterType="Optional",
+                                  direction="Input")
+
         params = [param0, param1, param2, param3, param4, param5, param6, param7, param8, 
-                  param9, param10, param11, param12, param13, param14, param15, param16]
+                  param9, param10, param11, param12, param13, param14, param15, param16, param17]
         
         return params
 
@@ -214,6 +222,8 @@ class WriteK2PrecipitationFile(object):
                 parameters[i].enabled = True
             parameters[12].enabled = False
             parameters[12].value = None            
+            parameters[17].enabled = False
+            parameters[17].value = None
             parameters[11].enabled = not parameters[10].value if parameters[10].altered else False
 
         elif storm_source == "User-defined Depth":
@@ -227,6 +237,8 @@ class WriteK2PrecipitationFile(object):
             parameters[10].enabled = True
             parameters[12].enabled = False
             parameters[12].value = None
+            parameters[17].enabled = False
+            parameters[17].value = None
             parameters[11].enabled = not parameters[10].value if parameters[10].altered else False
 
         elif storm_source == "User-defined Hyetograph":
@@ -236,8 +248,19 @@ class WriteK2PrecipitationFile(object):
                 if i == 10:
                     parameters[i].value = True            
             parameters[12].enabled = True
+            parameters[17].enabled = False
+            parameters[17].value = None
+
+        elif storm_source == "Gridded Rainfall":
+            for i in [3, 4, 5, 6, 7, 9, 10, 11, 12]:
+                parameters[i].enabled = False
+                parameters[i].value = None
+                if i == 10:
+                    parameters[i].value = True
+            parameters[8].enabled = True
+            parameters[17].enabled = True
         else:
-            for i in range(3, 13):
+            for i in list(range(3, 13)) + [17]:
                 parameters[i].enabled = False
                 parameters[i].value = None
                 if i == 10:
@@ -302,6 +325,12 @@ class WriteK2PrecipitationFile(object):
                                 parameters[14].setErrorMessage("Precipitation file already exists for this delineation "
                                                                "and discretization. Please choose a different name.")
 
+        if parameters[2].valueAsText == "Gridded Rainfall":
+            if not parameters[8].value:
+                parameters[8].setErrorMessage("Enter the time step of the rainfall grids.")
+            if not parameters[17].value:
+                parameters[17].setErrorMessage("Select the folder or geodatabase of the rainfall grids.")
+
         if parameters[0].value == None and parameters[9].altered:
             add_hgr_map = parameters[9].value
             if add_hgr_map:
@@ -332,6 +361,9 @@ class WriteK2PrecipitationFile(object):
         precipitation_file_name = parameters[14].valueAsText
         workspace = parameters[15].valueAsText
         prjgdb = parameters[16].valueAsText
+        # the rainfall grid workspace is documented as the user rainfall file path
+        if storm_source == "Gridded Rainfall":
+            user_rainfall_file_path = parameters[17].valueAsText
 
         # convert use_nrcs_hyetograph_shape to text
         use_nrcs_hyetograph_shape = "true" if use_nrcs_hyetograph_shape else "false"
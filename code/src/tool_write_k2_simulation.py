@@ -3,12 +3,11 @@ import re
 import sys
 import glob
 import arcpy
-import shutil
-import datetime
-import pandas as pd
+import importlib
 from arcpy._mp import Table                  
 sys.path.append(os.path.dirname(__file__))
-from config import AGWA_VERSION, AGWAGDB_VERSION
+import code_write_k2_simulation as agwa
+importlib.reload(agwa)
 
 
 class WriteK2Simulation(object):
@@ -43,17 +42,20 @@ class WriteK2Simulation(object):
                                  parameterType="Required",
                                  direction="Input")
 
-        param2 = arcpy.Parameter(displayName="Parameter File",
+        # every combination of the selected parameter files and precipitation files is run
+        param2 = arcpy.Parameter(displayName="Parameter Files",
                                  name="Parameter_File",
                                  datatype="GPString",
                                  parameterType="Required",
-                                 direction="Input")
+                                 direction="Input",
+                                 multiValue=True)
 
-        param3 = arcpy.Parameter(displayName="Precipitation File",
+        param3 = arcpy.Parameter(displayName="Precipitation Files",
                                  name="Precipitation_File",
                                  datatype="GPString",
                                  parameterType="Required",
-                                 direction="Input")
+                                 direction="Input",
+                                 multiValue=True)
 
         param4 = arcpy.Parameter(displayName="Simulation Name",
                                  name="Simulation_Name",
@@ -67,10 +69,11 @@ class WriteK2Simulation(object):
                                  parameterType="Optional",
                                  direction="Input")
 
+        # with several precipitation files, an empty duration runs each file for its duration plus 300 minutes
         param6 = arcpy.Parameter(displayName="Simulation Duration (min)",
                                  name="Simulation_Duration",
                                  datatype="GPLong",
-                                 parameterType="Required",
+                                 parameterType="Optional",
                                  direction="Input")
 
         param7 = arcpy.Parameter(displayName="Simulation Time Step (min)",
@@ -98,7 +101,23 @@ class WriteK2Simulation(object):
                                  parameterType="Derived",
                                  direction="Output")
 
-        params = [param0, param1, param2, param3, param4, param5, param6, param7, param8, param9, param10]
+        param11 = arcpy.Parameter(displayName="Write the Runs as Batches of Simulations to Run in Parallel",
+                                  name="Write_Batches",
+                                  datatype="GPBoolean",
+                                  parameterType="Optional",
+                                  direction="Input")
+        param11.value = False
+
+        param12 = arcpy.Parameter(displayName="Number of Batches (Optional, one per worker process if empty)",
+                                  name="Number_of_Batches",
+                                  datatype="GPLong",
+                                  parameterType="Optional",
+                                  direction="Input")
+        param12.filter.type = "Range"
+        param12.filter.list = [1, 10000]
+
+        params = [param0, param1, param2, param3, param4, param5, param6, param7, param8, param9, param10, 
+                  param11, param12]
         return params
 
     def isLicensed(self):
@@ -164,12 +183,21 @@ class WriteK2Simulation(object):
             # populate the simulation duration based on the selected precipitation file
             # add 300 minutes to the duration of the precipitation file so the runoff hydrographs are not truncated in
             # larger watersheds and long reaches far from the outlet
+            # with several precipitation files, the duration is left empty so each run gets its own duration
             duration = 0
-            if parameters[3].value:
-                precip_file = os.path.join(modeling_files_directory, "precipitation_files", parameters[3].valueAsText)
-                with open(precip_file) as f:
-                    duration = f.readlines()[-2].split()[0]
-                    parameters[6].value = int(float(duration)) + 300
+            if parameters[3].altered and parameters[3].values:
+                if len(parameters[3].values) == 1:
+                    precip_file = os.path.join(modeling_files_directory, "precipitation_files", 
+                                               parameters[3].values[0])
+                    with open(precip_file) as f:
+                        duration = f.readlines()[-2].split()[0]
+                        parameters[6].value = int(float(duration)) + 300
+                else:
+                    parameters[6].value = None
+
+        parameters[12].enabled = bool(parameters[11].value)
+        if not parameters[11].value:
+            parameters[12].value = None
 
         return
 
@@ -208,9 +236,11 @@ class WriteK2Simulation(object):
                 if len(precipitation_file_list) == 0:
                     parameters[1].setErrorMessage("No precipitation files found in the modeling files directory.")
 
-                # Check if the simulation name already exists
+                # Check if the simulation name already exists, or the name of its first batch
                 if parameters[4].value:
                     simulation_name = parameters[4].valueAsText
+                    if parameters[11].value:
+                        simulation_name = f"{simulation_name}_1"
                     simulation_directory = os.path.join(modeling_files_directory, "simulations", simulation_name)
                     if os.path.exists(simulation_directory):
                         parameters[4].setErrorMessage("Simulation name already exists. Please choose a different name.")
@@ -231,86 +261,34 @@ class WriteK2Simulation(object):
         arcpy.AddMessage("Script source: " + __file__)
         delineation = parameters[0].valueAsText
         discretization = parameters[1].valueAsText
-        parameter_file = parameters[2].valueAsText
-        precipitation_file = parameters[3].valueAsText
+        parameter_file_names = parameters[2].values
+        precipitation_file_names = parameters[3].values
         simulation_name = parameters[4].valueAsText
         simulation_description = parameters[5].valueAsText
-        simulation_duration = int(parameters[6].valueAsText)
+        simulation_duration = int(parameters[6].valueAsText) if parameters[6].value else None
         simulation_time_step = int(parameters[7].valueAsText)
         workspace = parameters[8].valueAsText
         prjgdb = parameters[9].valueAsText
         models_directory = parameters[10].valueAsText
+        write_batches = parameters[11].value
+        batch_count = int(parameters[12].valueAsText) if parameters[12].value else None
 
         # Get file paths
         modeling_files_directory = os.path.join(os.path.split(workspace)[0],"modeling_files", discretization)
-        parameter_file = os.path.join(modeling_files_directory,  "parameter_files", parameter_file)
-        precipitation_file = os.path.join(modeling_files_directory, "precipitation_files", precipitation_file)
-        simulation_directory = os.path.join(modeling_files_directory,  "simulations", simulation_name)
-        k2_file = os.path.join(models_directory, "k2.exe")
-        
-        arcpy.AddMessage(f"Creating the simulation directory and subdirectories if they do not exist.\n")
-        if not os.path.exists(simulation_directory):
-            os.makedirs(simulation_directory)
-        with open(parameter_file, 'r') as file:
-            content = file.read()
-            if "BEGIN POND" in content:           
-                folders = ['hillslopes', 'channels', 'ponds']
-            else:
-                folders = ['hillslopes', 'channels']
-            for folder in folders:
-                path = os.path.join(simulation_directory, folder)
-                if not os.path.exists(path):
-                    os.mkdir(path)
-            
-        arcpy.AddMessage(f"Copying the precipitation file, parameter file, and K2 executable into the simulation directory\n")
-        shutil.copy2(parameter_file, simulation_directory)
-        shutil.copy2(precipitation_file, simulation_directory)
-        shutil.copy2(k2_file, simulation_directory)
-
-        arcpy.AddMessage(f"Creating the run file (kin.fil) for the simulation\n")
-        par_name = os.path.split(parameter_file)[1]
-        precip_name = os.path.split(precipitation_file)[1]
-        output_file = f"{os.path.splitext(par_name)[0]}_{os.path.splitext(precip_name)[0]}.out"
-        if not simulation_description: simulation_description = ""
-        courant = "Y"
-        sediment = "Y"
-        multipliers = "N"
-        tabular_summary = "Y"
-        runfile_body = (f"{par_name},{precip_name},{output_file},{simulation_description},"
-                        f"{simulation_duration},{simulation_time_step},{courant},{sediment},"
-                        f"{multipliers},{tabular_summary}")
-        runfile_name = os.path.join(simulation_directory, "kin.fil")
-        runfile_file = open(runfile_name, "w")
-        runfile_file.write(runfile_body)
-        runfile_file.close()
-
-        arcpy.AddMessage(f"Creating metaSimulation table if it does not exist")                       
-        fields = ["DelineationName", "DiscretizationName", "ParameterizationFilePath",
-                  "PrecipitationFileName", "SimulationName", "SimulationDescription", "SimulationDuration",
-                  "SimulationTimeStep", "SimulationPath", "CreationDate", "AGWAVersionAtCreation",
-                  "AGWAGDBVersionAtCreation", "Status"]
-        
-        meta_simulation_table = os.path.join(prjgdb, "metaSimulation")
-        if not arcpy.Exists(meta_simulation_table):
-            arcpy.management.CreateTable(prjgdb, "metaSimulation")
-            for field in fields:
-                arcpy.management.AddField(meta_simulation_table, field, "TEXT")
+        parameter_files = [os.path.join(modeling_files_directory, "parameter_files", parameter_file) 
+                           for parameter_file in parameter_file_names]
+        precipitation_files = [os.path.join(modeling_files_directory, "precipitation_files", precipitation_file) 
+                               for precipitation_file in precipitation_file_names]
+
+        if write_batches:
+            agwa.write_simulation_batches(prjgdb, workspace, delineation, discretization, parameter_files, 
+                                          precipitation_files, simulation_name, simulation_description, 
+                                          simulation_duration, simulation_time_step, models_directory, batch_count)
         else:
-            df_simulation = pd.DataFrame(arcpy.da.TableToNumPyArray(meta_simulation_table, fields))
-            df_simulation_filtered = df_simulation[(df_simulation.DelineationName == delineation) &
-                                                    (df_simulation.DiscretizationName == discretization) &
-                                                    (df_simulation.ParameterizationFilePath == parameter_file) &
-                                                    (df_simulation.PrecipitationFileName == precipitation_file) &
-                                                    (df_simulation.SimulationName == simulation_name)]
-            if not df_simulation_filtered.empty:
-                raise Exception(f"Simulation '{simulation_name}' already exists in the metaSimulation table.")
-         
-        arcpy.AddMessage(f"Documenting the simulation information into the metaSimulation table\n")
-        with arcpy.da.InsertCursor(meta_simulation_table, fields) as cursor:
-            cursor.insertRow((delineation, discretization, parameter_file,
-                              precipitation_file, simulation_name, simulation_description,
-                              int(simulation_duration), int(simulation_time_step), simulation_directory,
-                              datetime.datetime.now().isoformat(), AGWA_VERSION, AGWAGDB_VERSION, "Successful"))
+            agwa.write_simulation(prjgdb, workspace, delineation, discretization, parameter_files, 
+                                  precipitation_files, simulation_name, simulation_description, simulation_duration, 
+                                  simulation_time_step, models_directory)
+        meta_simulation_table = os.path.join(prjgdb, "metaSimulation")
 
         arcpy.AddMessage("Adding the metaSimulation table to the map")
         aprx = arcpy.mp.ArcGISProject("CURRENT")
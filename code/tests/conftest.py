@@ -0,0 +1,16 @@
+import os
+import sys
+from unittest import mock
+
+# the AGWA modules are imported from code/src, as the toolbox does
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "src")))
+
+# arcpy is only available inside ArcGIS Pro. Elsewhere it is replaced by a mock so the modules can be imported, and
+# the tests patch the arcpy functions they rely on.
+try:
+    import arcpy
+except ImportError:
+    arcpy = mock.MagicMock(name="arcpy")
+    sys.modules["arcpy"] = arcpy
+    for submodule in ["_mp", "analysis", "conversion", "da", "management", "mp", "sa"]:
+        sys.modules[f"arcpy.{submodule}"] = getattr(arcpy, submodule)
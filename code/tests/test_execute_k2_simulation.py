@@ -0,0 +1,189 @@
+import os
+import sys
+import stat
+import time
+import pytest
+import config
+import code_execute_k2_simulation
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="the stand-in K2 executable is a script with a shebang")
+
+# Stand-in for K2: reads what to do from behavior.txt in the simulation directory, writes its arguments to the
+# console, and writes the output files of kin.fil
+K2_STAND_IN = """#!{python}
+import os, sys, time
+behavior = open("behavior.txt").read().strip() if os.path.exists("behavior.txt") else "complete"
+print("K2 stand-in", " ".join(sys.argv[1:]), flush=True)
+if behavior == "hang":
+    time.sleep(60)
+for line in open("kin.fil"):
+    fields = line.split(",")
+    if len(fields) > 2:
+        open(fields[2].strip(), "w").write("output of " + fields[0])
+os.makedirs("hillslopes", exist_ok=True)
+open(os.path.join("hillslopes", "HillSLOPE_11.SIM"), "w").write("hydrograph")
+print("finished", flush=True)
+sys.exit(3 if behavior == "fail" else 0)
+"""
+
+
+class MetaSimulationTable:
+    """Stand-in for the Status field of the metaSimulation table, read and written through arcpy.da.UpdateCursor."""
+
+    def __init__(self, simulation_directories):
+        self.status = {simulation_directory: "Created" for simulation_directory in simulation_directories}
+        self.where_clauses = []
+
+    def update_cursor(self, table, fields, where_clause):
+        assert fields == ["Status"]
+        self.where_clauses.append(where_clause)
+        simulation_path = where_clause.split(" = ", 1)[1][1:-1].replace("''", "'")
+        table = self
+
+        class UpdateCursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def __iter__(self):
+                if simulation_path in table.status:
+                    yield [table.status[simulation_path]]
+
+            def updateRow(self, row):
+                table.status[simulation_path] = row[0]
+
+        return UpdateCursor()
+
+
+@pytest.fixture
+def k2_executable(tmp_path, monkeypatch):
+    k2_path = tmp_path / "k2_stand_in.py"
+    k2_path.write_text(K2_STAND_IN.format(python=sys.executable))
+    k2_path.chmod(0o755)
+    monkeypatch.setattr(config, "K2_EXECUTABLE", str(k2_path))
+    monkeypatch.setattr(config, "K2_TIMEOUT_SECONDS", 0)
+    monkeypatch.setattr(config, "K2_RESULT_CACHE", False)
+    monkeypatch.setattr(config, "MAX_WORKER_PROCESSES", 2)
+    return str(k2_path)
+
+
+def make_simulation(tmp_path, simulation_name, behavior="complete"):
+    simulation_directory = tmp_path / "modeling_files" / "discretization" / "simulations" / simulation_name
+    simulation_directory.mkdir(parents=True)
+    (simulation_directory / "watershed.par").write_text("parameters")
+    (simulation_directory / "storm.pre").write_text("precipitation")
+    (simulation_directory / "kin.fil").write_text("watershed.par,storm.pre,watershed_storm.out,test,300,1,Y,Y,N,Y")
+    (simulation_directory / "behavior.txt").write_text(behavior)
+    return str(simulation_directory)
+
+
+def read_log(simulation_directory):
+    with open(os.path.join(simulation_directory, code_execute_k2_simulation.RUN_LOG_NAME)) as log_file:
+        return log_file.read()
+
+
+def test_run_simulation_completes(tmp_path, k2_executable):
+    simulation_directory = make_simulation(tmp_path, "storm")
+
+    result = code_execute_k2_simulation.run_simulation(simulation_directory)
+
+    assert result["Status"] == "Completed"
+    assert result["ReturnCode"] == 0
+    assert result["SimulationPath"] == simulation_directory
+    assert "K2 stand-in -b" in read_log(simulation_directory)
+    assert os.path.exists(os.path.join(simulation_directory, "watershed_storm.out"))
+
+
+def test_run_simulation_fails(tmp_path, k2_executable):
+    simulation_directory = make_simulation(tmp_path, "storm", "fail")
+
+    result = code_execute_k2_simulation.run_simulation(simulation_directory)
+
+    assert result["Status"] == "Failed (return code 3)"
+    assert result["ReturnCode"] == 3
+    assert "finished" in read_log(simulation_directory)
+
+
+def test_run_simulation_times_out(tmp_path, k2_executable):
+    simulation_directory = make_simulation(tmp_path, "storm", "hang")
+
+    start_time = time.time()
+    result = code_execute_k2_simulation.run_simulation(simulation_directory, timeout=1)
+
+    assert time.time() - start_time < 30
+    assert result["Status"] == "Timed out after 1 seconds"
+    assert result["ReturnCode"] is None
+    # the console output written before the timeout is kept
+    assert "K2 stand-in -b" in read_log(simulation_directory)
+
+
+def test_run_simulation_without_runfile(tmp_path, k2_executable):
+    simulation_directory = make_simulation(tmp_path, "storm")
+    os.remove(os.path.join(simulation_directory, "kin.fil"))
+
+    result = code_execute_k2_simulation.run_simulation(simulation_directory)
+
+    assert result["Status"] == "Failed (FileNotFoundError)"
+    assert "kin.fil" in read_log(simulation_directory)
+
+
+def test_run_simulation_links_read_only_cached_results(tmp_path, k2_executable, monkeypatch):
+    monkeypatch.setattr(config, "K2_RESULT_CACHE", True)
+    first_directory = make_simulation(tmp_path, "storm_1")
+    second_directory = make_simulation(tmp_path, "storm_2")
+
+    assert code_execute_k2_simulation.run_simulation(first_directory)["Status"] == "Completed"
+    result = code_execute_k2_simulation.run_simulation(second_directory)
+
+    assert result["Status"] == "Completed (cached)"
+    for output_file in ["watershed_storm.out", os.path.join("hillslopes", "HillSLOPE_11.SIM")]:
+        output_path = os.path.join(second_directory, output_file)
+        # the output is a link to the cached copy, which is read-only
+        assert os.stat(output_path).st_nlink > 1 or os.path.islink(output_path)
+        assert not os.stat(output_path).st_mode & stat.S_IWRITE
+        # the first run keeps its own writable outputs
+        assert os.stat(os.path.join(first_directory, output_file)).st_mode & stat.S_IWRITE
+
+
+def test_run_simulation_without_cache_unlinks_cached_results(tmp_path, k2_executable, monkeypatch):
+    monkeypatch.setattr(config, "K2_RESULT_CACHE", True)
+    first_directory = make_simulation(tmp_path, "storm_1")
+    second_directory = make_simulation(tmp_path, "storm_2")
+    code_execute_k2_simulation.run_simulation(first_directory)
+    code_execute_k2_simulation.run_simulation(second_directory)
+    cache_directory = os.path.join(tmp_path, "modeling_files", "result_cache")
+    cached_file = os.path.join(cache_directory, os.listdir(cache_directory)[0], "watershed_storm.out")
+
+    # a run with the cache turned off writes new outputs instead of writing through the links to the cache
+    monkeypatch.setattr(config, "K2_RESULT_CACHE", False)
+    (tmp_path / "modeling_files" / "discretization" / "simulations" / "storm_2" / "kin.fil").write_text(
+        "watershed.par,storm.pre,watershed_storm.out,changed,300,1,Y,Y,N,Y")
+    assert code_execute_k2_simulation.run_simulation(second_directory)["Status"] == "Completed"
+
+    output_path = os.path.join(second_directory, "watershed_storm.out")
+    assert os.stat(output_path).st_nlink == 1 and not os.path.islink(output_path)
+    assert os.stat(output_path).st_mode & stat.S_IWRITE
+    assert not os.stat(cached_file).st_mode & stat.S_IWRITE
+    assert os.stat(cached_file).st_nlink == 1
+    assert open(cached_file).read() == "output of watershed.par"
+
+
+def test_run_simulations_updates_status(tmp_path, k2_executable, monkeypatch):
+    simulation_directories = [make_simulation(tmp_path, "storm_1"), make_simulation(tmp_path, "storm_2", "fail"),
+                              make_simulation(tmp_path, "storm's_3")]
+    table = MetaSimulationTable(simulation_directories)
+    arcpy = code_execute_k2_simulation.arcpy
+    monkeypatch.setattr(arcpy, "Exists", lambda path: True)
+    monkeypatch.setattr(arcpy, "AddFieldDelimiters", lambda table, field: field)
+    monkeypatch.setattr(arcpy.da, "UpdateCursor", table.update_cursor)
+
+    results = code_execute_k2_simulation.run_simulations(str(tmp_path / "project.gdb"), simulation_directories)
+
+    assert sorted(result["SimulationPath"] for result in results) == sorted(simulation_directories)
+    assert table.status == {simulation_directories[0]: "Completed",
+                            simulation_directories[1]: "Failed (return code 3)",
+                            simulation_directories[2]: "Completed"}
+    # the quote in the simulation name is escaped in the where clause
+    assert any("storm''s_3" in where_clause for where_clause in table.where_clauses)
@@ -0,0 +1,144 @@
+import os
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import pytest
+import code_hydrograph_store
+
+SIM_HEADER = ("tim_min,Rainfall Rate (mm/hr),Runoff Rate (mm/hr),Runoff Rate (m3/s),Total Sediment Yield (kg/s),"
+              "Sed 0.250 mm (kg/s),Sed 0.033 mm (kg/s),Sed 0.004 mm (kg/s)")
+
+
+def write_sim_file(path, time_steps, seed):
+    """Write a hydrograph (.SIM) file with two title lines, a header line, and time_steps rows of random values.
+    The runoff rate peaks twice at the same value, so the time to peak is the first of them."""
+
+    rng = np.random.default_rng(seed)
+    values = rng.random((time_steps, len(code_hydrograph_store.SIM_COLUMNS))) * 100
+    values[:, 0] = np.arange(time_steps) * 1.5
+    if time_steps > 3:
+        values[[1, 3], 2] = 150.
+    with open(path, "w") as f:
+        f.write(f" KINEROS2 hydrograph\n {os.path.basename(path)}\n{SIM_HEADER}\n")
+        for row in values:
+            f.write(",".join(f"{value:.4f}" for value in row) + "\n")
+
+
+@pytest.fixture
+def simulation(tmp_path, monkeypatch):
+    """A simulation directory with the .SIM files of four hillslopes and two channels, one of them empty."""
+
+    monkeypatch.setattr(code_hydrograph_store.code_process_pool, "create_process_pool",
+                        lambda number_of_tasks: concurrent.futures.ThreadPoolExecutor(2))
+    (tmp_path / "hillslopes").mkdir()
+    (tmp_path / "channels").mkdir()
+    for seed, (folder, name, time_steps) in enumerate([
+            ("hillslopes", "HillSLOPE_12.SIM", 40), ("hillslopes", "HillSLOPE_11.SIM", 25),
+            ("hillslopes", "HillSLOPE_13.SIM", 1), ("hillslopes", "HillSLOPE_22.SIM", 60),
+            ("channels", "CHAN_14.SIM", 80), ("channels", "CHAN_24.SIM", 0)]):
+        write_sim_file(str(tmp_path / folder / name), time_steps, seed)
+    (tmp_path / "hillslopes" / "notes.txt").write_text("not a hydrograph")
+    (tmp_path / "kin.fil").write_text("watershed.par,storm.pre,watershed_storm.out,,360,1,Y,Y,N,Y")
+    return str(tmp_path)
+
+
+def sim_path(simulation_abspath, element_type, element_id):
+    folder, prefix = ("hillslopes", "HillSLOPE_") if element_type == "Hillslope" else ("channels", "CHAN_")
+    return os.path.join(simulation_abspath, folder, f"{prefix}{element_id}.SIM")
+
+
+def test_build_and_load_hydrograph_store(simulation):
+    index_path = code_hydrograph_store.build_hydrograph_store(simulation)
+    store = code_hydrograph_store.load_hydrograph_store(simulation)
+
+    assert index_path == os.path.join(simulation, code_hydrograph_store.STORE_INDEX_NAME)
+    assert list(store["Elements"]) == [("Channel", 14), ("Channel", 24), ("Hillslope", 11), ("Hillslope", 12),
+                                       ("Hillslope", 13), ("Hillslope", 22)]
+    assert store["Count"].tolist() == [80, 0, 25, 40, 1, 60]
+    assert store["Values"].dtype == np.float32 and store["Values"].shape == (8, 206)
+    assert isinstance(store["Values"], np.memmap)
+
+
+def test_read_hydrograph_matches_sim_file(simulation):
+    store = code_hydrograph_store.load_hydrograph_store(simulation)
+
+    for element_type, element_id in store["Elements"]:
+        df = code_hydrograph_store.read_hydrograph(store, element_type, element_id)
+        df_reference = pd.read_csv(sim_path(simulation, element_type, element_id), skiprows=2)
+        df_reference.columns = code_hydrograph_store.SIM_COLUMNS
+        assert list(df.columns) == code_hydrograph_store.SIM_COLUMNS and len(df) == len(df_reference)
+        np.testing.assert_allclose(df.to_numpy(), df_reference.to_numpy(dtype=np.float64), rtol=1e-6, atol=1e-6)
+
+    df = code_hydrograph_store.read_hydrograph(store, "Hillslope", "12", ["tim_min", "Runoff_Rate_mmhr"])
+    assert list(df.columns) == ["tim_min", "Runoff_Rate_mmhr"] and len(df) == 40
+    with pytest.raises(Exception, match="Hillslope 99 is not in the store"):
+        code_hydrograph_store.read_hydrograph(store, "Hillslope", 99)
+    with pytest.raises(Exception, match="Variable Runoff is not in the hydrograph store"):
+        code_hydrograph_store.read_hydrograph(store, "Hillslope", 12, ["Runoff"])
+
+
+def test_load_hydrograph_store_rebuilds_when_sim_files_change(simulation, monkeypatch):
+    code_hydrograph_store.build_hydrograph_store(simulation)
+    build_hydrograph_store = code_hydrograph_store.build_hydrograph_store
+
+    def fail(simulation_abspath):
+        raise AssertionError("the store was rebuilt")
+
+    # an up-to-date store is loaded as it is
+    monkeypatch.setattr(code_hydrograph_store, "build_hydrograph_store", fail)
+    assert code_hydrograph_store.load_hydrograph_store(simulation)["Count"].tolist() == [80, 0, 25, 40, 1, 60]
+
+    # a new run rewrites a .SIM file, which changes the signature of the files
+    path = sim_path(simulation, "Hillslope", 11)
+    write_sim_file(path, 30, seed=10)
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+    rebuilt = []
+    monkeypatch.setattr(code_hydrograph_store, "build_hydrograph_store",
+                        lambda simulation_abspath: rebuilt.append(simulation_abspath) or
+                        build_hydrograph_store(simulation_abspath))
+    store = code_hydrograph_store.load_hydrograph_store(simulation)
+
+    assert rebuilt == [simulation]
+    assert store["Count"].tolist() == [80, 0, 30, 40, 1, 60]
+    df_reference = pd.read_csv(path, skiprows=2)
+    np.testing.assert_allclose(code_hydrograph_store.read_hydrograph(store, "Hillslope", 11).to_numpy(),
+                               df_reference.to_numpy(), rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.parametrize("variable", ["Runoff_Rate_mmhr", "Total_Sediment_Yield_kgs"])
+def test_get_hydrograph_statistics_matches_element_loop(simulation, variable):
+    store = code_hydrograph_store.load_hydrograph_store(simulation)
+
+    df_statistics = code_hydrograph_store.get_hydrograph_statistics(store, variable)
+
+    assert list(df_statistics.columns) == ["ElementType", "ElementID", f"Peak_{variable}", "Time_To_Peak_min",
+                                           f"Total_{variable}"]
+    for row, (element_type, element_id) in enumerate(store["Elements"]):
+        df = code_hydrograph_store.read_hydrograph(store, element_type, element_id, ["tim_min", variable])
+        times, values = df.tim_min.to_numpy(), df[variable].to_numpy()
+        if len(values):
+            expected = [values.max(), times[np.argmax(values)],
+                        np.sum(np.diff(times) * (values[1:] + values[:-1]) / 2)]
+        else:
+            expected = [np.nan, np.nan, 0.]
+        statistics = df_statistics.iloc[row]
+        assert (statistics.ElementType, statistics.ElementID) == (element_type, element_id)
+        np.testing.assert_allclose(statistics.iloc[2:].to_numpy(dtype=np.float64), expected, rtol=1e-9,
+                                   err_msg=f"{element_type} {element_id}")
+    # the runoff rate peaks twice, and the time to peak is the first of them
+    if variable == "Runoff_Rate_mmhr":
+        assert df_statistics.set_index("ElementID").loc[12, "Time_To_Peak_min"] == 1.5
+
+
+def test_read_statistics_in_english_units(simulation):
+    pytest.importorskip("matplotlib")
+    import code_plot_hydrograph
+    store = code_hydrograph_store.load_hydrograph_store(simulation)
+
+    df_metric = code_plot_hydrograph.read_statistics(store, "Hillslope", ["22", "12"], "Runoff_Rate_mmhr")
+    df_english = code_plot_hydrograph.read_statistics(store, "Hillslope", ["22", "12"], "Runoff_Rate_inhr")
+
+    assert df_metric.ElementID.tolist() == df_english.ElementID.tolist() == [12, 22]
+    np.testing.assert_allclose(df_english.Peak_Runoff_Rate_inhr, df_metric.Peak_Runoff_Rate_mmhr * 0.0393701)
+    np.testing.assert_allclose(df_english.Total_Runoff_Rate_inhr, df_metric.Total_Runoff_Rate_mmhr * 0.0393701)
+    np.testing.assert_array_equal(df_english.Time_To_Peak_min, df_metric.Time_To_Peak_min)
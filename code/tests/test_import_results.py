@@ -0,0 +1,250 @@
+import os
+import concurrent.futures
+from unittest import mock
+import arcpy
+import numpy as np
+import pandas as pd
+import pytest
+import code_import_results
+
+ELEMENT_LINES = {"Plane": " Plane Element   ", "Channel": " Channel Elem.    ", "Pond": " Pond Element      "}
+
+
+def write_synthetic_output_file(path, elements, seed=0, newline="\n", without_peak_flow=(), tabular_summary=True):
+    """Write a K2 output file with the given number of element blocks and their tabular summary rows. Every 50th
+    element is a pond, and the others are three planes for each channel. The blocks of the elements numbered in
+    without_peak_flow have no peak flow line. Returns the element IDs and types."""
+
+    rng = np.random.default_rng(seed)
+    numbers = np.arange(elements)
+    element_types = np.where(numbers % 4 == 0, "Channel", "Plane").astype(object)
+    element_types[numbers % 50 == 0] = "Pond"
+    element_ids = numbers * 10 + np.where(element_types == "Plane", 1, 4)
+    peaks = rng.random((elements, 4)) * [100, 300, 1, 300]
+    summary = rng.random((elements, 9)) * 1000
+    without_peak_flow = set(without_peak_flow)
+
+    with open(path, "w", buffering=1024 * 1024, newline=newline) as f:
+        f.write(" KINEROS2 synthetic output\n Title line\n\n")
+        for number, (element_id, element_type, (flow, flow_time, sediment, sediment_time)) in enumerate(zip(
+                element_ids.tolist(), element_types.tolist(), peaks.tolist())):
+            f.write(f"\n {ELEMENT_LINES[element_type]}{element_id:>10}\n\n"
+                    f"   Cumulative rainfall and outflow\n"
+                    f"   Volume balance error =      0.0012 %\n")
+            if number not in without_peak_flow:
+                f.write(f"   Peak flow =     {flow:10.3f} mm/hr at  {flow_time:8.2f} min\n")
+            f.write(f"   Peak sediment discharge = {sediment:10.4f} kg/s   at  {sediment_time:8.2f} min\n")
+        if tabular_summary:
+            f.write("\n Tabular Summary of Element Hydrologic Components\n\n"
+                    "  Element  Element    Area    Contrib. Area    Inflow    Rainfall    Outflow    Peak    "
+                    "Infiltration    Initial    Sediment\n"
+                    "     ID     Type      (m2)        (m2)          (m3)       (m3)        (m3)    (mm/hr)      "
+                    "(m3)         Water       (kg)\n"
+                    " " + "-" * 120 + "\n")
+            for element_id, element_type, values in zip(element_ids.tolist(), element_types.tolist(),
+                                                        summary.tolist()):
+                f.write(f"{element_id:8d} {element_type:>8s} " + " ".join(f"{value:12.4f}" for value in values) +
+                        "\n")
+
+    return element_ids, element_types
+
+
+def read_output_file_line_by_line(path):
+    """Reference reader: the element blocks and the tabular summary read one line at a time."""
+
+    element_types = {line.strip(): element_type for line, element_type in [
+        ("Plane Element", "Hillslope"), ("Channel Elem.", "Channel"), ("Pond Element", "Pond")]}
+    blocks = {"Element_ID": [], "Element_Type": [], "peak_flow_times": [], "peak_sediment_times": [],
+              "peak_sediment_discharge_kgs": []}
+    rows = []
+    with open(path) as f:
+        element = None
+        for line in f:
+            if "Tabular Summary of Element Hydrologic Components" in line:
+                break
+            words = line.split()
+            if len(words) > 1 and " ".join(words[:-1]) in element_types:
+                element = (int(words[-1]), element_types[" ".join(words[:-1])], np.nan)
+            elif element and line.strip().startswith("Peak flow ="):
+                element = element[:2] + (float(words[-2]),)
+            elif element and line.strip().startswith("Peak sediment discharge ="):
+                for name, value in zip(blocks, element + (float(words[-2]), float(words[-5]))):
+                    blocks[name].append(value)
+                element = None
+        for _ in range(4):
+            next(f, None)
+        for line in f:
+            if line.strip():
+                rows.append(line.split())
+
+    tabular = pd.DataFrame(rows, columns=[name for name, _ in code_import_results.TABULAR_COLUMNS])
+    tabular = tabular.astype({name: column_type for name, column_type in code_import_results.TABULAR_COLUMNS})
+    tabular["Element_Type"] = tabular.Element_Type.replace("Plane", "Hillslope")
+    return pd.DataFrame(blocks), tabular
+
+
+def assert_matches_reference(path):
+    element_columns, tabular_columns = code_import_results.read_output_file(path)
+    df_blocks, df_tabular = read_output_file_line_by_line(path)
+    pd.testing.assert_frame_equal(pd.DataFrame(element_columns), df_blocks, check_dtype=False)
+    pd.testing.assert_frame_equal(pd.DataFrame(tabular_columns), df_tabular, check_dtype=False)
+    return element_columns, tabular_columns
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("elements", [1, 7, 1000])
+def test_read_output_file_matches_line_by_line_reader(tmp_path, newline, elements):
+    path = str(tmp_path / "watershed_storm.out")
+    element_ids, element_types = write_synthetic_output_file(path, elements, newline=newline)
+
+    element_columns, tabular_columns = assert_matches_reference(path)
+
+    np.testing.assert_array_equal(element_columns["Element_ID"], element_ids)
+    np.testing.assert_array_equal(element_columns["Element_Type"],
+                                  pd.Series(element_types).replace("Plane", "Hillslope").to_numpy())
+    assert element_columns["Element_ID"].dtype == tabular_columns["Element_ID"].dtype == np.int64
+    assert len(tabular_columns["Element_ID"]) == elements
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_read_output_file_block_without_peak_flow(tmp_path, newline):
+    path = str(tmp_path / "watershed_storm.out")
+    write_synthetic_output_file(path, 20, newline=newline, without_peak_flow=[0, 5, 19])
+
+    element_columns, _ = assert_matches_reference(path)
+
+    assert np.flatnonzero(np.isnan(element_columns["peak_flow_times"])).tolist() == [0, 5, 19]
+    assert not np.isnan(element_columns["peak_sediment_times"]).any()
+
+
+def test_read_output_file_empty_file(tmp_path):
+    path = tmp_path / "empty.out"
+    path.write_bytes(b"")
+
+    element_columns, tabular_columns = code_import_results.read_output_file(str(path))
+
+    assert list(tabular_columns) == [name for name, _ in code_import_results.TABULAR_COLUMNS]
+    assert all(len(values) == 0 for values in list(element_columns.values()) + list(tabular_columns.values()))
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_read_output_file_without_tabular_summary(tmp_path, newline):
+    path = str(tmp_path / "interrupted.out")
+    element_ids, _ = write_synthetic_output_file(path, 30, newline=newline, tabular_summary=False)
+
+    element_columns, tabular_columns = assert_matches_reference(path)
+
+    np.testing.assert_array_equal(element_columns["Element_ID"], element_ids)
+    assert all(len(values) == 0 for values in tabular_columns.values())
+
+
+def test_read_simulation_results_of_batch_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(code_import_results.code_process_pool, "create_process_pool",
+                        lambda number_of_tasks: concurrent.futures.ThreadPoolExecutor(2))
+    # the second parameterization is named after its label, which the name used to be split on
+    for par_name, parameterization in [("p1.par", "p1"), ("p2.par", "Parameterization 2")]:
+        (tmp_path / par_name).write_text(f"! File Info\n"
+                                         f"!  AGWA Parameterization Equation Version: 4.0\n"
+                                         f"!  Parameterization                        {parameterization}\n"
+                                         f"! End of File Info\n\nBEGIN GLOBAL\nEND GLOBAL\n")
+    write_synthetic_output_file(str(tmp_path / "p1_storm.out"), 7, seed=1)
+    write_synthetic_output_file(str(tmp_path / "p2_storm.out"), 7, seed=2)
+    (tmp_path / "kin.fil").write_text("p1.par,storm.pre,p1_storm.out,,360,1,Y,Y,N,Y\n"
+                                      "p2.par,storm.pre,p2_storm.out,,360,1,Y,Y,N,Y")
+
+    df_results = code_import_results.read_simulation_results("d1", "s1", "fallback", "sim1", str(tmp_path))
+
+    assert list(df_results.columns[:5]) == ["DelineationName", "DiscretizationName", "ParameterizationName",
+                                            "SimulationName", "OutFileName"]
+    assert df_results.groupby("OutFileName", sort=False).ParameterizationName.unique().apply(list).to_dict() == \
+           {"p1_storm.out": ["p1"], "p2_storm.out": ["Parameterization 2"]}
+    for out_name in ["p1_storm.out", "p2_storm.out"]:
+        df_out = df_results[df_results.OutFileName == out_name]
+        element_columns, tabular_columns = code_import_results.read_output_file(str(tmp_path / out_name))
+        np.testing.assert_array_equal(df_out.Element_ID, element_columns["Element_ID"])
+        np.testing.assert_array_equal(df_out.peak_flow_times, element_columns["peak_flow_times"])
+        np.testing.assert_array_equal(df_out.Sediment_Yield_kg, tabular_columns["Sediment_Yield_kg"])
+
+
+RESULTS_TABLE = os.path.join("results.gdb", "k2_results")
+
+
+@pytest.fixture
+def management(monkeypatch):
+    """arcpy.management as a mock recording its calls, with the tables that exist in existing_tables."""
+
+    management = mock.MagicMock(name="management")
+    management.GetCount.return_value = ["0"]
+    management.existing_tables = set()
+    monkeypatch.setattr(arcpy, "management", management)
+    monkeypatch.setattr(arcpy, "Exists", lambda table: table in management.existing_tables)
+    monkeypatch.setattr(arcpy, "AddFieldDelimiters", lambda workspace, field: f'"{field}"')
+    monkeypatch.setattr(arcpy.da, "NumPyArrayToTable", management.NumPyArrayToTable)
+    monkeypatch.setattr(arcpy, "CreateTable_management", management.CreateTable)
+    return management
+
+
+@pytest.mark.parametrize("count, left_over_view", [("0", False), ("3", False), ("3", True)])
+def test_delete_rows(management, count, left_over_view):
+    management.GetCount.return_value = [count]
+    if left_over_view:
+        management.existing_tables.add("k2_results_tableview")
+
+    code_import_results.delete_rows(RESULTS_TABLE, "where")
+
+    expected_calls = [mock.call.Delete("k2_results_tableview")] if left_over_view else []
+    expected_calls += [mock.call.MakeTableView(RESULTS_TABLE, "k2_results_tableview", "where"),
+                       mock.call.GetCount("k2_results_tableview")]
+    if count != "0":
+        expected_calls.append(mock.call.DeleteRows("k2_results_tableview"))
+    expected_calls.append(mock.call.Delete("k2_results_tableview"))
+    assert management.method_calls == expected_calls
+
+
+def test_append_rows(management):
+    management.existing_tables.add(os.path.join("in_memory", "k2_results_append"))
+    df = pd.DataFrame({"Element_ID": np.array([1, 2, 2 ** 31 - 1], dtype=np.int64),
+                       "Outflow_mm": [0.5, np.nan, 2.5],
+                       "OutFileName": ["a.out", np.nan, "c.out"]})
+
+    code_import_results.append_rows(RESULTS_TABLE, df)
+
+    array = management.NumPyArrayToTable.call_args.args[0]
+    assert array.dtype["Element_ID"] == np.int32 and array.dtype["Outflow_mm"] == np.float64
+    assert array.dtype["OutFileName"].kind == "U"
+    assert array["Element_ID"].tolist() == [1, 2, 2 ** 31 - 1]
+    np.testing.assert_array_equal(array["Outflow_mm"], [0.5, np.nan, 2.5])
+    assert array["OutFileName"].tolist() == ["a.out", "", "c.out"]
+    # a left-over in-memory table is deleted before the rows are written to it
+    assert [name for name, _, _ in management.method_calls] == ["Delete", "NumPyArrayToTable", "Append", "Delete"]
+    assert management.Append.call_args == mock.call(os.path.join("in_memory", "k2_results_append"), RESULTS_TABLE,
+                                                    "NO_TEST")
+
+
+@pytest.mark.parametrize("table_exists", [False, True])
+def test_import_k2_results(management, monkeypatch, table_exists):
+    df_results = pd.DataFrame({"DelineationName": "d1", "DiscretizationName": "s1",
+                               "ParameterizationName": ["p1", "O'Brien", "O'Brien"], "SimulationName": "sim 1",
+                               "OutFileName": ["a.out", "b.out", "b.out"], "Element_ID": [1, 2, 3],
+                               "Outflow_mm": [0.5, 1.5, 2.5]})
+    monkeypatch.setattr(code_import_results, "read_simulation_results", lambda *args: df_results)
+    monkeypatch.setattr(code_import_results.code_hydrograph_store, "get_run_count", lambda simulation_abspath: 2)
+    if table_exists:
+        management.existing_tables.add(RESULTS_TABLE)
+
+    code_import_results.import_k2_results("results.gdb", "d1", "s1", "p1", "sim 1", "simulation")
+
+    assert management.MakeTableView.call_args.args[2] == (
+        """"DelineationName" = 'd1' AND "DiscretizationName" = 's1' AND """
+        """"ParameterizationName" IN ('p1', 'O''Brien') AND "SimulationName" = 'sim 1'""")
+    assert management.NumPyArrayToTable.call_args.args[0].dtype.names == tuple(df_results.columns)
+    # the fields and their aliases are only added when the table is created
+    if table_exists:
+        assert not management.CreateTable.called and not management.AddFields.called
+    else:
+        management.CreateTable.assert_called_once_with("results.gdb", "k2_results")
+        assert management.AddFields.call_args.args == (RESULTS_TABLE, [
+            ["DelineationName", "TEXT", "Delineation Name"], ["DiscretizationName", "TEXT", "Discretization Name"],
+            ["ParameterizationName", "TEXT", "Parameterization Name"], ["SimulationName", "TEXT", "Simulation Name"],
+            ["OutFileName", "TEXT", "Output File Name"], ["Element_ID", "LONG", "Element ID"],
+            ["Outflow_mm", "DOUBLE", "Outflow (mm)"]])
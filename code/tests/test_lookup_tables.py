@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import code_lookup_tables
+
+
+def make_polygon_index(polygons):
+    """Build a polygon index like read_polygon_index from {name: [ring, ...]}, each ring a closed list of (x, y)."""
+
+    names, bounding_boxes, edges = [], [], []
+    for name, rings in polygons.items():
+        rings = [np.asarray(ring, dtype=np.float64) for ring in rings]
+        polygon_edges = np.concatenate([np.hstack([ring[:-1], ring[1:]]) for ring in rings])
+        names.append(name)
+        bounding_boxes.append((polygon_edges[:, 0].min(), polygon_edges[:, 1].min(),
+                               polygon_edges[:, 0].max(), polygon_edges[:, 1].max()))
+        edges.append(polygon_edges)
+    return {"Names": names, "BoundingBoxes": np.array(bounding_boxes), "Edges": edges, "SpatialReference": None}
+
+
+def find_polygons_brute_force(polygon_index, x, y):
+    """Even-odd rule over every point and edge."""
+
+    found = []
+    for px, py in zip(x, y):
+        name = None
+        for polygon_name, edges in zip(polygon_index["Names"], polygon_index["Edges"]):
+            inside = False
+            for x1, y1, x2, y2 in edges:
+                if min(y1, y2) <= py < max(y1, y2) and px < (x2 - x1) * (py - y1) / (y2 - y1) + x1:
+                    inside = not inside
+            if inside:
+                name = polygon_name
+                break
+        found.append(name)
+    return found
+
+
+@pytest.fixture
+def polygon_index():
+    # a star with many short edges, a square with a hole, and a triangle overlapping the square
+    angles = np.linspace(0, 2 * np.pi, 401)
+    radii = np.where(np.arange(401) % 2, 4.0, 10.0)
+    star = np.column_stack([radii * np.cos(angles), radii * np.sin(angles)])
+    star[-1] = star[0]
+    square = [(20, 0), (30, 0), (30, 10), (20, 10), (20, 0)]
+    hole = [(23, 3), (27, 3), (27, 7), (23, 7), (23, 3)]
+    triangle = [(25, 5), (40, 5), (32, 15), (25, 5)]
+    return make_polygon_index({"star": [star], "square": [square, hole], "triangle": [triangle]})
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 4000000])
+def test_find_polygons_matches_brute_force(polygon_index, chunk_size):
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-12, 42, 500)
+    y = rng.uniform(-12, 17, 500)
+
+    found = code_lookup_tables.find_polygons(polygon_index, x, y, chunk_size)
+
+    assert found == find_polygons_brute_force(polygon_index, x, y)
+    assert {"star", "square", "triangle", None} <= set(found)
+
+
+def test_find_polygons_chunks_are_bounded(polygon_index, monkeypatch):
+    # the points are in a narrow band, so most edges of the star cross no points
+    rng = np.random.default_rng(1)
+    x = rng.uniform(-10, 10, 2000)
+    y = rng.uniform(-0.5, 0.5, 2000)
+    chunk_size = 200
+    pair_group_sizes = []
+    repeat = np.repeat
+
+    def recording_repeat(values, counts, *args, **kwargs):
+        result = repeat(values, counts, *args, **kwargs)
+        pair_group_sizes.append(len(result))
+        return result
+
+    monkeypatch.setattr(code_lookup_tables.np, "repeat", recording_repeat)
+    found = code_lookup_tables.find_polygons(polygon_index, x, y, chunk_size)
+    monkeypatch.undo()
+
+    # a group can only go over chunk_size by the points of its last edge
+    largest_edge = max(int(((y >= min(y1, y2)) & (y < max(y1, y2))).sum())
+                       for x1, y1, x2, y2 in polygon_index["Edges"][0])
+    assert max(pair_group_sizes) <= chunk_size + largest_edge
+    assert found == find_polygons_brute_force(polygon_index, x, y)
@@ -0,0 +1,176 @@
+import os
+import json
+import threading
+import urllib.parse
+import http.server
+import pytest
+import config
+import code_write_k2_precipitation_file as precipitation
+
+TABLE = [[f"{duration * 10 + recurrence + 1:.3f}" for recurrence in range(10)]
+         for duration in range(len(precipitation.NOAA_DURATIONS))]
+NOAA_RESPONSE = (f"result = 'values';\n"
+                 f"quantiles = {TABLE};\n"
+                 f"upper = {[[f'{float(value) * 1.2:.3f}' for value in row] for row in TABLE]};\n"
+                 f"lower = {[[f'{float(value) * 0.8:.3f}' for value in row] for row in TABLE]};\n"
+                 f"lat = '32.123';\n"
+                 f"lon = '-110.988';\n"
+                 f"region = 'Semiarid Southwest';\n"
+                 f"unit = 'mm';\n"
+                 f"datatype = 'depth';\n"
+                 f"volume = '1';\n"
+                 f"version = '2';\n")
+
+
+class NoaaServer(http.server.ThreadingHTTPServer):
+    """Stand-in for the NOAA server. Each request takes the next (status, delay) of responses, or the last one when
+    they are used up, and its query parameters are recorded."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), NoaaHandler)
+        self.responses = [(200, 0)]
+        self.requests = []
+        self.stopped = threading.Event()
+
+
+class NoaaHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query)))
+        status, delay = server.responses[min(len(server.requests), len(server.responses)) - 1]
+        if delay and server.stopped.wait(delay):
+            return
+        body = (NOAA_RESPONSE if status == 200 else "error").encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def noaa_server(monkeypatch):
+    server = NoaaServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(precipitation, "NOAA_URL", f"http://127.0.0.1:{server.server_address[1]}/cgi_readH5.py")
+    monkeypatch.setattr(precipitation.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(config, "NOAA_OFFLINE", False)
+    monkeypatch.setattr(config, "NOAA_CACHE_DECIMALS", 3)
+    monkeypatch.setattr(config, "NOAA_CACHE_MAX_AGE_DAYS", 365)
+    monkeypatch.setattr(config, "NOAA_REQUEST_TIMEOUT", 5)
+    monkeypatch.setattr(config, "NOAA_REQUEST_RETRIES", 3)
+    yield server
+    server.stopped.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_noaa_response():
+    parsed_data = precipitation.parse_noaa_response(NOAA_RESPONSE)
+
+    assert parsed_data["quantiles"] == TABLE
+    assert parsed_data["upper"][0][0] == "1.200"
+    assert parsed_data["region"] == "Semiarid Southwest"
+    assert parsed_data["lat"] == "32.123"
+    assert precipitation.get_noaa_depth(parsed_data, "60min", "100", "quantiles") == (47.0, 1.0)
+
+
+def test_request_noaa_data(noaa_server):
+    text = precipitation.request_noaa_data({"lat": 32.123456, "lon": -110.987654, "type": "pf"})
+
+    assert text == NOAA_RESPONSE
+    assert noaa_server.requests == [{"lat": "32.123456", "lon": "-110.987654", "type": "pf"}]
+
+
+def test_request_noaa_data_retries_server_errors(noaa_server):
+    noaa_server.responses = [(503, 0), (500, 0), (200, 0)]
+
+    assert precipitation.request_noaa_data({"lat": 32.1, "lon": -110.9}) == NOAA_RESPONSE
+    assert len(noaa_server.requests) == 3
+
+
+def test_request_noaa_data_gives_up_after_retries(noaa_server):
+    noaa_server.responses = [(500, 0)]
+
+    with pytest.raises(Exception, match="NOAA server error"):
+        precipitation.request_noaa_data({"lat": 32.1, "lon": -110.9})
+    assert len(noaa_server.requests) == config.NOAA_REQUEST_RETRIES
+
+
+def test_request_noaa_data_does_not_retry_client_errors(noaa_server):
+    noaa_server.responses = [(404, 0)]
+
+    with pytest.raises(Exception, match="404"):
+        precipitation.request_noaa_data({"lat": 32.1, "lon": -110.9})
+    assert len(noaa_server.requests) == 1
+
+
+def test_request_noaa_data_retries_timeouts(noaa_server, monkeypatch):
+    monkeypatch.setattr(config, "NOAA_REQUEST_TIMEOUT", 0.2)
+    noaa_server.responses = [(200, 5), (200, 0)]
+
+    assert precipitation.request_noaa_data({"lat": 32.1, "lon": -110.9}) == NOAA_RESPONSE
+    assert len(noaa_server.requests) == 2
+
+    noaa_server.requests.clear()
+    noaa_server.responses = [(200, 5)]
+    with pytest.raises(Exception, match="after 3 attempts"):
+        precipitation.request_noaa_data({"lat": 32.1, "lon": -110.9})
+    assert len(noaa_server.requests) == 3
+
+
+def test_fetch_noaa_table_without_cache_sends_full_precision(noaa_server):
+    parsed_data = precipitation.fetch_noaa_table(32.1234567, -110.9876543)
+
+    assert parsed_data["quantiles"] == TABLE
+    assert noaa_server.requests[0]["lat"] == "32.1234567"
+    assert noaa_server.requests[0]["lon"] == "-110.9876543"
+
+
+def test_fetch_noaa_table_cache_hit(noaa_server, tmp_path):
+    first = precipitation.fetch_noaa_table(32.1234567, -110.9876543, str(tmp_path))
+    # a nearby point rounds to the same cache key
+    second = precipitation.fetch_noaa_table(32.1231, -110.9879, str(tmp_path))
+
+    assert first == second
+    assert len(noaa_server.requests) == 1
+    assert noaa_server.requests[0]["lat"] == "32.1234567"
+    cache_path = tmp_path / "pf_depth_metric_pds_32.123_-110.988.json"
+    assert json.loads(cache_path.read_text())["request"]["lat"] == 32.1234567
+
+
+def test_fetch_noaa_table_cache_expiry(noaa_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "NOAA_CACHE_MAX_AGE_DAYS", 30)
+    precipitation.fetch_noaa_table(32.123, -110.988, str(tmp_path))
+    cache_path = str(tmp_path / "pf_depth_metric_pds_32.123_-110.988.json")
+    old_time = os.path.getmtime(cache_path) - 31 * 86400
+    os.utime(cache_path, (old_time, old_time))
+
+    precipitation.fetch_noaa_table(32.123, -110.988, str(tmp_path))
+
+    assert len(noaa_server.requests) == 2
+    assert os.path.getmtime(cache_path) > old_time
+
+
+def test_fetch_noaa_table_offline(noaa_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "NOAA_CACHE_MAX_AGE_DAYS", 30)
+    precipitation.fetch_noaa_table(32.123, -110.988, str(tmp_path))
+    cache_path = str(tmp_path / "pf_depth_metric_pds_32.123_-110.988.json")
+    old_time = os.path.getmtime(cache_path) - 31 * 86400
+    os.utime(cache_path, (old_time, old_time))
+    monkeypatch.setattr(config, "NOAA_OFFLINE", True)
+
+    # expired responses are still used offline, and points that are not cached fail without a request
+    assert precipitation.fetch_noaa_table(32.123, -110.988, str(tmp_path))["quantiles"] == TABLE
+    with pytest.raises(Exception, match="offline"):
+        precipitation.fetch_noaa_table(40.0, -105.0, str(tmp_path))
+    assert len(noaa_server.requests) == 1
@@ -0,0 +1,410 @@
+import os
+import math
+import types
+import shutil
+import collections
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import pytest
+import config
+import code_parameterize_land_cover_and_soils as soils
+
+SOIL_TABLES = {
+    "component": pd.DataFrame({"cokey": ["11", "12", "21"], "comppct_r": [60, 40, 100], "mukey": ["2", "1", "2"]}),
+    "chorizon": pd.DataFrame({"cokey": ["11", "21"], "chkey": ["111", "211"]}),
+    "chtexturegrp": pd.DataFrame({"chkey": ["111", "211"], "chtgkey": ["1111", "2111"]}),
+    "chtexture": pd.DataFrame({"chtgkey": ["1111", "2111"], "texcl": ["Loam", "Sand"]})}
+
+
+@pytest.fixture
+def soil_gdb(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    soil_gdb = tmp_path / "gSSURGO_AZ.gdb"
+    soil_gdb.mkdir()
+    (soil_gdb / "a00000001.gdbtable").write_bytes(b"table")
+    monkeypatch.setattr(config, "SOIL_DATABASE_CACHE_DIRECTORY", "")
+    monkeypatch.setattr(soils, "read_soil_table", lambda soil_gdb, table: SOIL_TABLES[table].copy())
+    return str(soil_gdb)
+
+
+def filter_soil_tables(mukeys):
+    """Reference filter: the rows of SOIL_TABLES reachable from the map units, one table at a time."""
+
+    component = SOIL_TABLES["component"][SOIL_TABLES["component"].mukey.isin(mukeys)]
+    chorizon = SOIL_TABLES["chorizon"][SOIL_TABLES["chorizon"].cokey.isin(component.cokey)]
+    chtexturegrp = SOIL_TABLES["chtexturegrp"][SOIL_TABLES["chtexturegrp"].chkey.isin(chorizon.chkey)]
+    chtexture = SOIL_TABLES["chtexture"][SOIL_TABLES["chtexture"].chtgkey.isin(chtexturegrp.chtgkey)]
+    return {"component": component, "chorizon": chorizon, "chtexturegrp": chtexturegrp, "chtexture": chtexture}
+
+
+@pytest.mark.parametrize("mukeys", [["2"], ["1"], [1, 2], ["3"], []])
+def test_load_soil_tables_from_cache_filters_by_map_units(soil_gdb, tmp_path, mukeys):
+    soils.export_soil_database_cache(soil_gdb, str(tmp_path))
+
+    soil_tables = soils.load_soil_tables_from_cache(soil_gdb, str(tmp_path), mukeys)
+
+    expected = filter_soil_tables([str(mukey) for mukey in mukeys])
+    for table, df_expected in expected.items():
+        key = soils.SOIL_TABLE_FIELDS[table][1]
+        df_expected = df_expected.sort_values(by=key).reset_index(drop=True)
+        pd.testing.assert_frame_equal(soil_tables[table].reset_index(drop=True), df_expected, check_dtype=False)
+
+
+def test_export_soil_database_cache_interrupted_leaves_no_cache(soil_gdb, tmp_path, monkeypatch):
+    def read_soil_table(soil_gdb, table):
+        if table == "chtexture":
+            raise OSError("the database was locked")
+        return SOIL_TABLES[table].copy()
+
+    monkeypatch.setattr(soils, "read_soil_table", read_soil_table)
+    with pytest.raises(OSError):
+        soils.export_soil_database_cache(soil_gdb, str(tmp_path))
+
+    # the tables written before the failure stay in the temporary directory, which is removed
+    database_directory, cache_directory = soils.get_soil_database_cache_directory(soil_gdb, str(tmp_path))
+    assert os.listdir(database_directory) == []
+    assert not soils.is_soil_database_cache_complete(cache_directory)
+
+
+def test_export_soil_database_cache_keeps_cache_of_other_process(soil_gdb, tmp_path, monkeypatch):
+    database_directory, cache_directory = soils.get_soil_database_cache_directory(soil_gdb, str(tmp_path))
+    replace = os.replace
+
+    def replace_after_other_process(source, destination):
+        # another process moves its complete cache into place just before this one
+        if destination == cache_directory and not os.path.exists(cache_directory):
+            other_directory = os.path.join(database_directory, "other.tmp")
+            shutil.copytree(source, other_directory)
+            replace(other_directory, cache_directory)
+            open(os.path.join(cache_directory, "other"), "w").close()
+            raise OSError("Directory not empty")
+        return replace(source, destination)
+
+    monkeypatch.setattr(soils.os, "replace", replace_after_other_process)
+    soils.export_soil_database_cache(soil_gdb, str(tmp_path))
+
+    assert os.listdir(database_directory) == [os.path.basename(cache_directory)]
+    assert os.path.exists(os.path.join(cache_directory, "other"))
+
+
+def test_load_soil_tables_from_cache_creates_cache(soil_gdb, tmp_path):
+    soil_tables = soils.load_soil_tables_from_cache(soil_gdb, str(tmp_path), ["2"])
+
+    assert soil_tables["component"].cokey.tolist() == ["11", "21"]
+    assert soil_tables["chtexture"].texcl.tolist() == ["Loam", "Sand"]
+    database_directory, cache_directory = soils.get_soil_database_cache_directory(soil_gdb, str(tmp_path))
+    # only the complete cache is left, without temporary directories
+    assert os.listdir(database_directory) == [os.path.basename(cache_directory)]
+
+
+def test_export_soil_database_cache_keeps_existing_cache(soil_gdb, tmp_path):
+    soils.export_soil_database_cache(soil_gdb, str(tmp_path))
+    database_directory, cache_directory = soils.get_soil_database_cache_directory(soil_gdb, str(tmp_path))
+    component_file = os.path.join(cache_directory, "component.parquet")
+    modification_time = os.path.getmtime(component_file)
+
+    # a second export, as by another process that found no cache when it started, does not fail
+    soils.export_soil_database_cache(soil_gdb, str(tmp_path))
+
+    assert os.path.getmtime(component_file) == modification_time
+    assert os.listdir(database_directory) == [os.path.basename(cache_directory)]
+
+
+def test_export_soil_database_cache_replaces_incomplete_and_old_caches(soil_gdb, tmp_path):
+    database_directory, cache_directory = soils.get_soil_database_cache_directory(soil_gdb, str(tmp_path))
+    old_directory = os.path.join(database_directory, "1000")
+    os.makedirs(old_directory)
+    os.makedirs(cache_directory)
+    open(os.path.join(cache_directory, "component.parquet.tmp"), "w").close()
+
+    soils.load_soil_tables_from_cache(soil_gdb, str(tmp_path), None)
+
+    assert os.listdir(database_directory) == [os.path.basename(cache_directory)]
+    assert sorted(os.listdir(cache_directory)) == sorted(f"{table}.parquet" for table in soils.SOIL_TABLE_FIELDS)
+
+
+def test_get_parameterization_where_clause_escapes_names(monkeypatch):
+    monkeypatch.setattr(soils.arcpy, "AddFieldDelimiters", lambda table, field: f'"{field}"')
+
+    where_clause = soils.get_parameterization_where_clause("project.gdb/parameters_hillslopes", "d1", "O'Brien", 
+                                                           "it's 'wet'")
+
+    assert where_clause == ("\"DelineationName\" = 'd1' AND \"DiscretizationName\" = 'O''Brien' AND "
+                            "\"ParameterizationName\" = 'it''s ''wet'''")
+
+
+class FakeRasters:
+    """Stand-in for arcpy.Raster, arcpy.Point and arcpy.RasterToNumPyArray over in-memory arrays on one grid with
+    1 m cells and the upper left corner at (0, 0)."""
+
+    def __init__(self, arrays, nodata):
+        self.arrays, self.nodata = arrays, nodata
+        self.blocks = []
+
+    def raster(self, name):
+        rows, columns = self.arrays[name].shape
+        return types.SimpleNamespace(extent=types.SimpleNamespace(XMin=0., YMin=-float(rows), YMax=0.), width=columns,
+                                     height=rows, meanCellWidth=1., meanCellHeight=1., noDataValue=self.nodata[name])
+
+    def raster_to_numpy_array(self, name, lower_left, columns, rows):
+        first_row = int(-lower_left.Y) - rows
+        self.blocks.append((name, first_row, rows))
+        return self.arrays[name][first_row:first_row + rows, :columns]
+
+
+@pytest.mark.parametrize("block_rows", [1, 3, 7, 100])
+def test_crosstab_label_rasters_matches_counter(monkeypatch, block_rows):
+    rng = np.random.default_rng(0)
+    zones = rng.integers(1, 6, (17, 11)).astype(np.int32)
+    classes = rng.integers(100000, 100004, (17, 11)).astype(np.int32)
+    zones[rng.random(zones.shape) < 0.1] = -1
+    classes[rng.random(classes.shape) < 0.1] = 0
+    fake = FakeRasters({"zones": zones, "classes": classes}, {"zones": -1, "classes": 0})
+    monkeypatch.setattr(soils.arcpy, "Raster", fake.raster)
+    monkeypatch.setattr(soils.arcpy, "Point", lambda x, y: types.SimpleNamespace(X=x, Y=y))
+    monkeypatch.setattr(soils.arcpy, "RasterToNumPyArray", fake.raster_to_numpy_array)
+
+    df_counts = soils.crosstab_label_rasters("zones", "classes", block_rows)
+
+    # the NoData cells of either raster are not counted, and pairs in several blocks are added up
+    expected = collections.Counter((zone, value) for zone, value in zip(zones.ravel().tolist(), classes.ravel().tolist())
+                                   if zone != -1 and value != 0)
+    assert dict(zip(zip(df_counts.Zone.tolist(), df_counts.Class.tolist()), df_counts.CellCount.tolist())) == expected
+    assert sorted({first_row for name, first_row, _ in fake.blocks}) == list(range(0, 17, block_rows))
+
+
+def test_crosstab_label_rasters_all_nodata(monkeypatch):
+    fake = FakeRasters({"zones": np.full((3, 4), -1), "classes": np.ones((3, 4))}, {"zones": -1, "classes": None})
+    monkeypatch.setattr(soils.arcpy, "Raster", fake.raster)
+    monkeypatch.setattr(soils.arcpy, "Point", lambda x, y: types.SimpleNamespace(X=x, Y=y))
+    monkeypatch.setattr(soils.arcpy, "RasterToNumPyArray", fake.raster_to_numpy_array)
+
+    df_counts = soils.crosstab_label_rasters("zones", "classes", 2)
+
+    assert df_counts.empty
+    assert list(df_counts.columns) == ["Zone", "Class", "CellCount"]
+
+
+def make_soil_database():
+    """gSSURGO tables of four map units: 1 and 2 with two components and several horizons, 3 with one horizon, 
+    and 4 with a texture that is not in kin_lut."""
+
+    horizons = [("11", "111", 0, 20, "Loam"), ("11", "112", 20, 60, "Clay"), ("11", "113", 60, 250, "Sand"),
+                ("12", "121", 0, 30, "Sand"), ("21", "211", 0, 15, "Clay"), ("21", "212", 15, 80, "Loam"),
+                ("22", "221", 0, 100, "Loam"), ("31", "311", 0, 40, "Sand"), ("41", "411", 0, 10, "Bedrock")]
+    rng = np.random.default_rng(1)
+    return {
+        "component": pd.DataFrame({"cokey": ["11", "12", "21", "22", "31", "41"], "comppct_r": [70, 30, 55, 45, 100, 90],
+                                   "mukey": ["1", "1", "2", "2", "3", "4"]}),
+        "chorizon": pd.DataFrame({
+            "cokey": [h[0] for h in horizons], "chkey": [h[1] for h in horizons], 
+            "hzname": [f"H{h[1][-1]}" for h in horizons], "hzdept_r": [h[2] for h in horizons],
+            "hzdepb_r": [h[3] for h in horizons], "ksat_r": rng.uniform(1, 100, len(horizons)),
+            "sandtotal_r": rng.uniform(10, 60, len(horizons)), "silttotal_r": rng.uniform(10, 30, len(horizons)),
+            "claytotal_r": rng.uniform(5, 30, len(horizons)), "dbthirdbar_r": rng.uniform(1.2, 1.6, len(horizons)),
+            "partdensity": np.full(len(horizons), 2.65), "sieveno10_r": rng.uniform(60, 100, len(horizons)),
+            "kwfact": rng.uniform(0.1, 0.4, len(horizons))}),
+        "chtexturegrp": pd.DataFrame({"chkey": [h[1] for h in horizons], "chtgkey": [h[1] + "0" for h in horizons],
+                                      "texture": ["L"] * len(horizons), "texdesc": [h[4] for h in horizons],
+                                      "rvindicator": ["Yes"] * len(horizons)}),
+        "chtexture": pd.DataFrame({"chtgkey": [h[1] + "0" for h in horizons], "texcl": [h[4] for h in horizons],
+                                   "lieutex": ["None"] * len(horizons)})}
+
+
+KIN_LUT = pd.DataFrame({"TextureName": ["Sand", "Loam", "Clay"], "KS": [210., 5.2, 0.6], "G": [46., 111., 406.],
+                        "POR": [0.44, 0.46, 0.48], "SMAX": [0.91, 0.94, 0.96], "CV": [0.1, 0.1, 0.1],
+                        "SAND": [95., 40., 20.], "SILT": [3., 40., 20.], "CLAY": [2., 20., 60.],
+                        "DIST": [0.69, 0.25, 0.16], "KFF": [0.02, 0.3, 0.2]})
+
+
+@pytest.fixture
+def soil_database(soil_gdb, monkeypatch):
+    soil_tables = make_soil_database()
+    kin_lut = {"table": KIN_LUT}
+    monkeypatch.setattr(soils, "read_soil_table", lambda soil_gdb, table: soil_tables[table].copy())
+    monkeypatch.setattr(soils.code_lookup_tables, "get_lookup_table_path", lambda agwa_directory, name: name)
+    monkeypatch.setattr(soils.code_lookup_tables, "read_lookup_table", lambda path: kin_lut["table"].copy())
+    # the chunks are computed in threads, so the monkeypatched functions apply
+    monkeypatch.setattr(soils.code_process_pool, "create_process_pool", 
+                        lambda number_of_tasks: concurrent.futures.ThreadPoolExecutor(2))
+    return soil_tables, kin_lut
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 250])
+def test_soil_parameter_lookup_matches_query(soil_database, soil_gdb, tmp_path, chunk_size):
+    soil_tables, _ = soil_database
+    soils.build_soil_parameter_lookup(soil_gdb, str(tmp_path), 200, 2, chunk_size)
+
+    for mukeys in [["1"], ["3", "1"], ["2", "3", "1"]]:
+        df_lookup = soils.lookup_soil_parameters(soil_gdb, str(tmp_path), mukeys, KIN_LUT, 200, 2)
+        df_horizon_parameters = soils.query_soil_parameters(
+            pd.DataFrame({"mukey": mukeys}), soil_tables["component"].copy(), soil_tables["chorizon"], 
+            soil_tables["chtexturegrp"], soil_tables["chtexture"], KIN_LUT, 200, 2)
+        _, df_expected = soils.calculate_weighted_hillslope_soil_parameters(df_horizon_parameters)
+        pd.testing.assert_frame_equal(df_lookup, df_expected, check_dtype=False)
+
+    # map unit 4 could not be parameterized, so it is queried, which reports the texture missing from kin_lut
+    assert soils.lookup_soil_parameters(soil_gdb, str(tmp_path), ["1", "4"], KIN_LUT, 200, 2) is None
+
+
+def test_soil_parameter_lookup_is_keyed_by_kin_lut_and_settings(soil_database, soil_gdb, tmp_path):
+    _, kin_lut = soil_database
+    lookup_path = soils.build_soil_parameter_lookup(soil_gdb, str(tmp_path), 200, 2)
+    assert soils.lookup_soil_parameters(soil_gdb, str(tmp_path), ["1"], KIN_LUT, 200, 2) is not None
+
+    df_kin_lut = KIN_LUT.copy()
+    df_kin_lut.loc[df_kin_lut.TextureName == "Loam", "KS"] = 6.8
+    assert soils.lookup_soil_parameters(soil_gdb, str(tmp_path), ["1"], df_kin_lut, 200, 2) is None
+    assert soils.lookup_soil_parameters(soil_gdb, str(tmp_path), ["1"], KIN_LUT, 100, 2) is None
+    assert soils.lookup_soil_parameters(soil_gdb, str(tmp_path), ["1"], KIN_LUT, 200, 1) is None
+
+    # a lookup built with the edited kin_lut is a separate file, and holds the edited parameters
+    kin_lut["table"] = df_kin_lut
+    edited_lookup_path = soils.build_soil_parameter_lookup(soil_gdb, str(tmp_path), 200, 2)
+    assert edited_lookup_path != lookup_path and os.path.exists(lookup_path)
+    ksat = soils.lookup_soil_parameters(soil_gdb, str(tmp_path), ["1"], KIN_LUT, 200, 2).Ksat[0]
+    edited_ksat = soils.lookup_soil_parameters(soil_gdb, str(tmp_path), ["1"], df_kin_lut, 200, 2).Ksat[0]
+    assert edited_ksat != ksat
+
+
+CHANNEL_PARAMETERS = ["Ksat", "Manning", "Pave", "Imperviousness", "SMax", "CV", "G", "Porosity", "Rock", "Sand", 
+                      "Silt", "Clay", "Splash", "Cohesion", "Distribution"]
+
+
+def weight_channel_parameters_per_channel(channel_ids, df_hillslope_parameters):
+    """Reference: the area-weighted parameters of the hillslopes ChannelID-1, ChannelID-2 and ChannelID-3, computed
+    one channel at a time."""
+
+    df_channels = pd.DataFrame({"ChannelID": channel_ids})
+    for channel_id in df_channels.ChannelID:
+        hillslope_ids = [channel_id - 1, channel_id - 2, channel_id - 3]
+        df_hillslopes = df_hillslope_parameters[df_hillslope_parameters.HillslopeID.isin(hillslope_ids)]
+        for parameter in CHANNEL_PARAMETERS:
+            with np.errstate(invalid="ignore"):
+                df_channels.loc[df_channels.ChannelID == channel_id, parameter] = (
+                    (df_hillslopes[parameter] * df_hillslopes.Area).sum() / df_hillslopes.Area.sum())
+    df_channels[["Sand", "Clay", "Silt"]] = df_channels[["Sand", "Clay", "Silt"]].div(
+        df_channels[["Sand", "Clay", "Silt"]].sum(axis=1), axis=0).fillna(0)
+    return df_channels.assign(Woolhiser="Yes")
+
+
+@pytest.mark.parametrize("channel_type", ["Default", "Sand Bed"])
+def test_calculate_channel_parameters_matches_per_channel_weights(monkeypatch, channel_type):
+    # channel 14 has three hillslopes, 24 two, 34 none, and 44 only hillslopes without sand, silt and clay;
+    # hillslope 55 is not adjacent to a channel, and the channel of hillslope 61 is not in the discretization
+    hillslope_ids = [11, 12, 13, 22, 23, 42, 43, 55, 61]
+    rng = np.random.default_rng(2)
+    df_hillslope_parameters = pd.DataFrame(rng.uniform(0.1, 10, (len(hillslope_ids), len(CHANNEL_PARAMETERS))),
+                                           columns=CHANNEL_PARAMETERS)
+    df_hillslope_parameters.insert(0, "HillslopeID", hillslope_ids)
+    df_hillslope_parameters["Area"] = rng.uniform(100, 1000, len(hillslope_ids))
+    df_hillslope_parameters.loc[df_hillslope_parameters.HillslopeID.isin([42, 43]), ["Sand", "Silt", "Clay"]] = 0
+    channel_ids = [14, 24, 34, 44]
+    df_channel_types = pd.DataFrame({"Channel_Type": ["Default", "Sand Bed"], "Ksat": [-9999, 210.],
+                                     "Manning": [-9999, 0.035], "Pave": [-9999, 0.]})
+    monkeypatch.setattr(soils.arcpy.da, "TableToNumPyArray", 
+                        lambda table, fields: pd.DataFrame({"ChannelID": channel_ids}).to_records(index=False))
+    monkeypatch.setattr(soils.code_lookup_tables, "get_lookup_table_path", lambda agwa_directory, name: name)
+    monkeypatch.setattr(soils.code_lookup_tables, "read_lookup_table", 
+                        lambda path, null_value=None: df_channel_types.copy())
+
+    df_channel_parameters = soils.calculate_channel_parameters("project.gdb", "s1", df_hillslope_parameters, 
+                                                               channel_type, "agwa")
+
+    df_expected = weight_channel_parameters_per_channel(channel_ids, df_hillslope_parameters)
+    if channel_type == "Sand Bed":
+        df_expected = df_expected.assign(Ksat=210., Manning=0.035, Pave=0.)
+    pd.testing.assert_frame_equal(df_channel_parameters[df_expected.columns], df_expected, check_dtype=False)
+    assert df_channel_parameters.loc[2, "Sand"] == 0 and np.isnan(df_channel_parameters.loc[2, "G"])
+
+
+def test_parameterize_scenarios_computes_soils_once_and_saves_in_one_edit_session(monkeypatch):
+    names = ["prefire", "burned", "treated"]
+    events = []
+    df_intersections = pd.DataFrame({"HillslopeID": [11, 12], "MUKEY": ["1", "1"], "Shape_Area": [1., 2.]})
+    df_weighted = pd.DataFrame({"MapUnitMukey": ["1"], "Ksat": [5.]})
+    df_soil = pd.DataFrame({"HillslopeID": [11, 12], "Ksat": [5., 5.]})
+    monkeypatch.setattr(soils, "extract_parameters", lambda prjgdb, d, s, name: (
+        200, 2, f"{name}.tif", "mrlc2001_lut", "soils.shp", "gSSURGO.gdb", "agwa", "Default"))
+    monkeypatch.setattr(soils.arcpy, "Exists", lambda path: True)
+    monkeypatch.setattr(soils, "calculate_soil_parameters", lambda *args: events.append("soils") or (
+        df_intersections, df_weighted.copy(), df_weighted.copy(), df_weighted))
+    monkeypatch.setattr(soils, "weight_soil_parameters_by_area_fractions", lambda df_weighted, df_intersections: df_soil)
+    monkeypatch.setattr(soils.code_process_pool, "create_process_pool", 
+                        lambda number_of_tasks: concurrent.futures.ThreadPoolExecutor(2))
+    monkeypatch.setattr(soils, "weight_land_cover_in_scratch_workspace", lambda *args: pd.DataFrame(
+        {"HillslopeID": [11, 12], "Manning": [0.03, 0.05], "LandCover": [args[3]] * 2}))
+    monkeypatch.setattr(soils.arcpy.da, "TableToNumPyArray", lambda table, fields: pd.DataFrame(
+        [("d1", "s1", name, hillslope_id, 100.) for name in names for hillslope_id in [11, 12]], 
+        columns=fields).to_records(index=False))
+    monkeypatch.setattr(soils, "calculate_channel_parameters", lambda workspace, discretization, df, *args: 
+                        pd.DataFrame({"ChannelID": [14], "Manning": [df.Manning.mean()], "Woolhiser": ["Yes"]}))
+    monkeypatch.setattr(soils, "add_missing_fields", lambda *args, **kwargs: events.append("schema"))
+    monkeypatch.setattr(soils, "create_soil_results_table", lambda *args: events.append("schema"))
+    monkeypatch.setattr(soils.arcpy, "AddFieldDelimiters", lambda table, field: field)
+
+    class Editor:
+        def __init__(self, workspace):
+            assert workspace == "workspace.gdb"
+
+        def __enter__(self):
+            events.append("start editing")
+
+        def __exit__(self, *args):
+            events.append("stop editing")
+            return False
+
+    monkeypatch.setattr(soils.arcpy.da, "Editor", Editor)
+    writes = []
+    monkeypatch.setattr(soils, "write_dataframe_to_table", lambda table, df, where_clause, **kwargs: 
+                        events.append("write") or writes.append((os.path.basename(table), where_clause, df)))
+
+    soils.parameterize_scenarios("project.gdb", "workspace.gdb", "d1", "s1", names, True)
+
+    assert events.count("soils") == 1
+    # the schema is changed before the edit session, and every parameterization is written inside it
+    assert events.count("start editing") == 1
+    start, stop = events.index("start editing"), events.index("stop editing")
+    assert "write" not in events[:start] + events[stop:] and "schema" not in events[start:stop]
+    for name in names:
+        tables = [table for table, where_clause, _ in writes if f"ParameterizationName = '{name}'" in where_clause]
+        assert tables == ["parameters_soil_weighted_by_component", "parameters_soil_horizons", 
+                          "parameters_soil_weighted_by_horizon", "parameters_hillslopes", "parameters_channels"]
+        df_hillslopes = [df for table, where_clause, df in writes 
+                         if table == "parameters_hillslopes" and f"'{name}'" in where_clause][0]
+        assert df_hillslopes.LandCover.tolist() == [f"{name}.tif"] * 2 and df_hillslopes.Ksat.tolist() == [5., 5.]
+
+
+@pytest.mark.parametrize("number_of_hillslopes, workers, tile_size", [(10, 4, 3), (250, 8, 100), (3, 8, 100), 
+                                                                      (1000, 2, 7), (1, 1, 1)])
+def test_intersect_soil_with_hillslope_tiles_covers_each_hillslope_once(monkeypatch, number_of_hillslopes, workers,
+                                                                         tile_size):
+    rng = np.random.default_rng(number_of_hillslopes)
+    # AGWA hillslope IDs end in 1, 2 or 3, and the feature class is not sorted by ID
+    hillslope_ids = rng.permutation(np.arange(1, number_of_hillslopes + 1) // 3 * 10 + 
+                                    np.arange(1, number_of_hillslopes + 1) % 3 + 1).astype(np.int32)
+    monkeypatch.setattr(soils.arcpy.da, "TableToNumPyArray", lambda table, fields: pd.DataFrame(
+        {"HillslopeID": hillslope_ids}).to_records(index=False))
+    monkeypatch.setattr(config, "MAX_WORKER_PROCESSES", workers)
+    monkeypatch.setattr(config, "SOIL_INTERSECTION_TILE_SIZE", tile_size)
+    monkeypatch.setattr(soils.code_process_pool, "create_process_pool", 
+                        lambda number_of_tasks: concurrent.futures.ThreadPoolExecutor(2))
+    tiles = []
+
+    def intersect_soil_with_hillslope_tile(soil_layer, hillslope_feature_class, first_hillslope_id, 
+                                           last_hillslope_id, method):
+        tiles.append((first_hillslope_id, last_hillslope_id))
+        tile_ids = hillslope_ids[(hillslope_ids >= first_hillslope_id) & (hillslope_ids <= last_hillslope_id)]
+        return pd.DataFrame({"HillslopeID": tile_ids, "MUKEY": "1", "Shape_Area": 1.})
+
+    monkeypatch.setattr(soils, "intersect_soil_with_hillslope_tile", intersect_soil_with_hillslope_tile)
+
+    df_intersections = soils.intersect_soil_with_hillslope_tiles("soils", "hillslopes", "Polygon")
+
+    # the tile ranges do not overlap, so each hillslope is selected by exactly one tile
+    assert sorted(df_intersections.HillslopeID.tolist()) == sorted(hillslope_ids.tolist())
+    assert all(first <= last for first, last in tiles)
+    assert all(previous[1] < following[0] for previous, following in zip(sorted(tiles), sorted(tiles)[1:]))
+    assert len(tiles) >= min(workers, number_of_hillslopes)
+    assert len(tiles) >= math.ceil(number_of_hillslopes / tile_size)
@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+import code_write_k2_parameter_file as parfile
+import code_read_k2_parameter_file as reader
+from test_write_k2_parameter_file import make_parameter_tables
+
+
+def rounded(values, decimals=4):
+    """The values as they are read back from a file written with the given number of decimals."""
+    return np.array([float(f"{value:.{decimals}f}") for value in values])
+
+
+@pytest.fixture
+def par_file(tmp_path):
+    df_hillslopes, df_channels, df_contributing_channels = make_parameter_tables(15)
+    output_file = str(tmp_path / "watershed.par")
+    parfile.write_file(output_file, "4.0", "4.0", "d1", "s1", df_hillslopes, df_channels, df_contributing_channels,
+                       "p1")
+    return output_file, df_hillslopes.set_index("HillslopeID"), df_channels.set_index("ChannelID")
+
+
+def as_crlf(par_file):
+    with open(par_file, "rb") as f:
+        data = f.read()
+    with open(par_file, "wb") as f:
+        f.write(data.replace(b"\n", b"\r\n"))
+
+
+def test_read_parfile_returns_the_written_values(par_file):
+    output_file, df_hillslopes, df_channels = par_file
+    columns = reader.read_parfile(output_file)
+
+    planes = columns["PLANE"]
+    assert planes["ID"].dtype == np.int64 and planes["PRINT"].dtype == np.int64
+    assert sorted(planes["ID"]) == sorted(df_hillslopes.index)
+    p = df_hillslopes.loc[planes["ID"]]
+    for name, values in [("LEN", p.Length), ("WID", p.Width), ("MAN", p.Manning), ("CV", p.CV), ("Ks", p.Ksat),
+                         ("FR_1", p.Sand), ("FR_2", p.Silt), ("FR_3", p.Clay), ("SMAX", p.SMax),
+                         ("SLOPE", p.MeanSlope / 100.), ("CANOPY", p.Canopy / 100.)]:
+        assert planes[name].dtype == np.float64
+        np.testing.assert_array_equal(planes[name], rounded(values), err_msg=name)
+    np.testing.assert_array_equal(planes["PAVE"], rounded(p.Pave, 2))
+    # the centroids are written in full
+    np.testing.assert_array_equal(planes["X"], p.CentroidX.values)
+    assert list(planes["FILE"]) == [f"hillslopes\\hillslope_{hillslope_id}.sim" for hillslope_id in planes["ID"]]
+
+    channels = columns["CHANNEL"]
+    assert sorted(channels["ID"]) == sorted(df_channels.index)
+    c = df_channels.loc[channels["ID"]]
+    for name, values in [("LEN", c.ChannelLength), ("WIDTH_1", c.UpstreamBottomWidth),
+                         ("WIDTH_2", c.DownstreamBottomWidth), ("DEPTH_2", c.DownstreamBankfullDepth),
+                         ("SP", c.Splash), ("PAVE", c.Pave)]:
+        np.testing.assert_array_equal(channels[name], rounded(values), err_msg=name)
+    assert set(channels["WOOL"]) == {"Yes"} and set(channels["SAT"]) == {0.2}
+    # some channels have one lateral hillslope and others two, so LAT is text
+    assert channels["LAT"].dtype.kind == "U" and "122 123" in channels["LAT"] and "22" in channels["LAT"]
+    assert len(columns["POND"]["Start"]) == 0
+
+    # Start and End are the byte ranges of the blocks
+    with open(output_file, "rb") as f:
+        data = f.read()
+    for start, end in zip(planes["Start"], planes["End"]):
+        assert data[start:end].startswith(b"BEGIN PLANE\n") and data[start:end].endswith(b"END PLANE\n")
+
+
+def test_read_parfile_fills_missing_parameters(tmp_path):
+    output_file = tmp_path / "mixed.par"
+    output_file.write_bytes(b"BEGIN GLOBAL\n  NELE = 3\nEND GLOBAL\n\n"
+                            b"begin plane\n  ID = 1, LEN = 10, FR = 0.1, 0.2 ! FR = 9\n  NAME = a\nEND PLANE\n"
+                            b"BEGIN PLANE\n  ID = 2, LEN = 12.5\n  MAN = 0.05\nEND\n"
+                            b"BEGIN PLANE\n  ID = 3, LEN = 11, FR = 0.3, 0.4, 0.5\n  extra, LEN = 13\nEND PLANE\n")
+
+    planes = reader.read_parfile(str(output_file))["PLANE"]
+
+    assert list(planes) == ["ID", "LEN", "FR_1", "FR_2", "FR_3", "NAME", "MAN", "Start", "End"]
+    np.testing.assert_array_equal(planes["ID"], [1, 2, 3])
+    np.testing.assert_array_equal(planes["LEN"], [10, 12.5, 13])
+    np.testing.assert_array_equal(planes["FR_2"], [0.2, np.nan, 0.4])
+    np.testing.assert_array_equal(planes["FR_3"], [np.nan, np.nan, 0.5])
+    np.testing.assert_array_equal(planes["MAN"], [np.nan, 0.05, np.nan])
+    assert list(planes["NAME"]) == ["a", "", ""]
+    assert planes["Start"][0] == len(b"BEGIN GLOBAL\n  NELE = 3\nEND GLOBAL\n\n")
+
+
+def test_read_parfile_without_end_line(tmp_path):
+    output_file = tmp_path / "truncated.par"
+    output_file.write_bytes(b"BEGIN PLANE\n  ID = 1\nEND PLANE\nBEGIN CHANNEL\n  ID = 4\n")
+
+    with pytest.raises(ValueError, match="CHANNEL block"):
+        reader.read_parfile(str(output_file))
+
+
+@pytest.mark.parametrize("crlf", [False, True])
+def test_patch_parfile_changes_one_block_and_restores_it(tmp_path, par_file, crlf):
+    output_file = par_file[0]
+    if crlf:
+        as_crlf(output_file)
+    with open(output_file, "rb") as f:
+        original = f.read()
+    blocks = reader.read_blocks(output_file)
+    key = ("PLANE", 72)
+    patched_file = str(tmp_path / "patched.par")
+
+    new_block = reader.update_block(blocks[key], {"LEN": 1.5, "FR": [0.1, 0.2, 0.3]})
+    reader.patch_parfile(output_file, {key: new_block}, output_file=patched_file)
+
+    assert reader.diff_parfiles(output_file, patched_file) == {"changed": [key], "added": [], "removed": []}
+    patched_blocks = reader.read_blocks(patched_file)
+    assert {k: block for k, block in patched_blocks.items() if k != key} == \
+           {k: block for k, block in blocks.items() if k != key}
+    planes = reader.read_parfile(patched_file)["PLANE"]
+    row = list(planes["ID"]).index(72)
+    assert (planes["LEN"][row], planes["FR_1"][row], planes["FR_3"][row]) == (1.5, 0.1, 0.3)
+    # the rest of the file is copied as it was, with its line endings
+    start = original.index(blocks[key].encode("latin-1"))
+    end = start + len(blocks[key])
+    with open(patched_file, "rb") as f:
+        patched = f.read()
+    assert patched.startswith(original[:start]) and patched.endswith(original[end:])
+    assert patched.count(b"\n") == original.count(b"\n")
+    assert patched.count(b"\r\n") == (original.count(b"\n") if crlf else 0)
+
+    # putting the block back gives the original file
+    reader.patch_parfile(patched_file, {key: blocks[key]})
+    with open(patched_file, "rb") as f:
+        assert f.read() == original
+    assert reader.diff_parfiles(output_file, patched_file) == {"changed": [], "added": [], "removed": []}
+
+
+def test_update_block_with_missing_parameter(par_file):
+    blocks = reader.read_blocks(par_file[0])
+
+    with pytest.raises(ValueError, match="not found"):
+        reader.update_block(blocks[("PLANE", 72)], {"SAT": 0.5})
+    with pytest.raises(ValueError, match="fewer than 4 values"):
+        reader.update_block(blocks[("PLANE", 72)], {"FR": [0.1, 0.2, 0.3, 0.4]})
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import pytest
+import code_write_k2_parameter_file as parfile
+
+HILLSLOPE_FIELDS = ["Length", "Width", "MeanSlope", "Manning", "CentroidX", "CentroidY", "CV", "Ksat", "G",
+                    "Distribution", "Porosity", "Rock", "Sand", "Silt", "Clay", "Splash", "Cohesion", "SMax",
+                    "Interception", "Canopy", "Pave", "Area"]
+CHANNEL_FIELDS = ["ChannelLength", "MeanSlope", "CentroidX", "CentroidY", "UpstreamBottomWidth",
+                  "DownstreamBottomWidth", "UpstreamBankfullDepth", "DownstreamBankfullDepth", "Manning",
+                  "SideSlope1", "SideSlope2", "CV", "Ksat", "G", "Distribution", "Porosity", "Rock", "Sand", "Silt",
+                  "Clay", "Splash", "Cohesion", "Pave"]
+
+
+def write_file_reference(output_file, delineation, discretization, df_hillslopes, df_channels,
+                         df_contributing_channels, parameterization):
+    """Reference writer: the element blocks formatted one value at a time, with the elements looked up in the tables
+    for each channel, as the parameter files were first written."""
+
+    with open(output_file, "w") as f:
+        f.write(f"! File Info\n"
+                f"!  AGWA Version:                           4.0\n"
+                f"!  AGWA Parameterization Equation Version: 4.0\n"
+                f"!  Simulation Creation Date:               \n"
+                f"!  Delineation:                            {delineation}\n"
+                f"!  Discretization:                         {discretization}\n"
+                f"!  Parameterization                        {parameterization}\n"
+                f"!  Total Watershed Area:                   {df_hillslopes.Area.sum():.4f} square meters\n"
+                f"!  Number of Hillslopes:                       {len(df_hillslopes)}\n"
+                f"!  Number of Channels:                     {len(df_channels)}\n"
+                f"! End of File Info\n\n")
+        f.write("BEGIN GLOBAL\n"
+                "   CLEN = 10, UNITS = METRIC\n"
+                "   DIAMS = 0.25, 0.033, 0.004 ! mm\n"
+                "   DENSITY = 2.65, 2.65, 2.65 ! g/cc\n"
+                "   TEMP = 33                  ! deg C\n"
+                f"   NELE = {len(df_hillslopes) + len(df_channels)}\n"
+                "END GLOBAL\n\n")
+
+        hillslope_ids = df_hillslopes.HillslopeID.values
+        for sequence in range(1, len(df_channels) + 1):
+            channel_id = int(df_channels.loc[df_channels.Sequence == sequence, "ChannelID"].values[0])
+            if channel_id - 2 in hillslope_ids and channel_id - 1 in hillslope_ids:
+                lat_id = [channel_id - 2, channel_id - 1]
+            if channel_id - 1 in hillslope_ids and channel_id - 2 not in hillslope_ids:
+                lat_id = [channel_id - 1]
+            if channel_id - 2 in hillslope_ids and channel_id - 1 not in hillslope_ids:
+                lat_id = [channel_id - 2]
+            up_hillslope = [channel_id - 3]
+            if channel_id - 3 in hillslope_ids:
+                up_hillslopes = up_hillslope + lat_id
+                up_id = [up_hillslope]
+            else:
+                up_hillslopes = lat_id
+                up_id = df_contributing_channels.loc[
+                    df_contributing_channels.ChannelID == f"{channel_id}", "ContributingChannel"].values
+
+            for hillslope_id in up_hillslopes:
+                p = df_hillslopes[df_hillslopes.HillslopeID == hillslope_id].squeeze()
+                f.write("BEGIN PLANE\n"
+                        f"  ID = {hillslope_id}, PRINT = 3, FILE = hillslopes\\hillslope_{hillslope_id}.sim\n"
+                        f"  LEN = {p.Length:.4f}, WID = {p.Width:.4f}\n"
+                        f"  SLOPE = {p.MeanSlope / 100.:.4f}\n"
+                        f"  MAN = {p.Manning:.4f}, X = {p.CentroidX}, Y = {p.CentroidY}\n"
+                        f"  CV = {p.CV:.4f}\n"
+                        f"  Ks = {p.Ksat:.4f}, G = {p.G:.4f}, DIST = {p.Distribution:.4f}, POR = {p.Porosity:.4f}"
+                        f", ROCK = {p.Rock:.4f}\n"
+                        f"  FR = {p.Sand:.4f}, {p.Silt:.4f}, {p.Clay:.4f}, SPLASH = {p.Splash:.4f}"
+                        f", COH = {p.Cohesion:.4f}, SMAX = {p.SMax:.4f}\n"
+                        f"  INTER = {p.Interception:.4f}, CANOPY = {p.Canopy / 100.:.4f}, PAVE = {p.Pave:.2f}\n"
+                        "END PLANE\n\n")
+
+            c = df_channels[df_channels.ChannelID == channel_id].squeeze()
+            f.write(f"BEGIN CHANNEL\n"
+                    f"  ID = {channel_id}, PRINT = 3, FILE = channels\\chan_{channel_id}.sim\n"
+                    f"  LAT =  {' '.join(map(str, lat_id))}\n"
+                    f"  UP =  {' '.join(map(str, up_id))}\n"
+                    f"  LEN = {c.ChannelLength:.4f}, SLOPE = {c.MeanSlope:.4f}, X = {c.CentroidX:.4f}, "
+                    f"Y = {c.CentroidY:.4f}\n"
+                    f"  WIDTH = {c.UpstreamBottomWidth:.4f}, {c.DownstreamBottomWidth:.4f}, "
+                    f"DEPTH = {c.UpstreamBankfullDepth:.4f}, {c.DownstreamBankfullDepth:.4f}\n"
+                    f"  MAN = {c.Manning:.4f}, SS1 = {c.SideSlope1:.4f}, SS2 = {c.SideSlope2:.4f}\n"
+                    f"  WOOL = {c.Woolhiser}\n"
+                    f"  CV = {c.CV:.4f}, Ks = {c.Ksat:.4f}, G = {c.G:.4f}\n"
+                    f"  DIST = {c.Distribution:.4f}, POR = {c.Porosity:.4f}, ROCK = {c.Rock:.4f}\n"
+                    f"  FR = {c.Sand:.4f}, {c.Silt:.4f}, {c.Clay:.4f}, SP = {c.Splash:.4f}, COH = {c.Cohesion:.4f}\n"
+                    f"  PAVE = {c.Pave:.4f}\n"
+                    f"  SAT = {0.2:.4f}\n"
+                    "END CHANNEL\n\n")
+
+
+def make_parameter_tables(number_of_channels, seed=0):
+    """A binary tree of channels k * 10 + 4 with lateral hillslopes k * 10 + 2 and k * 10 + 3, and upland
+    hillslopes k * 10 + 1 on first-order channels. One lateral hillslope is missing, and some values are negative,
+    null (-9999), or halfway between two results at 4 decimals."""
+
+    rng = np.random.default_rng(seed)
+    channel_numbers = np.arange(1, number_of_channels + 1)
+    first_order = channel_numbers > number_of_channels // 2
+    hillslope_ids = np.sort(np.concatenate([channel_numbers * 10 + 2, channel_numbers * 10 + 3,
+                                            channel_numbers[first_order] * 10 + 1]))
+    hillslope_ids = hillslope_ids[hillslope_ids != 23]
+    df_hillslopes = pd.DataFrame(rng.uniform(-10, 1e5, (len(hillslope_ids), len(HILLSLOPE_FIELDS))),
+                                 columns=HILLSLOPE_FIELDS)
+    df_hillslopes.iloc[::7, 3] = -9999.
+    df_hillslopes.iloc[1::5, 7] = 0.00005
+    df_hillslopes.iloc[2::5, 8] = -0.00001
+    df_hillslopes.insert(0, "HillslopeID", hillslope_ids)
+    df_channels = pd.DataFrame(rng.uniform(-10, 1e5, (number_of_channels, len(CHANNEL_FIELDS))),
+                               columns=CHANNEL_FIELDS)
+    df_channels.iloc[::3, 5] = -9999.
+    df_channels.insert(0, "ChannelID", channel_numbers * 10 + 4)
+    df_channels.insert(1, "Sequence", number_of_channels + 1 - channel_numbers)
+    df_channels["Woolhiser"] = "Yes"
+    parents = channel_numbers[1:] // 2
+    df_contributing_channels = pd.DataFrame({"ChannelID": (parents * 10 + 4).astype(str),
+                                             "ContributingChannel": channel_numbers[1:] * 10 + 4})
+    # the tables are read in no particular order
+    return (df_hillslopes.sample(frac=1, random_state=1), df_channels.sample(frac=1, random_state=2),
+            df_contributing_channels)
+
+
+@pytest.mark.parametrize("number_of_channels", [1, 2, 15, 200])
+def test_write_file_matches_reference_writer(tmp_path, number_of_channels):
+    df_hillslopes, df_channels, df_contributing_channels = make_parameter_tables(number_of_channels)
+    output_file = str(tmp_path / "parameter_files" / "watershed.par")
+    reference_file = str(tmp_path / "reference.par")
+
+    parfile.write_file(output_file, "4.0", "4.0", "d1", "s1", df_hillslopes, df_channels, df_contributing_channels,
+                       "p1")
+    write_file_reference(reference_file, "d1", "s1", df_hillslopes, df_channels, df_contributing_channels, "p1")
+
+    # the files are byte-identical, apart from the creation date
+    with open(output_file, "rb") as f:
+        lines = f.read().split(b"\n")
+    with open(reference_file, "rb") as f:
+        reference_lines = f.read().split(b"\n")
+    assert lines[3].startswith(b"!  Simulation Creation Date:")
+    assert lines[:3] + lines[4:] == reference_lines[:3] + reference_lines[4:]
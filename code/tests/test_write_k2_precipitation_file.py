@@ -0,0 +1,354 @@
+import os
+import types
+import numpy as np
+import pandas as pd
+import pytest
+import code_write_k2_precipitation_file as precipitation
+
+
+def test_process_writes_gridded_rainfall(tmp_path, monkeypatch):
+    workspace = str(tmp_path / "delineation.gdb")
+    rainfall_workspace = str(tmp_path / "mrms")
+    arcpy = precipitation.arcpy
+    monkeypatch.setattr(arcpy, "Exists", lambda path: True)
+    monkeypatch.setattr(arcpy.da, "TableToNumPyArray",
+                        lambda table, fields: pd.DataFrame({"AGWADirectory": ["agwa"]}).to_records(index=False))
+    # the row written by initialize_workspace for a gridded rainfall storm
+    row = ("d1", "s1", "july_storm", "Gridded Rainfall", None, None, None, None, None, "2", "true", None,
+           rainfall_workspace, "0.2", "2024-07-01T00:00:00", "4.0", "4.0")
+
+    class SearchCursor:
+        def __init__(self, table, fields):
+            assert fields == precipitation.META_PRECIPITATION_FIELDS
+
+        def __enter__(self):
+            return iter([row])
+
+        def __exit__(self, *args):
+            return False
+
+    monkeypatch.setattr(arcpy.da, "SearchCursor", SearchCursor)
+    # frames named by time stamp are used in name order
+    monkeypatch.setattr(arcpy, "ListRasters", lambda: ["MRMS_20240701-0004", "MRMS_20240701-0000",
+                                                       "MRMS_20240701-0002"])
+    calls = []
+    monkeypatch.setattr(precipitation, "write_file_with_gridded_rainfall", lambda *args: calls.append(args))
+
+    precipitation.process(str(tmp_path / "project.gdb"), workspace, "d1", "s1", "july_storm")
+
+    output_filename = os.path.join(str(tmp_path), "modeling_files", "s1", "precipitation_files", "july_storm.pre")
+    rainfall_rasters = [os.path.join(rainfall_workspace, name)
+                        for name in ["MRMS_20240701-0000", "MRMS_20240701-0002", "MRMS_20240701-0004"]]
+    assert calls == [(workspace, "s1", rainfall_rasters, 2, 0.2, output_filename)]
+
+
+def test_write_design_storm_library(tmp_path, monkeypatch):
+    arcpy = precipitation.arcpy
+    workspace = str(tmp_path / "delineation.gdb")
+    monkeypatch.setattr(arcpy, "Exists", lambda path: True)
+    monkeypatch.setattr(arcpy, "AddFieldDelimiters", lambda table, field: f"[{field}]")
+    monkeypatch.setattr(arcpy.da, "TableToNumPyArray",
+                        lambda table, fields: pd.DataFrame({"AGWADirectory": ["agwa"]}).to_records(index=False))
+    monkeypatch.setattr(precipitation.config, "NOAA_CACHE", False)
+    monkeypatch.setattr(precipitation, "get_watershed_centroid", lambda workspace, delineation: (32.0, -110.0))
+    # depths of duration i and recurrence j are (i + 1) * (j + 1), and 1.5 times that for the upper quantile
+    depths = [[(i + 1) * (j + 1) for j in range(len(precipitation.NOAA_RECURRENCES))]
+              for i in range(len(precipitation.NOAA_DURATIONS))]
+    noaa_requests = []
+    monkeypatch.setattr(precipitation, "fetch_noaa_table", lambda latitude, longitude, cache_directory: (
+        noaa_requests.append((latitude, longitude)) or
+        {"quantiles": depths, "upper": [[depth * 1.5 for depth in row] for row in depths], "lower": depths}))
+    # a uniform hyetograph shape, so the cumulative depths grow linearly
+    times = np.round(np.arange(0, 24.05, 0.1), 1)
+    monkeypatch.setattr(precipitation, "read_distributions",
+                        lambda table, shapes: {shape: (times, times / 24) for shape in shapes})
+    existing_rows = [["60min_2yr_Mean_Uniform"], ["older_storm"], ["2hr_100yr_Upper90_Uniform"]]
+    cursors = {"deleted": [], "inserted": []}
+
+    class UpdateCursor:
+        def __init__(self, table, fields, where_clause):
+            cursors["where_clause"] = where_clause
+            self.rows = existing_rows
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def __iter__(self):
+            for row in self.rows:
+                self.row = row
+                yield row
+
+        def deleteRow(self):
+            cursors["deleted"].append(self.row[0])
+
+    class InsertCursor:
+        def __init__(self, table, fields):
+            assert fields == precipitation.META_PRECIPITATION_FIELDS
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def insertRow(self, row):
+            cursors["inserted"].append(row)
+
+    monkeypatch.setattr(arcpy.da, "UpdateCursor", UpdateCursor)
+    monkeypatch.setattr(arcpy.da, "InsertCursor", InsertCursor)
+
+    names = precipitation.write_design_storm_library(
+        str(tmp_path / "project.gdb"), workspace, "d'1", "s1", durations=["60min", "2hr"], recurrences=[2, 100],
+        quantiles=["Mean", "Upper 90%"], hyetograph_shapes=["Uniform"], time_step=5)
+
+    assert names == ["60min_2yr_Mean_Uniform", "60min_2yr_Upper90_Uniform", "60min_100yr_Mean_Uniform",
+                     "60min_100yr_Upper90_Uniform", "2hr_2yr_Mean_Uniform", "2hr_2yr_Upper90_Uniform",
+                     "2hr_100yr_Mean_Uniform", "2hr_100yr_Upper90_Uniform"]
+    # the depth table is fetched once for all the files
+    assert noaa_requests == [(32.0, -110.0)]
+    output_directory = tmp_path / "modeling_files" / "s1" / "precipitation_files"
+    assert sorted(os.listdir(output_directory)) == sorted(name + ".pre" for name in names)
+    # 2hr is the sixth duration and 100yr the seventh recurrence
+    lines = (output_directory / "2hr_100yr_Upper90_Uniform.pre").read_text().splitlines()
+    assert "! Storm depth 63.0mm." in lines and "  N = 25" in lines
+    assert lines[-2].split() == ["120.00", "63.00"] and lines[-1] == "END"
+    lines = (output_directory / "60min_2yr_Mean_Uniform.pre").read_text().splitlines()
+    assert lines[-8].split() == ["30.00", "5.00"] and lines[-2].split() == ["60.00", "10.00"]
+
+    # the names are quoted in the where clause, and only the rows of the rewritten files are replaced
+    assert cursors["where_clause"] == "[DelineationName] = 'd''1' AND [DiscretizationName] = 's1'"
+    assert cursors["deleted"] == ["60min_2yr_Mean_Uniform", "2hr_100yr_Upper90_Uniform"]
+    assert [row[2] for row in cursors["inserted"]] == names
+    assert cursors["inserted"][1][:12] == ("d'1", "s1", "60min_2yr_Upper90_Uniform", "NOAA Atlas 14", None, None,
+                                           "60min", "2", "Upper 90%", "5", "false", "Uniform")
+
+
+# hillslope labels of a 4 x 5 rainfall grid, 0 outside the hillslopes. Hillslope 4 is smaller than a cell and takes
+# the cell at its centroid.
+RAINFALL_GRID_LABELS = np.array([[1, 1, 2, 2, 0],
+                                 [1, 1, 2, 2, 0],
+                                 [3, 3, 3, 0, 0],
+                                 [3, 3, 3, 0, 0]])
+HILLSLOPE_CENTROIDS = {3: (1.5, 1.0), 1: (0.9, 3.1), 4: (4.5, 0.5), 2: (2.9, 3.0)}
+
+
+def mock_rainfall_grids(monkeypatch, frames, nodata):
+    """Replace the arcpy functions used to rasterize the hillslopes and read the rainfall grids, for grids of one
+    unit cells with their lower left corner at 0, 0."""
+
+    arcpy = precipitation.arcpy
+    label_raster = os.path.join("workspace.gdb", "s1_hillslopes_rainfall_grid")
+    extent = types.SimpleNamespace(XMin=0., YMin=0., XMax=5., YMax=4.)
+    raster = types.SimpleNamespace(extent=extent, width=5, height=4, meanCellWidth=1., meanCellHeight=1.,
+                                   noDataValue=nodata, spatialReference="grid")
+
+    class SearchCursor:
+        def __init__(self, feature_class, fields, where_clause=None, spatial_reference=None):
+            ids = HILLSLOPE_CENTROIDS
+            if where_clause:
+                ids = [int(value) for value in where_clause.split("(")[1].rstrip(")").split(",")]
+            self.rows = [(hillslope_id, HILLSLOPE_CENTROIDS[hillslope_id]) for hillslope_id in ids]
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def __iter__(self):
+            return iter(self.rows)
+
+    def raster_to_numpy_array(path, lower_left=None, columns=None, rows=None):
+        if path == label_raster:
+            return RAINFALL_GRID_LABELS.copy()
+        assert (lower_left, columns, rows) == ((0., 0.), 5, 4)
+        return frames[path].copy()
+
+    monkeypatch.setattr(arcpy, "Exists", lambda path: False)
+    monkeypatch.setattr(arcpy, "Describe", lambda path: raster)
+    monkeypatch.setattr(arcpy, "Raster", lambda path: raster)
+    monkeypatch.setattr(arcpy, "Point", lambda x, y: (x, y))
+    monkeypatch.setattr(arcpy, "RasterToNumPyArray", raster_to_numpy_array)
+    monkeypatch.setattr(arcpy.da, "SearchCursor", SearchCursor)
+
+
+def read_gauges(precipitation_file):
+    """Return the X, Y, and (time, cumulative depth) rows of each gauge of a precipitation file, keyed by ID."""
+
+    gauges = {}
+    gauge = None
+    with open(precipitation_file) as f:
+        for line in f:
+            if line.startswith("BEGIN RG"):
+                x, y = [float(value.split("=")[1]) for value in next(f).split(",")]
+                gauge = (int(line[8:]), x, y, [])
+            elif line.startswith("END"):
+                gauges[gauge[0]] = (gauge[1], gauge[2], np.array(gauge[3]))
+                gauge = None
+            elif gauge and line.split() and line.split()[0][0].isdigit():
+                gauge[3].append([float(value) for value in line.split()])
+    return gauges
+
+
+@pytest.mark.parametrize("block_frames", [1, 2, 5])
+def test_write_file_with_gridded_rainfall(tmp_path, monkeypatch, block_frames):
+    rng = np.random.default_rng(0)
+    nodata = -9999.
+    frames = {f"MRMS_{frame}": rng.uniform(0, 10, (4, 5)).round(3) for frame in range(5)}
+    # missing cells are left out of the means, and a hillslope without rainfall cells in a frame gets no rainfall
+    frames["MRMS_1"][0, 0] = nodata
+    frames["MRMS_3"][:2, 2:4] = nodata
+    frames["MRMS_4"][3, 4] = nodata
+    mock_rainfall_grids(monkeypatch, frames, nodata)
+    output_filename = str(tmp_path / "gridded.pre")
+
+    precipitation.write_file_with_gridded_rainfall("workspace.gdb", "s1", list(frames), 2, 0.2, output_filename,
+                                                   block_frames=block_frames)
+
+    # reference: the mean of the cells of each hillslope, one hillslope and frame at a time
+    cells = {hillslope_id: RAINFALL_GRID_LABELS == hillslope_id for hillslope_id in [1, 2, 3]}
+    cells[4] = np.zeros((4, 5), dtype=bool)
+    cells[4][3, 4] = True
+    gauges = read_gauges(output_filename)
+    assert list(gauges) == [1, 2, 3, 4]
+    for hillslope_id, (x, y, rows) in gauges.items():
+        assert (x, y) == HILLSLOPE_CENTROIDS[hillslope_id]
+        depths = []
+        for values in frames.values():
+            values = values[cells[hillslope_id]]
+            values = values[values != nodata]
+            depths.append(values.mean() if len(values) else 0.)
+        np.testing.assert_array_equal(rows[:, 0], np.arange(6) * 2)
+        # the depths are written with 2 decimals
+        np.testing.assert_allclose(rows[:, 1], np.cumsum([0.] + depths), atol=0.0051)
+    assert gauges[2][2][4, 1] == gauges[2][2][3, 1]
+    assert gauges[4][2][5, 1] == gauges[4][2][4, 1]
+
+
+def write_rainfall_csv(path, times, depths):
+    with open(path, "w") as f:
+        f.write("Gauge 1\nCumulative rainfall\nTime (min),Depth (mm)\n")
+        f.writelines(f"{time},{depth}\n" for time, depth in zip(times, depths))
+
+
+def test_validate_user_rainfall():
+    chunk = pd.DataFrame({"time": [10, 20, 30], "depth": [1, 1, 2.5]})
+
+    times, depths = precipitation.validate_user_rainfall(chunk, 0, -np.inf, -np.inf)
+
+    assert times.dtype == depths.dtype == np.float64
+    np.testing.assert_array_equal(times, [10, 20, 30])
+    np.testing.assert_array_equal(depths, [1, 1, 2.5])
+
+
+@pytest.mark.parametrize("times, depths, first_row, previous_time, previous_depth, bad_row", [
+    ([10, 20, 30], [1, 0.5, 2], 0, -np.inf, -np.inf, 2),     # decreasing depth
+    ([10, 20, 20], [1, 2, 3], 0, -np.inf, -np.inf, 3),       # repeated time
+    ([10, 5, 30], [1, 2, 3], 0, -np.inf, -np.inf, 2),        # decreasing time
+    ([10, 20, np.nan], [1, 2, 3], 0, -np.inf, -np.inf, 3),   # missing time
+    ([10, 20, 30], [1, 2, 3], 100, 10, 0, 101),              # the first time is not after the previous chunk
+    ([10, 20, 30], [1, 2, 3], 100, 5, 1.5, 101),             # the first depth is below the previous chunk
+])
+def test_validate_user_rainfall_rejects(times, depths, first_row, previous_time, previous_depth, bad_row):
+    chunk = pd.DataFrame({"time": times, "depth": depths})
+
+    with pytest.raises(Exception, match=f"Data row {bad_row} "):
+        precipitation.validate_user_rainfall(chunk, first_row, previous_time, previous_depth)
+
+
+def test_validate_user_rainfall_rejects_text_and_missing_columns():
+    with pytest.raises(Exception, match="not numbers between data rows 11 and 12"):
+        precipitation.validate_user_rainfall(pd.DataFrame({"time": [1, 2], "depth": ["1", "a"]}), 10,
+                                             -np.inf, -np.inf)
+    with pytest.raises(Exception, match="time \\(min\\) and a depth \\(mm\\) column"):
+        precipitation.validate_user_rainfall(pd.DataFrame({"time": [1, 2]}), 0, -np.inf, -np.inf)
+
+
+def assert_within_tolerance(times, depths, keep, tolerance):
+    """Every removed time step is within tolerance of the line between the kept time steps around it."""
+    assert keep[0] and keep[-1]
+    interpolated = np.interp(times, times[keep], depths[keep])
+    assert np.all(np.abs(depths - interpolated) <= tolerance + 1e-12)
+
+
+def test_thin_breakpoints_with_zero_tolerance():
+    # only the time steps on the line between their neighbors are removed
+    times = np.array([0., 5., 10., 15., 20., 30., 40.])
+    depths = np.array([0., 1., 2., 3., 5., 5., 5.])
+
+    keep = precipitation.thin_breakpoints(times, depths, 0)
+
+    np.testing.assert_array_equal(keep, [True, False, False, True, True, False, True])
+    assert precipitation.thin_breakpoints(times[:2], depths[:2], 0).tolist() == [True, True]
+
+
+@pytest.mark.parametrize("tolerance", [0.01, 0.1, 1.0])
+def test_thin_breakpoints_with_tolerance(tolerance):
+    rng = np.random.default_rng(1)
+    times = np.cumsum(rng.uniform(0.5, 2, 2000))
+    depths = np.cumsum(rng.exponential(0.05, 2000) * (rng.random(2000) < 0.3))
+
+    keep = precipitation.thin_breakpoints(times, depths, tolerance)
+
+    assert keep.sum() < len(times)
+    assert_within_tolerance(times, depths, keep, tolerance)
+
+
+def test_thin_breakpoints_restores_slow_curves():
+    # each time step is close to the line between its neighbors, but not to the line between the ends
+    times = np.arange(50.)
+    depths = (times / 10) ** 2
+
+    keep = precipitation.thin_breakpoints(times, depths, 0.05)
+
+    assert 2 < keep.sum() < len(times)
+    assert_within_tolerance(times, depths, keep, 0.05)
+
+
+@pytest.mark.parametrize("tolerance", [0, 0.05])
+def test_write_file_with_user_rainfall_file_in_chunks(tmp_path, monkeypatch, tolerance):
+    rng = np.random.default_rng(2)
+    times = np.arange(1, 24) * 5.
+    depths = np.cumsum(rng.uniform(0, 0.2, 23)).round(4)
+    csvfile = str(tmp_path / "gauge.csv")
+    write_rainfall_csv(csvfile, times, depths)
+    outputs = {}
+    for chunk_rows in [4, 100]:
+        monkeypatch.setattr(precipitation.config, "USER_RAINFALL_CHUNK_ROWS", chunk_rows)
+        output_filename = str(tmp_path / f"gauge_{chunk_rows}.pre")
+        precipitation.write_file_with_user_rainfall_file(csvfile, "s1", 0.2, output_filename, tolerance)
+        with open(output_filename) as f:
+            outputs[chunk_rows] = f.read()
+    assert sorted(os.listdir(tmp_path)) == ["gauge.csv", "gauge_100.pre", "gauge_4.pre"]
+
+    lines = outputs[4].splitlines()
+    rows = np.array([line.split() for line in lines[lines.index("  ! (min)    (mm)") + 1:-1]], dtype=np.float64)
+    assert f"  N = {len(rows)}" in lines
+    keep = np.isin(times, rows[:, 0])
+    np.testing.assert_array_equal(rows[:, 1], depths[keep])
+    if tolerance == 0:
+        assert outputs[4] == outputs[100] and keep.all()
+    else:
+        # the chunks are thinned one at a time, so the first and last time steps of each chunk are kept
+        assert keep[::4].all() and keep[3::4].all() and keep[-1]
+        assert_within_tolerance(times, depths, keep, tolerance)
+
+
+def test_write_file_with_user_rainfall_file_removes_temporary_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(precipitation.config, "USER_RAINFALL_CHUNK_ROWS", 4)
+    csvfile = str(tmp_path / "gauge.csv")
+    # the depth decreases at the first row of the second chunk
+    write_rainfall_csv(csvfile, [5, 10, 15, 20, 25, 30], [0, 1, 2, 3, 2.5, 4])
+    output_filename = str(tmp_path / "gauge.pre")
+
+    with pytest.raises(Exception, match="Data row 5 "):
+        precipitation.write_file_with_user_rainfall_file(csvfile, "s1", 0.2, output_filename, 0)
+    assert os.listdir(tmp_path) == ["gauge.csv"]
+
+    write_rainfall_csv(csvfile, [], [])
+    with pytest.raises(Exception, match="has no rainfall data"):
+        precipitation.write_file_with_user_rainfall_file(csvfile, "s1", 0.2, output_filename, 0)
+    assert os.listdir(tmp_path) == ["gauge.csv"]
@@ -0,0 +1,251 @@
+import os
+import stat
+import numpy as np
+import pytest
+import code_hydrograph_store
+import code_write_k2_simulation
+
+
+def is_read_only(path):
+    return not os.stat(path).st_mode & stat.S_IWRITE
+
+
+@pytest.fixture
+def simulation_directories(tmp_path):
+    """Two simulation directories that stage the same parameter file into the shared store."""
+
+    input_file = tmp_path / "inputs" / "watershed.par"
+    input_file.parent.mkdir()
+    input_file.write_text("BEGIN GLOBAL\nEND GLOBAL\n")
+    simulations_directory = tmp_path / "modeling_files" / "discretization" / "simulations"
+    directories = []
+    for simulation_name in ["storm_1", "storm_2"]:
+        simulation_directory = simulations_directory / simulation_name
+        simulation_directory.mkdir(parents=True)
+        store_directory = code_write_k2_simulation.get_staging_store_directory(str(simulation_directory))
+        code_write_k2_simulation.stage_file(str(input_file), str(simulation_directory), store_directory)
+        directories.append(str(simulation_directory))
+    return directories
+
+
+def test_stage_file_links_one_read_only_copy(simulation_directories):
+    store_directory = code_write_k2_simulation.get_staging_store_directory(simulation_directories[0])
+    stored_files = os.listdir(store_directory)
+
+    assert len(stored_files) == 1
+    stored_file = os.path.join(store_directory, stored_files[0])
+    assert is_read_only(stored_file)
+    assert os.stat(stored_file).st_nlink == 3
+
+
+def test_remove_file_keeps_shared_copy_read_only(simulation_directories):
+    staged_file = os.path.join(simulation_directories[0], "watershed.par")
+    other_file = os.path.join(simulation_directories[1], "watershed.par")
+
+    assert code_write_k2_simulation.remove_file(staged_file) is False
+    assert not os.path.exists(staged_file)
+    assert is_read_only(other_file)
+
+
+def test_delete_simulation_directories_keeps_store_read_only(simulation_directories):
+    store_directory = code_write_k2_simulation.get_staging_store_directory(simulation_directories[0])
+    stored_file = os.path.join(store_directory, os.listdir(store_directory)[0])
+
+    code_write_k2_simulation.delete_simulation_directories(simulation_directories[0])
+
+    assert not os.path.exists(simulation_directories[0])
+    assert is_read_only(stored_file)
+    assert is_read_only(os.path.join(simulation_directories[1], "watershed.par"))
+
+    code_write_k2_simulation.delete_simulation_directories(simulation_directories[1])
+
+    assert os.listdir(store_directory) == []
+
+
+def test_clean_staging_store_keeps_symlinked_files(tmp_path, monkeypatch):
+    # where hardlinks cannot be created, the staged files are symbolic links to the store, which the simulations of
+    # all discretizations share
+    def link(source, destination):
+        raise OSError("hardlinks are not supported")
+
+    monkeypatch.setattr(code_write_k2_simulation.os, "link", link)
+    input_file = tmp_path / "watershed.par"
+    input_file.write_text("BEGIN GLOBAL\nEND GLOBAL\n")
+    simulation_directories = []
+    for discretization in ["discretization_1", "discretization_2"]:
+        simulation_directory = tmp_path / "modeling_files" / discretization / "simulations" / "storm"
+        simulation_directory.mkdir(parents=True)
+        store_directory = code_write_k2_simulation.get_staging_store_directory(str(simulation_directory))
+        code_write_k2_simulation.stage_file(str(input_file), str(simulation_directory), store_directory)
+        simulation_directories.append(str(simulation_directory))
+    assert store_directory == str(tmp_path / "modeling_files" / "staged_files")
+    assert os.path.islink(os.path.join(simulation_directories[1], "watershed.par"))
+
+    code_write_k2_simulation.delete_simulation_directories(simulation_directories[0])
+
+    assert len(os.listdir(store_directory)) == 1
+
+    code_write_k2_simulation.delete_simulation_directories(simulation_directories[1])
+
+    assert os.listdir(store_directory) == []
+
+
+@pytest.mark.skipif(os.name == "nt", reason="execute permissions are not kept on Windows")
+def test_stage_file_keeps_execute_permission(tmp_path):
+    k2_executable = tmp_path / "models" / "k2.exe"
+    k2_executable.parent.mkdir()
+    k2_executable.write_text("#!/bin/sh\n")
+    k2_executable.chmod(0o755)
+    simulation_directory = tmp_path / "modeling_files" / "discretization" / "simulations" / "storm"
+    simulation_directory.mkdir(parents=True)
+    store_directory = code_write_k2_simulation.get_staging_store_directory(str(simulation_directory))
+
+    code_write_k2_simulation.stage_file(str(k2_executable), str(simulation_directory), store_directory)
+
+    staged_file = os.path.join(simulation_directory, "k2.exe")
+    assert is_read_only(staged_file)
+    assert os.access(staged_file, os.X_OK)
+
+
+PRECIPITATION_FILE = ("BEGIN RG1\n"
+                      "  X = 0, Y = 0\n"
+                      "  SAT = 0.2\n"
+                      "  N = 2\n"
+                      "  TIME        DEPTH\n"
+                      "! (min)        (mm)\n"
+                      "  0.00         0.00\n"
+                      "  {duration:.2f}        {depth:.2f}\n"
+                      "END\n")
+
+
+@pytest.fixture
+def simulation_inputs(tmp_path, monkeypatch):
+    """Two parameter files, three storms of 60, 120, and 30 minutes, and a K2 executable, with the metaSimulation
+    table replaced by a list of the inserted rows."""
+
+    arcpy = code_write_k2_simulation.arcpy
+    modeling_files_directory = tmp_path / "modeling_files" / "s1"
+    parameter_files, precipitation_files = [], []
+    for name in ["p1", "p2"]:
+        parameter_file = modeling_files_directory / "parameter_files" / f"{name}.par"
+        parameter_file.parent.mkdir(parents=True, exist_ok=True)
+        parameter_file.write_text(f"! {name}\nBEGIN GLOBAL\nEND GLOBAL\n")
+        parameter_files.append(str(parameter_file))
+    for name, duration in [("short", 60), ("long", 120), ("shortest", 30)]:
+        precipitation_file = modeling_files_directory / "precipitation_files" / f"{name}.pre"
+        precipitation_file.parent.mkdir(parents=True, exist_ok=True)
+        precipitation_file.write_text(PRECIPITATION_FILE.format(duration=duration, depth=duration / 10))
+        precipitation_files.append(str(precipitation_file))
+    models_directory = tmp_path / "models"
+    models_directory.mkdir()
+    (models_directory / "k2.exe").write_text("k2")
+
+    rows = []
+
+    class InsertCursor:
+        def __init__(self, table, fields):
+            assert fields == code_write_k2_simulation.META_SIMULATION_FIELDS
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def insertRow(self, row):
+            rows.append(dict(zip(code_write_k2_simulation.META_SIMULATION_FIELDS, row)))
+
+    monkeypatch.setattr(code_write_k2_simulation.config, "SIMULATION_STAGING", "Copy")
+    monkeypatch.setattr(arcpy, "Exists", lambda path: True)
+    monkeypatch.setattr(arcpy.da, "TableToNumPyArray", lambda table, fields: np.zeros(
+        0, dtype=[(field, "U100") for field in fields]))
+    monkeypatch.setattr(arcpy.da, "InsertCursor", InsertCursor)
+
+    return str(tmp_path / "delineation.gdb"), parameter_files, precipitation_files, str(models_directory), rows
+
+
+def read_runfile(simulation_directory):
+    with open(os.path.join(simulation_directory, "kin.fil")) as f:
+        return f.read().split("\n")
+
+
+def runfile_line(parameter_file, precipitation_file, duration):
+    par_name, precip_name = os.path.basename(parameter_file), os.path.basename(precipitation_file)
+    return (f"{par_name},{precip_name},{par_name[:-4]}_{precip_name[:-4]}.out,design storms,{duration},1,"
+            f"Y,Y,N,Y")
+
+
+def test_write_simulation(simulation_inputs):
+    workspace, parameter_files, precipitation_files, models_directory, rows = simulation_inputs
+
+    simulation_directory = code_write_k2_simulation.write_simulation(
+        "project.gdb", workspace, "d1", "s1", parameter_files, precipitation_files, "storms", "design storms", None,
+        1, models_directory)
+
+    assert simulation_directory == os.path.join(os.path.dirname(workspace), "modeling_files", "s1", "simulations",
+                                                "storms")
+    # one line per combination, each lasting its storm plus 300 minutes
+    durations = [360, 420, 330]
+    runs = [(parameter_file, precipitation_file, duration) for parameter_file in parameter_files
+            for precipitation_file, duration in zip(precipitation_files, durations)]
+    assert read_runfile(simulation_directory) == [runfile_line(*run) for run in runs]
+    assert sorted(os.listdir(simulation_directory)) == sorted(
+        ["channels", "hillslopes", "k2.exe", "kin.fil", "p1.par", "p2.par", "long.pre", "short.pre",
+         "shortest.pre"])
+    # one metaSimulation row per run
+    assert [(row["ParameterizationFilePath"], row["PrecipitationFileName"], row["SimulationDuration"])
+            for row in rows] == runs
+    assert {(row["SimulationName"], row["SimulationPath"], row["SimulationTimeStep"]) for row in rows} == \
+           {("storms", simulation_directory, 1)}
+
+    # the runs write the same .SIM files, so their hydrographs are not packed or plotted
+    with pytest.raises(Exception, match="has 6 runs in its kin.fil"):
+        code_hydrograph_store.list_sim_files(simulation_directory)
+
+
+def test_write_simulation_with_duration(simulation_inputs):
+    workspace, parameter_files, precipitation_files, models_directory, rows = simulation_inputs
+
+    simulation_directory = code_write_k2_simulation.write_simulation(
+        "project.gdb", workspace, "d1", "s1", parameter_files[0], precipitation_files[1], "long_storm",
+        "design storms", 500, 1, models_directory)
+
+    assert read_runfile(simulation_directory) == [runfile_line(parameter_files[0], precipitation_files[1], 500)]
+    assert [row["SimulationDuration"] for row in rows] == [500]
+    assert code_hydrograph_store.list_sim_files(simulation_directory) == []
+
+
+def test_write_simulation_batches(simulation_inputs, monkeypatch):
+    workspace, parameter_files, precipitation_files, models_directory, rows = simulation_inputs
+    runs = [(parameter_file, precipitation_file) for parameter_file in parameter_files
+            for precipitation_file in precipitation_files]
+    durations = {precipitation_file: duration for precipitation_file, duration in zip(precipitation_files,
+                                                                                       [360, 420, 330])}
+
+    simulation_directories = code_write_k2_simulation.write_simulation_batches(
+        "project.gdb", workspace, "d1", "s1", parameter_files, precipitation_files, "storms", "design storms", None,
+        1, models_directory, batch_count=4)
+
+    simulations_directory = os.path.join(os.path.dirname(workspace), "modeling_files", "s1", "simulations")
+    assert simulation_directories == [os.path.join(simulations_directory, f"storms_{batch}")
+                                      for batch in range(1, 5)]
+    # the runs are dealt to the batches in turn, and each batch only holds its own input files
+    for batch, simulation_directory in enumerate(simulation_directories):
+        batch_runs = runs[batch::4]
+        assert read_runfile(simulation_directory) == [
+            runfile_line(parameter_file, precipitation_file, durations[precipitation_file])
+            for parameter_file, precipitation_file in batch_runs]
+        input_files = {os.path.basename(path) for run in batch_runs for path in run}
+        assert set(os.listdir(simulation_directory)) == input_files | {"channels", "hillslopes", "k2.exe", "kin.fil"}
+    assert [(row["SimulationName"], row["ParameterizationFilePath"], row["PrecipitationFileName"],
+             row["SimulationDuration"]) for row in rows] == [
+        (f"storms_{batch + 1}", parameter_file, precipitation_file, durations[precipitation_file])
+        for batch in range(4) for parameter_file, precipitation_file in runs[batch::4]]
+
+    # by default there is one batch per worker process, and never more batches than runs
+    monkeypatch.setattr(code_write_k2_simulation.code_process_pool, "get_worker_count", lambda count: 8)
+    simulation_directories = code_write_k2_simulation.write_simulation_batches(
+        "project.gdb", workspace, "d1", "s1", parameter_files, precipitation_files, "more_storms", "design storms",
+        None, 1, models_directory)
+    assert len(simulation_directories) == 6
+    assert all(len(read_runfile(simulation_directory)) == 1 for simulation_directory in simulation_directories)